@@ -0,0 +1,187 @@
+"""
+Benchmarks for the utilization reports against a synthetic fleet on the SQLite backend.
+
+    python -m benchmarks.bench --tails 71 710 --years 5 14
+    python -m benchmarks.bench --save-baseline
+    python -m benchmarks.bench --baseline benchmarks/baseline.json --tolerance 0.25
+
+Every case is timed (best of --repeat) and then run once more under tracemalloc for the peak memory.  Results are
+written as JSON, and any case slower or larger than the baseline by more than --tolerance is flagged.  The exit code
+is 1 when there are regressions, or with --check when there is no baseline to compare to.  benchmarks/baseline.json
+holds the 71 tail, 14 year cases timed on the synthetic fleet (the 710 tail cases, which need more than 6 GB of
+memory, are not in it and are not compared): its peak memory carries over to other machines, its times only to
+comparable hardware.
+"""
+__author__ = "evfairchild"
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+import pandas as pd
+from reports.airframe import Airframe
+from reports.engine import Engine
+from reports.export import export
+from reports.backend import SQLiteBackend
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+END_DATE = '2020-03-31'
+START_DATE, PERIOD_END = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+
+
+def cases(frames):
+    """
+    :param frames: report dataframes by sheet name, filled in by run() before the export case
+    :return: dictionary of case name and function(session) -> result
+    """
+    out = tempfile.mkdtemp()
+
+    def airframe_run(session):
+        return Airframe(START_DATE, PERIOD_END, session=session).run()
+
+    def engine_run(session):
+        return Engine(START_DATE, PERIOD_END, session=session).run()
+
+    def engine_run_chunked(session):
+        session.chunksize = 50000
+        return Engine(START_DATE, PERIOD_END, session=session).run()
+
+    def engine_get_removals(session):
+        return Engine(START_DATE, PERIOD_END, session=session).get_removals()
+
+    def airframe_get_fh_fc(session):
+        airframe = Airframe(START_DATE, PERIOD_END, session=session)
+        return airframe.get_fh_fc(airframe.tails, asof='2020-03-31')
+
+    def export_xlsx(session):
+        return export(frames, os.path.join(out, 'utilization.xlsx'))
+
+    def export_parquet(session):
+        return export(frames, os.path.join(out, 'utilization.parquet'))
+
+    def export_csv(session):
+        return export(frames, os.path.join(out, 'utilization.csv'))
+
+    return {'airframe.run': airframe_run,
+            'engine.run': engine_run,
+            'engine.run.chunked': engine_run_chunked,
+            'engine.get_removals': engine_get_removals,
+            'airframe.get_fh_fc': airframe_get_fh_fc,
+            'export.xlsx': export_xlsx,
+            'export.parquet': export_parquet,
+            'export.csv': export_csv}
+
+
+def measure(func, backend, repeat):
+    """
+    :return: best wall time (seconds) of 'repeat' runs, the peak traced memory (bytes) of one more run and the result
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        for _ in range(repeat):
+            # A new session every run, otherwise the memoized metadata hides the work being measured
+            session = Session(backend=backend)
+            start = time.perf_counter()
+            func(session)
+            times.append(time.perf_counter() - start)
+            session.close()
+
+        session = Session(backend=backend)
+        tracemalloc.start()
+        result = func(session)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        session.close()
+
+    return min(times), peak, result
+
+
+def run(tails, years, repeat):
+    results = []
+    for n_tails in tails:
+        for n_years in years:
+            start = (pd.Timestamp(END_DATE) - pd.DateOffset(years=n_years)).strftime('%Y-%m-%d')
+            fleet = generate_fleet(n_tails=n_tails, start_date=start, end_date=END_DATE)
+            backend = SQLiteBackend().load(fleet)
+            flights = len(fleet['AC_ACTUAL_FLIGHTS']) + len(fleet['AC_ACTUAL_FLIGHTS_HD'])
+
+            frames = {}
+            for name, func in cases(frames).items():
+                seconds, peak, result = measure(func, backend, repeat)
+                sheet = {'airframe.run': 'airframe', 'engine.run': 'engines', 'engine.get_removals': 'removals'}
+                if name in sheet:
+                    frames[sheet[name]] = result
+                results.append({'case': name, 'tails': n_tails, 'years': n_years, 'flights': flights,
+                                'seconds': round(seconds, 4), 'peak_bytes': int(peak)})
+                print("{:<22} tails={:<6} years={:<3} {:>9.3f}s {:>10.1f}MB".format(
+                    name, n_tails, n_years, seconds, peak / 2 ** 20))
+            backend.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of regression descriptions, cases missing from the baseline are skipped
+    """
+    base = {(r['case'], r['tails'], r['years']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = base.get((r['case'], r['tails'], r['years']))
+        if b is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if b[metric] and r[metric] > b[metric] * (1 + tolerance):
+                regressions.append("{} tails={} years={}: {} {} -> {} (+{:.0%})".format(
+                    r['case'], r['tails'], r['years'], metric, b[metric], r[metric], r[metric] / b[metric] - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the utilization reports on a synthetic fleet.")
+    parser.add_argument('--tails', type=int, nargs='+', default=[71, 710], help="fleet sizes")
+    parser.add_argument('--years', type=int, nargs='+', default=[14], help="years of flight history")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case, the best is reported")
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results',
+                                                         datetime.now().strftime('%Y%m%d_%H%M%S') + '.json'))
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown/growth vs the baseline")
+    parser.add_argument('--check', action='store_true', help="fail when there is no baseline to compare to")
+    args = parser.parse_args(argv)
+
+    report = {'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              'python': platform.python_version(), 'pandas': pd.__version__, 'machine': platform.node(),
+              'results': run(args.tails, args.years, args.repeat)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to {}".format(args.output))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Baseline saved to {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save-baseline to create one.".format(args.baseline))
+        return 1 if args.check else 0
+
+    with open(args.baseline) as f:
+        regressions = compare(report['results'], json.load(f), args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
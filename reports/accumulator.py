@@ -0,0 +1,54 @@
+__author__ = "evfairchild"
+
+import numpy as np
+import pandas as pd
+from reports.schema import to_display
+
+
+class RunningTotals(object):
+    """
+    Folds chunks of records into running sums by key, ex. flight hours and cycles by (AC, YYYY-MM).  Only the totals
+    are kept between chunks, so memory is bounded by the number of keys rather than the number of records.
+        totals = RunningTotals(['AC', 'YYYY-MM'])
+        for chunk in session.read_sql_chunks(query, chunksize=50000):
+            totals.add(chunk)
+        df = totals.frame()
+    """
+    def __init__(self, keys, values=('FLIGHT_HOURS', 'FLIGHT_CYCLES')):
+        """
+        :param keys: list of key columns
+        :param values: columns to sum
+        """
+        self.keys = list(keys)
+        self.values = list(values)
+        self.totals = None
+        self.rows = 0
+
+    def add(self, chunk):
+        """
+        :param chunk: dataframe with the key and value columns
+        :return: self
+        """
+        self.rows += len(chunk)
+        if chunk.empty:
+            return self
+
+        values = chunk[self.values].apply(pd.to_numeric)
+        partial = values.groupby([chunk[key] for key in self.keys], sort=False, observed=True).sum()
+        # Each chunk has its own categories, the totals are keyed by the plain values
+        partial = to_display(partial.reset_index()).set_index(self.keys)[self.values]
+        if self.totals is None:
+            self.totals = partial
+        else:
+            # Keys missing on one side are filled with 0, keep integer cycles integer
+            dtypes = {col: np.result_type(self.totals[col].dtype, partial[col].dtype) for col in self.values}
+            self.totals = self.totals.add(partial, fill_value=0).astype(dtypes)
+        return self
+
+    def frame(self):
+        """
+        :return: dataframe with the key columns and the summed value columns, sorted by key
+        """
+        if self.totals is None:
+            return pd.DataFrame(columns=self.keys + self.values)
+        return self.totals.sort_index().reset_index()
@@ -2,47 +2,131 @@ __author__ = "evfairchild"
 
 import pandas as pd
 import numpy as np
-import pyodbc
 from datetime import datetime
-from tqdm import tqdm
-from colorama import Fore
+from collections import OrderedDict
+from reports.session import Session
+from reports import schema
+from reports.flightsource import FlightSource
+from reports.forecast import UtilizationForecast
+from reports.timeindex import UtilizationIndex
+from reports.timeseries import UtilizationSeries
 
 
 class Airframe(object):
-    def __init__(self, start_date='2005-12-01 00:00:00', end_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S")):
+    def __init__(self, start_date='2005-12-01 00:00:00', end_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 cache=None, session=None, archived=False):
+        """
+        :param archived: also report the tails whose flights are all in the archive table AC_ACTUAL_FLIGHTS_HD (retired)
+        """
         self.startDate = start_date
         self.endDate = end_date
         self.year = start_date[0:4]
         self.month = start_date[5:7]
         self.yyyymm = self.year + "-" + self.month
         self.now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.archived = archived
+
+        # Report objects built on the same reports.session.Session share its connections, tails and history
+        self.session = session if session is not None else Session(cache=cache)
+
+        # Optional reports.cache.FlightCache, flight and transaction records are read locally once it is synced
+        self.cache = cache if cache is not None else self.session.cache
+        if self.cache is not None:
+            self.cache.sync(self.session)
 
-        self.trax = pyodbc.connect('DSN=Trax Reporting;pwd={}')
-        self.tails = self.get_tails()
+    @property
+    def trax(self):
+        return self.session.connection
+
+    def read_sql(self, query, **kwargs):
+        return self.session.read_sql(query, self.trax, **kwargs)
+
+    @property
+    def tails(self):
+        return self.get_tails()
 
     def get_fh_fc_history(self):
         """
         This method returns a pivot table with the entire fleet history by YYY-MM.
         It requires TRAX access via ODBC.   Email evan.fairchild@alaskaair.com for help with access & setup.
-        SUPER FAST and easy!
+        The reports themselves only need month_totals() of get_fh_fc_by_month(), the pivot is built when asked for.
 
         :return: pivot table indexed by AC registration and grouped by YYY-MM.  Included aggregate row and column.
         """
-        query = "SELECT odb.AC_ACTUAL_FLIGHTS.AC AS AC, " \
-                "(to_char(odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE, 'YYYY-MM')) AS BLAH, " \
-                "SUM( ROUND( odb.AC_ACTUAL_FLIGHTS.FLIGHT_HOURS + " \
-                "( odb.AC_ACTUAL_FLIGHTS.FLIGHT_MINUTES / 60 ), 5 ) ) AS FLIGHT_HOURS, " \
-                "SUM ( odb.AC_ACTUAL_FLIGHTS.CYCLES ) AS FLIGHT_CYCLES " \
-                "FROM odb.AC_ACTUAL_FLIGHTS " \
-                "WHERE ( ( odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE + " \
-                    "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_HOUR, 0) / 24 ) + " \
-                    "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_MINUTE, 0) / 1440 )) <= to_date('{}', 'YYYY-MM-DD HH24-MI-SS')) " \
-                "GROUP BY to_char(odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE, 'YYYY-MM'), AC " \
-                "ORDER BY AC".format(self.endDate)
-
-        df = pd.read_sql(query, self.trax)
-        df.rename(columns={'BLAH': 'YYYY-MM'}, inplace=True)
-        return pd.pivot_table(df, index=['AC'], columns=['YYYY-MM'], fill_value=0, aggfunc=np.sum, margins=True)
+        return self.session.memo(('fh_fc_history', self.endDate, self.cache is not None),
+                                 lambda: self._pivot_history(self.get_fh_fc_by_month()))
+
+    def get_fh_fc_by_month(self):
+        """
+        The fleet history as one row per tail and month with flights (the long form of get_fh_fc_history()).
+        :return: dataframe with AC, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES
+        """
+        return self.session.memo(('fh_fc_by_month', self.endDate, self.archived, self.cache is not None),
+                                 self._get_fh_fc_by_month)
+
+    def _get_fh_fc_by_month(self):
+        with self.session.profile('airframe.aggregate', source='cache' if self.cache is not None else 'db') as span:
+            df = self.flight_source.totals(['AC', 'YYYY-MM'], end=self.endDate)
+            if not self.archived:
+                df = df.loc[df['AC'].isin(self.flight_source.tails(archived=False))].reset_index(drop=True)
+                if hasattr(df['AC'], 'cat'):
+                    df['AC'] = df['AC'].cat.remove_unused_categories()
+            return span.record(df)
+
+    def _pivot_history(self, df):
+        """
+        :param df: dataframe with AC, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES
+        :return: get_fh_fc_history() pivot
+        """
+        with self.session.profile('airframe.pivot') as span:
+            # pivot_table(margins=True) reorders rows and columns of categorical keys, pivot the plain values
+            return span.record(pd.pivot_table(schema.to_display(df), index=['AC'], columns=['YYYY-MM'], fill_value=0,
+                                              aggfunc=np.sum, margins=True))
+
+    def month_totals(self, df, index, period=None):
+        """
+        The month's and the lifetime totals of each key, laid out like filter_to_yyyy_mm() of a margins pivot but
+        computed with two groupbys, without the key x month pivot of the whole history.
+        :param df: dataframe with 'index', YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES, ex. get_fh_fc_by_month()
+        :param index: key column, AC or ESN
+        :param period: YYYY-MM to lay out like filter_to_period() instead, with totals cumulative as of that month and
+                       rows without flights by then dropped.  None for the month of start_date.
+        :return: dataframe with the month and total flight hours and cycles for each key and an 'All' row
+        """
+        values = ['FLIGHT_HOURS', 'FLIGHT_CYCLES']
+        df = schema.to_display(df[[index, 'YYYY-MM'] + values])
+        if period is not None:
+            df = df.loc[df['YYYY-MM'] <= period]
+
+        total = df.groupby(index, sort=True)[values].sum()
+        rows = df.loc[df['YYYY-MM'] == (period or self.yyyymm)]
+        # Like the pivot, a month without any records has no month columns
+        month = rows.groupby(index, sort=True)[values].sum() if len(rows) else None
+        sheet = self._layout(month, total, period or self.yyyymm)
+
+        if period is not None:
+            sheet = sheet.loc[(sheet[('FLIGHT_HOURS', 'All')] != 0) | (sheet[('FLIGHT_CYCLES', 'All')] != 0)]
+        return sheet
+
+    @staticmethod
+    def _layout(month, total, period):
+        """
+        :param month: dataframe indexed by key with FLIGHT_HOURS and FLIGHT_CYCLES of the month, or None
+        :param total: same with the totals, its index and dtypes are used for the result
+        :param period: YYYY-MM of the month columns
+        :return: dataframe with columns (value, period) and (value, 'All') and an 'All' row, like filter_to_yyyy_mm()
+        """
+        columns = OrderedDict()
+        for value in ('FLIGHT_HOURS', 'FLIGHT_CYCLES'):
+            if month is not None:
+                columns[(value, period)] = month[value].reindex(total.index, fill_value=0).astype(total[value].dtype)
+            columns[(value, 'All')] = total[value]
+
+        df = pd.DataFrame(columns, index=total.index)
+        df.columns = pd.MultiIndex.from_tuples(df.columns, names=[None, 'YYYY-MM'])
+        dtypes = df.dtypes
+        df.loc['All'] = df.sum()
+        return df.astype(dtypes)
 
     def filter_to_yyyy_mm(self, pivot):
         """
@@ -53,17 +137,92 @@ class Airframe(object):
         return pivot.filter([('FLIGHT_HOURS', self.yyyymm), ('FLIGHT_HOURS', 'All'),
                              ('FLIGHT_CYCLES', self.yyyymm), ('FLIGHT_CYCLES', 'All')])
 
+    def filter_to_period(self, pivot, period):
+        """
+        Like filter_to_yyyy_mm() for any month of a history pivot, with the 'All' totals cumulative as of the end of
+        that month.  Rows without any flight hours or cycles by then are dropped.
+        :param pivot: pivot table with columns YYYY-MM and margins (rows and columns 'All')
+        :param period: YYYY-MM
+        :return: dataframe with the month and cumulative totals for flight hours and flight cycles
+        """
+        columns = {}
+        for value in ('FLIGHT_HOURS', 'FLIGHT_CYCLES'):
+            months = [col for col in pivot[value].columns if col != 'All' and col <= period]
+            if period in months:
+                columns[(value, period)] = pivot[(value, period)]
+            columns[(value, 'All')] = pivot[value][months].sum(axis=1)
+
+        df = pd.DataFrame(columns, index=pivot.index)
+        df.columns = pd.MultiIndex.from_tuples(df.columns, names=pivot.columns.names)
+        return df.loc[(df[('FLIGHT_HOURS', 'All')] != 0) | (df[('FLIGHT_CYCLES', 'All')] != 0)]
+
+    def run_periods(self, periods):
+        """
+        Airframe report for several months from a single history load, see reports.batch.
+        :param periods: list of YYYY-MM, none after the month of end_date
+        :return: dictionary of YYYY-MM and dataframe laid out like run()
+        """
+        df = self.get_fh_fc_by_month()
+        return OrderedDict((period, self.month_totals(df, 'AC', period)) for period in periods)
+
+    def get_fh_fc_month(self):
+        """
+        Flight hours and cycles of each tail between start_date and end_date only, ex. the month being closed.
+        :return: dataframe indexed by AC with FLIGHT_HOURS and FLIGHT_CYCLES
+        """
+        df = self.flight_source.totals(['AC'], start=self.startDate, end=self.endDate)
+        return df.set_index('AC')
+
+    def month_sheet(self, month, previous):
+        """
+        Lays out a month's totals like run(), with the 'All' totals carried forward from the previous month's close
+        instead of summed over the whole history.  See reports.monthclose.
+        :param month: dataframe indexed by AC (or ESN) with FLIGHT_HOURS and FLIGHT_CYCLES of the month
+        :param previous: same, cumulative as of the end of the previous month
+        :return: dataframe with the month and cumulative totals for flight hours and flight cycles and an 'All' row
+        """
+        index = previous.index.union(month.index)
+        month = month.reindex(index, fill_value=0)
+        total = (previous.reindex(index, fill_value=0) + month).astype({'FLIGHT_HOURS': np.float64,
+                                                                        'FLIGHT_CYCLES': np.int64})
+        total.index.name = previous.index.name or month.index.name
+        return self._layout(month, total, self.yyyymm)
+
+    def run_incremental(self, previous):
+        """
+        run() for a month from the previous month's closing totals and this month's flights, see reports.monthclose.
+        :param previous: dataframe indexed by AC with FLIGHT_HOURS and FLIGHT_CYCLES as of the end of the previous month
+        :return: dataframe laid out like run()
+        """
+        return self.month_sheet(self.get_fh_fc_month(), previous)
+
+    @property
+    def flight_source(self):
+        """
+        AC_ACTUAL_FLIGHTS and the archive table AC_ACTUAL_FLIGHTS_HD as one source, see reports.flightsource
+        """
+        return FlightSource(self.session, self.cache)
+
     def get_tails(self):
-        query = "SELECT odb.AC_MASTER.AC FROM odb.AC_MASTER " \
-                # "UNION " \
-                # "SELECT odb.AC_MASTER_HD.AC FROM odb.AC_MASTER_HD"
-        return list(pd.read_sql(query, self.trax, index_col='AC').index)
+        """
+        :return: list of the tails in AC_MASTER (all aircraft on the Ops Spec), followed with archived=True by the tails
+                 only found in the flight tables (retired)
+        """
+        def tails():
+            query = "SELECT odb.AC_MASTER.AC FROM odb.AC_MASTER"
+            return list(self.read_sql(query, index_col='AC').index)
+        master = self.session.memo('tails', tails)
+        if not self.archived:
+            return master
+        known = set(master)
+        return master + [ac for ac in self.flight_source.tails() if ac not in known]
 
     def get_fh_fc(self, acs, asof='now'):
         acs = ([acs] if type(acs) != list else acs)
 
         if asof == 'now':
-            asof = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # Every flight so far, without a bound that changes the query on every call
+            asof = None
         elif len(asof) <= 10:
             asof += " 23:59:59"
 
@@ -71,21 +230,70 @@ class Airframe(object):
             if ac.upper() not in self.tails:
                 raise LookupError("AC registration {} invalid.".format(ac.upper()))
 
-        query = "SELECT AC, SUM( ROUND( odb.AC_ACTUAL_FLIGHTS.FLIGHT_HOURS + " \
-                "( odb.AC_ACTUAL_FLIGHTS.FLIGHT_MINUTES / 60 ), 5 ) ) AS FLIGHT_HOURS, " \
-                "SUM ( odb.AC_ACTUAL_FLIGHTS.CYCLES ) AS FLIGHT_CYCLES " \
-                "FROM odb.AC_ACTUAL_FLIGHTS " \
-                "WHERE AC IN ({}) " \
-                "AND ( FLIGHT_DATE <= to_date('{}', 'YYYY-MM-DD HH24-MI-SS')) " \
-                "GROUP BY AC".format(','.join("'%s'" % ac.upper() for ac in acs), asof)
+        return self.flight_source.totals(['AC'], acs, asof=asof).set_index('AC')
 
-        # query_hd = query.replace('AC_ACTUAL_FLIGHTS', 'AC_ACTUAL_FLIGHTS_HD')
-        #
-        # query += " UNION " + query_hd
+    def get_flights(self, acs=None, start=None, end=None):
+        """
+        This method returns the individual flight records (one row per flight) for the requested aircraft, from
+        AC_ACTUAL_FLIGHTS and the archive table AC_ACTUAL_FLIGHTS_HD (see reports.flightsource).
+        Used where hours and cycles have to be attributed to something other than the tail, e.g. installed ESNs.
+        :param acs: aircraft registration or list of registrations.  None returns the entire fleet.
+        :param start: first takeoff time included, ex. 2020-03-01 00:00:00.  Used with end, None for every flight.
+        :param end: last takeoff time included, ex. 2020-03-31 23:59:59
+        :return: dataframe with AC, FLIGHT_DATETIME, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES sorted by AC and time.
+                 AC and YYYY-MM are categoricals and FLIGHT_CYCLES a small integer, see reports.schema
+        """
+        if acs is not None:
+            acs = ([acs] if type(acs) != list else acs)
+        return self.flight_source.flights(acs, start, end)
+
+    def iter_flights(self, acs=None, chunksize=None, start=None, end=None):
+        """
+        get_flights() one chunk at a time, in no particular order.
+        :param acs: aircraft registration or list of registrations.  None returns the entire fleet.
+        :param chunksize: rows per chunk, defaults to the session's chunksize
+        :param start: first takeoff time included, None for every flight until end
+        :param end: last takeoff time included, None for every flight
+        :return: generator of dataframes with the columns of get_flights()
+        """
+        if acs is not None:
+            acs = ([acs] if type(acs) != list else acs)
+        return self.flight_source.iter_flights(acs, chunksize, start, end)
+
+    def get_index(self):
+        """
+        Prefix-sum index of the fleet's flights for repeated as-of or interval lookups without new queries.
+        ex. self.get_index().batch(['N521VA', 'N522VA'], ['2019-12-31', '2020-03-31'])
+        :return: reports.timeindex.UtilizationIndex keyed by AC (memoized per session)
+        """
+        return self.session.memo(('ac_index', self.cache is not None),
+                                 lambda: UtilizationIndex(self.get_flights(), key='AC'))
 
-        df = pd.read_sql(query, self.trax, index_col='AC')
+    def get_series(self):
+        """
+        Daily cumulative flight hours and cycles of every tail up to end_date, with weekly, monthly, quarterly and
+        yearly rollups.  ex. self.get_series().cumulative('quarterly', ['N521VA'])
+        :return: reports.timeseries.UtilizationSeries keyed by AC (memoized per session)
+        """
+        def build():
+            with self.session.profile('airframe.series') as span:
+                series = UtilizationSeries(self.get_flights(end=self.endDate), key='AC', end=self.endDate)
+                span.record(series.daily)
+                return series
+        return self.session.memo(('ac_series', self.endDate, self.cache is not None), build)
 
-        return df
+    def get_forecast(self, window=12):
+        """
+        Utilization rate of every tail over the last 'window' months up to end_date, and the date each reaches a
+        flight hour or cycle threshold.  ex. self.get_forecast().crossing('FC', 30000)
+        :return: reports.forecast.UtilizationForecast keyed by AC (memoized per session)
+        """
+        def build():
+            with self.session.profile('airframe.forecast', window=window) as span:
+                forecast = UtilizationForecast(self.get_series(), window=window)
+                span.record(forecast.get_rates())
+                return forecast
+        return self.session.memo(('ac_forecast', self.endDate, window, self.cache is not None), build)
 
     def get_fh(self, ac, asof='now'):
         return self.get_fh_fc(ac, asof=asof)['FLIGHT_HOURS']
@@ -94,15 +302,14 @@ class Airframe(object):
         return self.get_fh_fc(ac, asof=asof)['FLIGHT_CYCLES']
 
     def run(self):
+        """
+        Stages are timed by the session's profiler, if any (see reports.profiler).
+        :return: dataframe with flight hours and cycles for each AC, filtered to YYYY-MM with totals
+        """
         print("Collecting Airframe Data...")
-        pbar = tqdm(total=100)
-        pbar.bar_format = "{l_bar}%s{bar}%s{r_bar}" % (Fore.GREEN, Fore.RESET)
-
-        pbar.update(33)
-        df = self.get_fh_fc_history()
-        pbar.update(33)
-        df = self.filter_to_yyyy_mm(df)
-        pbar.update(34)
-        pbar.close()
-        return df
+        with self.session.profile('airframe.run') as span:
+            df = self.get_fh_fc_by_month()
+            with self.session.profile('airframe.totals'):
+                df = self.month_totals(df, 'AC')
+            return span.record(df)
 
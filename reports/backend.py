@@ -0,0 +1,282 @@
+__author__ = "evfairchild"
+
+import re
+import math
+import sqlite3
+import itertools
+import pandas as pd
+from functools import lru_cache
+from datetime import datetime, timedelta
+from reports.query import Query, TO_DATE
+
+
+class Backend(object):
+    """
+    Data source for the report classes.  A backend opens DB-API connections and reads queries into dataframes, the
+    reports' SQL is written for TRAX (Oracle).  It also exposes the three datasets the reports are built on:
+    flights (AC_ACTUAL_FLIGHTS), flights_hd (AC_ACTUAL_FLIGHTS_HD) and transactions (engine records from
+    AC_PN_TRANSACTION_HISTORY).
+    """
+    # dataset: (table, date column, columns, filter)
+    DATASETS = {'flights': ('AC_ACTUAL_FLIGHTS', 'FLIGHT_DATE',
+                            ['AC', 'FLIGHT_DATE', 'TO_HOUR', 'TO_MINUTE', 'FLIGHT_HOURS', 'FLIGHT_MINUTES', 'CYCLES'],
+                            None),
+                'flights_hd': ('AC_ACTUAL_FLIGHTS_HD', 'FLIGHT_DATE',
+                               ['AC', 'FLIGHT_DATE', 'TO_HOUR', 'TO_MINUTE', 'FLIGHT_HOURS', 'FLIGHT_MINUTES',
+                                'CYCLES'],
+                               None),
+                # Only engine transactions are used: CFM56-5B and LEAP-1A
+                'transactions': ('AC_PN_TRANSACTION_HISTORY', 'TRANSACTION_DATE',
+                                 ['SN', 'PN', 'TRANSACTION_TYPE', 'AC', 'TRANSACTION_DATE', 'TRANSACTION_HOUR',
+                                  'TRANSACTION_MINUTE', 'SCHEDULE_CATEGORY', 'POSITION', 'HOURS_INSTALLED',
+                                  'MINUTES_INSTALLED', 'CYCLES_INSTALLED', 'REMOVAL_REASON'],
+                                 "( PN LIKE '1887M10G%' OR PN LIKE '2489M10G%' )")}
+
+    def connect(self):
+        raise NotImplementedError
+
+    def read_sql(self, query, con, params=None, index_col=None):
+        """
+        Runs the query on a cursor of its own, so that it can be cancelled from another thread (Session.interrupt()).
+        :param query: SQL string
+        :param con: connection from connect()
+        :param params: query parameters
+        :param index_col: column(s) to index the dataframe by
+        :return: dataframe
+        """
+        cursor = self.execute(con, query, params)
+        try:
+            df = self.to_frame(cursor, cursor.fetchall())
+        finally:
+            cursor.close()
+        return self.convert(df.set_index(index_col) if index_col is not None else df)
+
+    def read_sql_chunks(self, query, con, chunksize, params=None):
+        """
+        Streams a result set, the driver fetches 'chunksize' rows at a time.
+        :param query: SQL string
+        :param con: connection from connect()
+        :param chunksize: rows per dataframe
+        :param params: query parameters
+        :return: generator of dataframes, a single empty one if the query returned no rows
+        """
+        cursor = self.execute(con, query, params)
+        try:
+            rows = cursor.fetchmany(chunksize)
+            yield self.convert(self.to_frame(cursor, rows))
+            while len(rows) == chunksize:
+                rows = cursor.fetchmany(chunksize)
+                if rows:
+                    yield self.convert(self.to_frame(cursor, rows))
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def execute(con, query, params=None):
+        """
+        :return: cursor of 'con' the query was executed on
+        """
+        cursor = con.cursor()
+        try:
+            if params:
+                cursor.execute(query, list(params))
+            else:
+                cursor.execute(query)
+        except Exception:
+            cursor.close()
+            raise
+        return cursor
+
+    @staticmethod
+    def to_frame(cursor, rows):
+        """
+        :return: dataframe of the rows fetched from 'cursor', like pd.read_sql
+        """
+        return pd.DataFrame.from_records(list(rows), columns=[column[0] for column in cursor.description],
+                                         coerce_float=True)
+
+    def convert(self, df):
+        """
+        :param df: dataframe as read by pd.read_sql
+        :return: dataframe with the column types the reports expect
+        """
+        return df
+
+    def read_dataset(self, con, dataset, since=None):
+        """
+        :param con: connection from connect()
+        :param dataset: flights, flights_hd or transactions
+        :param since: only return rows with FLIGHT_DATE / TRANSACTION_DATE on or after this time (YYYY-MM-DD HH:MM:SS)
+        :return: dataframe with the raw table columns
+        """
+        table, date_col, columns, where = self.DATASETS[dataset]
+        query = Query(table, columns)
+        if where:
+            query.where(where)
+        if since is not None:
+            query.where("{} >= {}".format(date_col, TO_DATE), since)
+
+        df = self.read_sql(query.sql, con, params=query.params)
+        df[date_col] = pd.to_datetime(df[date_col])
+        return df
+
+    def count_dataset(self, con, dataset, before):
+        """
+        :return: number of rows in the dataset with FLIGHT_DATE / TRANSACTION_DATE before 'before'
+        """
+        table, date_col, columns, where = self.DATASETS[dataset]
+        query = Query(table, ['COUNT(*) AS ROWS_BELOW']).where("{} < {}".format(date_col, TO_DATE), before)
+        if where:
+            query.where(where)
+
+        return int(self.read_sql(query.sql, con, params=query.params)['ROWS_BELOW'][0])
+
+    def flights(self, con, since=None):
+        return self.read_dataset(con, 'flights', since)
+
+    def flights_hd(self, con, since=None):
+        return self.read_dataset(con, 'flights_hd', since)
+
+    def transactions(self, con, since=None):
+        return self.read_dataset(con, 'transactions', since)
+
+
+class TraxBackend(Backend):
+    """
+    TRAX reporting database through ODBC.  Email evan.fairchild@alaskaair.com for help with access & setup.
+    """
+    def __init__(self, dsn='DSN=Trax Reporting;pwd={}'):
+        self.dsn = dsn
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.dsn)
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+@lru_cache(maxsize=None)
+def _to_date(value, fmt=None):
+    """
+    Oracle to_date().  Dates are stored as (fractional) days since 1970-01-01 so that Oracle date arithmetic
+    (FLIGHT_DATE + TO_HOUR / 24) works unchanged.
+    """
+    if value is None:
+        return None
+    parts = [int(p) for p in re.findall(r'\d+', str(value))[:6]]
+    return (datetime(*parts) - EPOCH).total_seconds() / 86400
+
+
+@lru_cache(maxsize=None)
+def _to_char(value, fmt):
+    """
+    Oracle to_char() for dates, supports the YYYY, MM, DD, HH24, MI and SS elements.
+    """
+    if value is None:
+        return None
+    date = EPOCH + timedelta(seconds=round(value * 86400))
+    for element, directive in (('YYYY', '%Y'), ('MM', '%m'), ('DD', '%d'), ('HH24', '%H'), ('MI', '%M'),
+                               ('SS', '%S')):
+        fmt = fmt.replace(element, directive)
+    return date.strftime(fmt)
+
+
+def _nvl(value, default):
+    return default if value is None else value
+
+
+def _trunc(value):
+    return None if value is None else float(math.floor(value))
+
+
+class SQLiteBackend(Backend):
+    """
+    Local stand-in for TRAX.  The odb tables live in a SQLite database (a file, or shared memory when path is None)
+    and Oracle's to_date, to_char, NVL and TRUNC are registered as functions, so the reports' SQL runs as is.
+    ex. SQLiteBackend().load(reports.synthetic.generate_fleet(n_tails=700))
+    """
+    SCHEMA = {'AC_MASTER': "AC TEXT PRIMARY KEY",
+              'AC_ACTUAL_FLIGHTS': "AC TEXT, FLIGHT_DATE REAL, TO_HOUR REAL, TO_MINUTE REAL, FLIGHT_HOURS REAL, "
+                                   "FLIGHT_MINUTES REAL, CYCLES INTEGER",
+              'AC_ACTUAL_FLIGHTS_HD': "AC TEXT, FLIGHT_DATE REAL, TO_HOUR REAL, TO_MINUTE REAL, FLIGHT_HOURS REAL, "
+                                      "FLIGHT_MINUTES REAL, CYCLES INTEGER",
+              'AC_PN_TRANSACTION_HISTORY': "SN TEXT, PN TEXT, TRANSACTION_TYPE TEXT, AC TEXT, TRANSACTION_DATE REAL, "
+                                           "TRANSACTION_HOUR REAL, TRANSACTION_MINUTE REAL, SCHEDULE_CATEGORY TEXT, "
+                                           "POSITION TEXT, HOURS_INSTALLED REAL, MINUTES_INSTALLED REAL, "
+                                           "CYCLES_INSTALLED INTEGER, REMOVAL_REASON TEXT"}
+
+    INDEXES = {'AC_ACTUAL_FLIGHTS': ['AC, FLIGHT_DATE', 'FLIGHT_DATE'],
+               'AC_ACTUAL_FLIGHTS_HD': ['AC, FLIGHT_DATE', 'FLIGHT_DATE'],
+               'AC_PN_TRANSACTION_HISTORY': ['TRANSACTION_DATE']}
+
+    # Result columns holding dates, returned as datetimes like pyodbc does for Oracle DATE
+    DATE_COLUMNS = ('FLIGHT_DATE', 'FLIGHT_DATETIME', 'TRANSACTION_DATE', 'TRANS_DATE', 'INSTALL_DATE',
+                    'REMOVAL_DATE', 'FIRST_DATE', 'LAST_DATE')
+
+    _names = itertools.count()
+
+    def __init__(self, path=None):
+        """
+        :param path: SQLite database file, None keeps the database in memory for the life of this object
+        """
+        if path is None:
+            self.path = 'file:utilization_{}?mode=memory&cache=shared'.format(next(self._names))
+        else:
+            self.path = 'file:{}'.format(path)
+
+        # Keeps a shared memory database alive and creates the tables if needed
+        self._keeper = self.connect()
+        for table, columns in self.SCHEMA.items():
+            self._keeper.execute("CREATE TABLE IF NOT EXISTS odb.{} ({})".format(table, columns))
+            for i, cols in enumerate(self.INDEXES.get(table, [])):
+                self._keeper.execute("CREATE INDEX IF NOT EXISTS odb.IX_{}_{} ON {} ({})".format(table, i, table, cols))
+        self._keeper.commit()
+
+    def connect(self):
+        con = sqlite3.connect(':memory:', uri=True, check_same_thread=False)
+        con.create_function('to_date', 2, _to_date)
+        con.create_function('to_char', 2, _to_char)
+        con.create_function('NVL', 2, _nvl)
+        con.create_function('TRUNC', 1, _trunc)
+        con.execute("ATTACH DATABASE ? AS odb", (self.path,))
+        return con
+
+    def convert(self, df):
+        for col in self.DATE_COLUMNS:
+            if col in df.columns:
+                df[col] = self.to_datetime(df[col])
+        return df
+
+    @staticmethod
+    def to_datetime(days):
+        return pd.to_datetime((pd.to_numeric(days) * 86400).round(), unit='s')
+
+    @staticmethod
+    def from_datetime(dates):
+        return (pd.to_datetime(dates) - pd.Timestamp(EPOCH)).dt.total_seconds() / 86400
+
+    def load(self, tables, replace=True):
+        """
+        Writes dataframes into the odb tables, ex. from reports.synthetic.generate_fleet()
+        :param tables: dictionary of table name and dataframe with the TRAX column names
+        :param replace: delete the existing rows first
+        :return: self
+        """
+        con = self._keeper
+        for table, df in tables.items():
+            df = df.copy()
+            for col in df.columns:
+                if pd.api.types.is_datetime64_any_dtype(df[col]):
+                    df[col] = self.from_datetime(df[col])
+
+            if replace:
+                con.execute("DELETE FROM odb.{}".format(table))
+            con.executemany("INSERT INTO odb.{} ({}) VALUES ({})".format(table, ', '.join(df.columns),
+                                                                         ', '.join('?' * len(df.columns))),
+                            df.astype(object).where(pd.notnull(df), None).values.tolist())
+        con.commit()
+        return self
+
+    def close(self):
+        self._keeper.close()
@@ -0,0 +1,80 @@
+__author__ = "evfairchild"
+
+import os
+import pandas as pd
+from collections import OrderedDict
+from reports.airframe import Airframe
+from reports.engine import Engine
+from reports.export import export
+from reports.session import Session
+
+
+def month_range(start, end=None):
+    """
+    :param start: first month YYYY-MM
+    :param end: last month YYYY-MM, defaults to start
+    :return: list of YYYY-MM from start to end
+    """
+    return [str(p) for p in pd.period_range(start, end if end is not None else start, freq='M')]
+
+
+def period_bounds(period):
+    """
+    :param period: YYYY-MM
+    :return: first and last second of the month as strings, ex. ('2020-03-01 00:00:00', '2020-03-31 23:59:59')
+    """
+    month = pd.Period(period, freq='M')
+    return month.start_time.strftime("%Y-%m-%d %H:%M:%S"), month.end_time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class BatchReport(object):
+    """
+    Backfills several months at once.  The fleet history is loaded and attributed to ESNs once for the whole range,
+    then each month is cut from it with totals cumulative as of that month's end, so the cost is roughly flat in the
+    number of months.
+    ex. BatchReport(month_range('2019-04', '2020-03')).export()
+    """
+    def __init__(self, periods, session=None):
+        """
+        :param periods: list of YYYY-MM
+        :param session: reports.session.Session, a new TRAX session when None
+        """
+        self.periods = sorted(set(periods))
+        self.session = session if session is not None else Session()
+
+        self.startDate = period_bounds(self.periods[0])[0]
+        self.endDate = period_bounds(self.periods[-1])[1]
+
+    def run(self):
+        """
+        :return: dictionary of YYYY-MM and dictionary of sheet name and dataframe (airframe, engines, removals),
+                 the same sheets main.py writes for a single month
+        """
+        airframe = Airframe(self.startDate, self.endDate, session=self.session).run_periods(self.periods)
+        engine = Engine(self.startDate, self.endDate, session=self.session)
+        engines = engine.run_periods(self.periods)
+        removals = engine.get_removals_periods(self.periods)
+
+        return OrderedDict((period, OrderedDict([('airframe', airframe[period]),
+                                                 ('engines', engines[period]),
+                                                 ('removals', removals[period])]))
+                           for period in self.periods)
+
+    def export(self, directory='.', single_workbook=False, fmt='xlsx'):
+        """
+        :param directory: output folder
+        :param single_workbook: write one workbook with a sheet per month and report instead of one workbook per month
+        :param fmt: xlsx, parquet or csv, parquet and csv write a file per sheet
+        :return: list of files written
+        """
+        results = self.run()
+        if single_workbook:
+            file = os.path.join(directory, "utilization_{}_{}.{}".format(self.periods[0], self.periods[-1], fmt))
+            return export(OrderedDict(("{} {}".format(sheet_name, period), df)
+                                      for period, sheets in results.items() for sheet_name, df in sheets.items()),
+                          file, fmt)
+
+        files = []
+        for period, sheets in results.items():
+            files += export(sheets, os.path.join(directory, "utilization_{}.{}".format(period, fmt)), fmt)
+        return files
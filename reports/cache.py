@@ -0,0 +1,151 @@
+__author__ = "evfairchild"
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from reports import schema
+from reports.flightsource import FlightSource
+
+
+class FlightCache(object):
+    """
+    Local Parquet copy of the TRAX flight and engine transaction tables.  Airframe and Engine read from this instead of
+    TRAX when it is passed in as 'cache'.
+
+    sync() only fetches rows on or after the stored watermark (the last FLIGHT_DATE / TRANSACTION_DATE day in the cache)
+    so a monthly close costs one small delta query per table.  Use sync(full=True) to re-read everything, e.g. after
+    flights are moved to the archive table.  With offline=True sync() does nothing and the cached tables are used as
+    they are, without a connection to TRAX.
+    """
+    # TRAX table: reports.backend.Backend dataset
+    TABLES = {'AC_ACTUAL_FLIGHTS': 'flights',
+              'AC_ACTUAL_FLIGHTS_HD': 'flights_hd',
+              'AC_PN_TRANSACTION_HISTORY': 'transactions'}
+
+    def __init__(self, directory='cache', offline=False):
+        self.directory = directory
+        self.offline = offline
+        self.meta_file = os.path.join(directory, 'watermarks.json')
+        self.meta = self._read_meta()
+        self.synced = False
+        self._frames = {}
+
+    def _read_meta(self):
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as f:
+                return json.load(f)
+        return {}
+
+    def _write_meta(self):
+        with open(self.meta_file, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    def path(self, table):
+        return os.path.join(self.directory, table + '.parquet')
+
+    def watermark(self, table):
+        """
+        :param table: TRAX table name
+        :return: first day (YYYY-MM-DD 00:00:00) that the next sync will re-read, or None if the table is not cached
+        """
+        return self.meta.get(table, {}).get('watermark')
+
+    def sync(self, session, full=False):
+        """
+        Brings every cached table up to date.  Only runs once per instance unless 'full' is requested.
+        :param session: reports.session.Session providing the backend and connection
+        :param full: re-read the entire table instead of the rows after the watermark
+        :return: dictionary of table name and rows fetched
+        """
+        if self.offline or (self.synced and not full):
+            return {}
+
+        os.makedirs(self.directory, exist_ok=True)
+        fetched = {}
+        for table in self.TABLES:
+            with session.profile('cache.sync', table=table) as span:
+                fetched[table] = span.rows = self._sync_table(session, table, full)
+        self._write_meta()
+        self.synced = True
+        return fetched
+
+    def _sync_table(self, session, table, full):
+        dataset = self.TABLES[table]
+        date_col = session.backend.DATASETS[dataset][1]
+        watermark = None if full else self.watermark(table)
+        cached = self.read(table) if watermark is not None else None
+
+        if cached is not None and session.backend.count_dataset(session.connection, dataset, watermark) != \
+                int((cached[date_col] < pd.Timestamp(watermark)).sum()):
+            # Rows were deleted or back-dated below the watermark (i.e. archived), the delta would be wrong
+            cached, watermark = None, None
+
+        delta = session.backend.read_dataset(session.connection, dataset, since=watermark)
+
+        if cached is not None:
+            cached = cached.loc[cached[date_col] < pd.Timestamp(watermark)]
+            df = pd.concat([cached, delta], ignore_index=True)
+        else:
+            df = delta
+
+        df.to_parquet(self.path(table), index=False)
+        self._frames = {}
+
+        # Re-read the last cached day next time, rows for it may still be coming in
+        last = df[date_col].max()
+        self.meta[table] = {'watermark': None if pd.isnull(last) else last.strftime('%Y-%m-%d 00:00:00'),
+                            'rows': len(df),
+                            'synced': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        return len(delta)
+
+    def read(self, table):
+        """
+        :param table: TRAX table name
+        :return: dataframe with the cached table as stored (same columns as TRAX)
+        """
+        if table not in self._frames:
+            self._frames[table] = pd.read_parquet(self.path(table))
+        return self._frames[table]
+
+    def flights(self, table='AC_ACTUAL_FLIGHTS'):
+        """
+        :param table: AC_ACTUAL_FLIGHTS or AC_ACTUAL_FLIGHTS_HD
+        :return: dataframe shaped like Airframe.get_flights() (reports.schema types), plus the raw FLIGHT_DATE, sorted
+                 by AC and time
+        """
+        key = table + '.flights'
+        if key not in self._frames:
+            df = self.read(table)
+            out = pd.DataFrame({'AC': df['AC'],
+                                'FLIGHT_DATE': df['FLIGHT_DATE'],
+                                'FLIGHT_DATETIME': df['FLIGHT_DATE'] +
+                                pd.to_timedelta(df['TO_HOUR'].fillna(0) * 60 + df['TO_MINUTE'].fillna(0), unit='m'),
+                                'YYYY-MM': schema.month_category(df['FLIGHT_DATE']),
+                                'FLIGHT_HOURS': np.round(df['FLIGHT_HOURS'] + df['FLIGHT_MINUTES'] / 60, 5),
+                                'FLIGHT_CYCLES': df['CYCLES']})
+            self._frames[key] = schema.compact(out).sort_values(by=['AC', 'FLIGHT_DATETIME'], kind='mergesort', ignore_index=True)
+        return self._frames[key]
+
+    def fh_fc(self, acs, asof):
+        """
+        :param acs: list of AC registrations
+        :param asof: last FLIGHT_DATE included, ex. 2020-03-31 23:59:59
+        :return: dataframe of total FLIGHT_HOURS and FLIGHT_CYCLES indexed by AC, like Airframe.get_fh_fc()
+        """
+        return FlightSource(cache=self).totals(['AC'], acs, asof=asof).set_index('AC')
+
+    def transactions(self):
+        """
+        :return: cached engine transactions with TRANSACTION_DATE including the transaction hour and minute
+                 (TRANS_DATE in get_removals()) and the raw date as TRANSACTION_DAY
+        """
+        key = 'AC_PN_TRANSACTION_HISTORY.transactions'
+        if key not in self._frames:
+            df = self.read('AC_PN_TRANSACTION_HISTORY').copy()
+            df['TRANSACTION_DAY'] = df['TRANSACTION_DATE']
+            df['TRANSACTION_DATE'] = df['TRANSACTION_DATE'].dt.floor('D') + pd.to_timedelta(
+                df['TRANSACTION_HOUR'].fillna(0) * 60 + df['TRANSACTION_MINUTE'].fillna(0), unit='m')
+            self._frames[key] = df
+        return self._frames[key]
@@ -1,17 +1,37 @@
 __author__ = "evfairchild"
 
+from reports import schema
 from reports.airframe import Airframe
+from reports.exclusions import ExclusionRules, find_anomalies
+from reports.forecast import UtilizationForecast
+from reports.installindex import InstallIndex
+from reports.timeindex import UtilizationIndex
+from reports.timeseries import UtilizationSeries
+from reports.accumulator import RunningTotals
+from reports.query import Query, ENGINE_PN, TO_DATE, TRANSACTION_DATETIME
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from tqdm import tqdm
 from colorama import Fore
 
 
 class Engine(Airframe):
-    def __init__(self, start_date, end_date):
-        super(Engine, self).__init__(start_date, end_date)
-        cols = self.get_fh_fc_history().columns
-        self.esn_history = pd.DataFrame(columns=cols)
+    def __init__(self, start_date, end_date, cache=None, session=None):
+        super(Engine, self).__init__(start_date, end_date, cache=cache, session=session)
+        self._esn_history = None
+
+    @property
+    def esn_history(self):
+        # Only the legacy loop needs this, and it costs a full fleet history pivot to build
+        if self._esn_history is None:
+            cols = self.get_fh_fc_history().columns
+            self._esn_history = pd.DataFrame(columns=cols)
+        return self._esn_history
+
+    @esn_history.setter
+    def esn_history(self, df):
+        self._esn_history = df
 
     def get_removals(self):
         """
@@ -19,121 +39,219 @@ class Engine(Airframe):
         PN query: 1887M10G% for the CFM56-5B and 2489M10G% for the LEAP-1A engines
         :return: dataframe with ESN, AC and Date removed
         """
-        query = "SELECT SN, PN, TRANSACTION_TYPE, AC, " \
-                "(TRUNC(TRANSACTION_DATE) + " \
-                    "( NVL( TRANSACTION_HOUR, 0) / 24 ) + " \
-                    "( NVL( TRANSACTION_MINUTE, 0) / 1440 )) AS TRANS_DATE, " \
-                "SCHEDULE_CATEGORY, POSITION, " \
-                "ROUND ( HOURS_INSTALLED + ( MINUTES_INSTALLED / 60 ), 5 ) AS TSI, " \
-                "CYCLES_INSTALLED AS CSI, REMOVAL_REASON " \
-                "FROM odb.AC_PN_TRANSACTION_HISTORY " \
-                "WHERE ( TRANSACTION_DATE >= to_date('{}', 'YYYY-MM-DD HH24:MI:SS')) " \
-                "AND ( TRANSACTION_DATE <= to_date('{}', 'YYYY-MM-DD HH24:MI:SS')) " \
-                "AND ( PN LIKE '1887M10G%' OR PN LIKE '2489M10G%' ) " \
-                "ORDER BY AC, TRANSACTION_DATE".format(self.startDate, self.endDate)
-
-        return pd.read_sql(query, self.trax)
+        if self.cache is not None:
+            df = self.cache.transactions()
+            df = df.loc[(df['TRANSACTION_DAY'] >= pd.Timestamp(self.startDate)) &
+                        (df['TRANSACTION_DAY'] <= pd.Timestamp(self.endDate))]
+            df = df.sort_values(by=['AC', 'TRANSACTION_DAY'], kind='mergesort', ignore_index=True)
+            df = df.rename(columns={'TRANSACTION_DATE': 'TRANS_DATE', 'CYCLES_INSTALLED': 'CSI'})
+            df['TSI'] = np.round(df['HOURS_INSTALLED'] + df['MINUTES_INSTALLED'] / 60, 5)
+            return df[['SN', 'PN', 'TRANSACTION_TYPE', 'AC', 'TRANS_DATE', 'SCHEDULE_CATEGORY', 'POSITION',
+                       'TSI', 'CSI', 'REMOVAL_REASON']]
+
+        query = Query('AC_PN_TRANSACTION_HISTORY', ['SN', 'PN', 'TRANSACTION_TYPE', 'AC',
+                                                    TRANSACTION_DATETIME + ' AS TRANS_DATE',
+                                                    'SCHEDULE_CATEGORY', 'POSITION',
+                                                    'ROUND( HOURS_INSTALLED + ( MINUTES_INSTALLED / 60 ), 5 ) AS TSI',
+                                                    'CYCLES_INSTALLED AS CSI', 'REMOVAL_REASON']) \
+            .where('TRANSACTION_DATE >= ' + TO_DATE, self.startDate) \
+            .where('TRANSACTION_DATE <= ' + TO_DATE, self.endDate) \
+            .where(ENGINE_PN) \
+            .order_by('AC', 'TRANSACTION_DATE')
+
+        return self.read_sql(query.sql, params=query.params)
 
     def _get_install_removal_pairs(self):
         """
         This method merges Install and Removal records from the odb.AC_PN_TRANSACTION_HISTORY table in TRAX so that
-        hours and cycles by ESM can be tabulated.
+        hours and cycles by ESM can be tabulated.  The pairs come from get_install_index(), built once per session.
+        The report is as of end_date: later installs are left out and a pair removed after end_date is still open
+        (REMOVAL_DATE == end_date), so a past month counts no flight after it.
         :return: dataframe containing install and removal pairs based on ESN and installed aircraft
         """
-        query = "SELECT SN, TRANSACTION_TYPE, AC, " \
-                "(TRUNC(TRANSACTION_DATE) + " \
-                    "( NVL( TRANSACTION_HOUR, 0) / 24 ) + " \
-                    "( NVL( TRANSACTION_MINUTE, 0) / 1440 )) AS TRANSACTION_DATE, " \
-                "POSITION " \
-                "FROM odb.AC_PN_TRANSACTION_HISTORY " \
-                "WHERE ( PN LIKE '1887M10G%' OR PN LIKE '2489M10G%' ) " \
-                "AND ( TRANSACTION_TYPE LIKE '{}' ) " \
-                "ORDER BY TRANSACTION_DATE"
-
-        self.installs = pd.read_sql(query.format('IN%'), self.trax)
-        self.removals = pd.read_sql(query.format('REMOVE'), self.trax)
-
-        self.installs.drop_duplicates(inplace=True)
-        self.removals.drop_duplicates(inplace=True)
-
-        # For some reason there are two original install records for N521VA engines, the merge cannot work 1-to-1
-        # because of this.  For that reason it is forced to be removed.  There is also an erroneous ESN entry (397549)
-        for i, install in self.installs.iterrows():
-            if install['AC'] == 'N521VA' and str(install['TRANSACTION_DATE']) == '2006-04-04 00:00:00':
-                self.installs.drop([i], inplace=True)
-            elif install['SN'] == '397549':
-                self.installs.drop([i], inplace=True)
-            elif install['SN'] == '643151' and str(install['TRANSACTION_DATE']) == '2010-09-27 00:00:00':
-                self.installs.drop([i], inplace=True)
-            elif install['SN'] == '643152' and str(install['TRANSACTION_DATE']) == '2010-09-27 00:00:00':
-                self.installs.drop([i], inplace=True)
+        end = pd.Timestamp(self.endDate)
+        pairs = self.get_install_index().pairs
+        pairs = pairs.loc[pairs['INSTALL_DATE'] <= end].reset_index(drop=True)
+        removal = pairs['REMOVAL_DATE']
+        pairs['REMOVAL_DATE'] = removal.where(removal.notnull() & (removal <= end), end)
+        return pairs
+
+    def get_install_index(self, directory=None):
+        """
+        Install/removal intervals of every ESN by tail and position and by ESN, see reports.installindex.
+        :param directory: keep the index there (install_index.parquet) between runs and only read the transactions
+                          since its watermark.  Defaults to the cache directory when the report uses a
+                          reports.cache.FlightCache.
+        :return: reports.installindex.InstallIndex (memoized per session)
+        """
+        if directory is None and self.cache is not None:
+            directory = self.cache.directory
+        return self.session.memo(('install_index', self.cache is not None),
+                                 lambda: self._read_install_index(directory))
+
+    def _read_install_index(self, directory):
+        with self.session.profile('engine.install_index') as span:
+            index = InstallIndex.load(directory) if directory is not None else None
+            reported = index.meta.get('anomalies', []) if index is not None else []
+            if index is not None and index.watermark is not None and \
+                    index.meta.get('rules') == self.exclusions.digest and \
+                    self._count_transactions(index.watermark) == index.meta.get('below'):
+                span.rows = index.update(self._get_installs(index.watermark), self._get_removes(index.watermark))
             else:
-                pass
+                # Transactions were deleted or back-dated below the watermark, the rules changed or there is no index
+                index = InstallIndex(self._get_installs(), self._get_removes())
+                span.rows = len(index.installs) + len(index.removals)
+
+            anomalies = self.session.memo(self._anomalies_memo(index), lambda: self._check_anomalies(index, reported))
+            if directory is not None:
+                index.meta.update({'below': self._count_transactions(index.watermark), 'rules': self.exclusions.digest,
+                                   'anomalies': self._anomaly_keys(anomalies).tolist()})
+                index.save(directory)
+            return index
+
+    @property
+    def exclusions(self):
+        """
+        Known bad transaction records left out of the install/removal pairs, see reports.exclusions
+        :return: reports.exclusions.ExclusionRules of the session (reports/exclusions.json unless it names others)
+        """
+        return self.session.memo(('exclusions', ), lambda: ExclusionRules.load(self.session.exclusions))
 
-        self.pairs = pd.merge_asof(self.installs.rename(columns={'TRANSACTION_DATE': 'INSTALL_DATE'}),
-                                   self.removals.rename(columns={'TRANSACTION_DATE': 'REMOVAL_DATE'}),
-                                   left_on='INSTALL_DATE',
-                                   right_on='REMOVAL_DATE',
-                                   by=['SN', 'AC'], direction='forward')
+    def get_anomalies(self):
+        """
+        Duplicate and unmatched install/removal records the exclusion rules do not cover, see
+        reports.exclusions.find_anomalies().  They are checked whenever the install index is built or updated.
+        :return: dataframe with ANOMALY, KIND, SN, AC, POSITION, TRANSACTION_DATE, DETAIL and NEW (not reported by a
+                 previous run keeping the index in the same directory)
+        """
+        index = self.get_install_index()
+        return self.session.memo(self._anomalies_memo(index), lambda: self._check_anomalies(index, []))
 
-        self.column_names = {'SN': 'ESN', 'TRANSACTION_TYPE_x': 'INSTALL',
-                             'TRANSACTION_TYPE_y': 'REMOVE', 'POSITION_x': 'POSITION'}
-        self.pairs.rename(columns=self.column_names, inplace=True)
-        self.pairs[['REMOVAL_DATE']] = self.pairs[['REMOVAL_DATE']].fillna(value=pd.Timestamp(self.endDate))
+    def _anomalies_memo(self, index):
+        """
+        :return: memo key of the anomalies of 'index' as it is now, a later update() of the index changes it
+        """
+        return 'anomalies', self.cache is not None, index.watermark, len(index.installs), len(index.removals)
+
+    @staticmethod
+    def _anomaly_keys(anomalies):
+        return anomalies['ANOMALY'] + '/' + anomalies['SN'].astype(str) + '/' + anomalies['AC'].astype(str) + '/' + \
+            anomalies['TRANSACTION_DATE'].astype(str)
 
-        return self.pairs.sort_values(by=['ESN', 'INSTALL_DATE'], ascending=(True, True), ignore_index=True)\
-            .drop(['INSTALL', 'REMOVE', 'POSITION_y'], axis=1)
+    def _check_anomalies(self, index, reported):
+        """
+        Finds the anomalies of 'index' and prints the ones not in 'reported' (keys saved by the previous run).
+        """
+        with self.session.profile('engine.anomalies') as span:
+            anomalies = find_anomalies(index.installs, index.removals, index.pairs)
+            anomalies['NEW'] = ~self._anomaly_keys(anomalies).isin(reported)
+            span.record(anomalies)
+
+        new = anomalies.loc[anomalies['NEW']]
+        if len(new):
+            print("{}{} new engine transaction anomalies{}, add exclusion rules for the bad records "
+                  "(Engine.get_anomalies()):".format(Fore.YELLOW, len(new), Fore.RESET))
+            print(new.drop(columns='NEW').head(10).to_string(index=False))
+        return anomalies
+
+    def _count_transactions(self, before):
+        """
+        :return: number of engine transactions before 'before' (YYYY-MM-DD HH:MM:SS), 0 when None
+        """
+        if before is None:
+            return 0
+        if self.cache is not None:
+            return int((self.cache.transactions()['TRANSACTION_DAY'] < pd.Timestamp(before)).sum())
+        return self.session.backend.count_dataset(self.trax, 'transactions', before)
+
+    def _get_installs(self, since=None):
+        """
+        :param since: only the installs on or after this day, None for all
+        :return: install transactions from _get_transactions() without the records excluded by the exclusion rules
+        """
+        return self.exclusions.apply(self._get_transactions('IN%', since=since).drop_duplicates(), 'install')
+
+    def _get_removes(self, since=None):
+        """
+        :param since: only the removals on or after this day, None for all
+        :return: removal transactions from _get_transactions() without the records excluded by the exclusion rules
+        """
+        return self.exclusions.apply(self._get_transactions('REMOVE', since=since), 'remove')
+
+    def _get_transactions(self, transaction_type, since=None):
+        """
+        Engine transaction records (CFM56-5B and LEAP-1A) of a single type, used by get_install_index()
+        :param transaction_type: TRANSACTION_TYPE pattern (SQL LIKE) ex. IN% or REMOVE
+        :param since: only the transactions on or after this day (TRANSACTION_DATE), None for all
+        :return: dataframe with SN, TRANSACTION_TYPE, AC, TRANSACTION_DATE and POSITION ordered by TRANSACTION_DATE
+        """
+        if self.cache is not None:
+            df = self.cache.transactions()
+            if transaction_type.endswith('%'):
+                df = df.loc[df['TRANSACTION_TYPE'].str.startswith(transaction_type[:-1], na=False)]
+            else:
+                df = df.loc[df['TRANSACTION_TYPE'] == transaction_type]
+            if since is not None:
+                df = df.loc[df['TRANSACTION_DAY'] >= pd.Timestamp(since)]
+            return df[['SN', 'TRANSACTION_TYPE', 'AC', 'TRANSACTION_DATE', 'POSITION']]\
+                .sort_values(by='TRANSACTION_DATE', kind='mergesort', ignore_index=True)
+
+        query = Query('AC_PN_TRANSACTION_HISTORY', ['SN', 'TRANSACTION_TYPE', 'AC',
+                                                    TRANSACTION_DATETIME + ' AS TRANSACTION_DATE', 'POSITION']) \
+            .where(ENGINE_PN) \
+            .where('TRANSACTION_TYPE LIKE ?', transaction_type) \
+            .order_by('TRANSACTION_DATE')
+        if since is not None:
+            query.where('TRANSACTION_DATE >= ' + TO_DATE, since)
+
+        return self.read_sql(query.sql, params=query.params)
 
     def get_install_time_by_yyyy_mm(self, startdate, enddate, ac):
         """
         This method return a dataframe for a single aircraft over a specific datetime interval (start - end).
+        Flights are read from AC_ACTUAL_FLIGHTS and / or AC_ACTUAL_FLIGHTS_HD as routed by reports.flightsource.
         :param startdate: Install date of the ESN being queried from the run() method.  ex. 2020-01-01 00:00:00
         :param enddate: Removal date of the ESN being queried from the run() method.  ex. 2020-01-31 23:59:95
         :param ac: aircraft registration ex. NXXXVA
         :return: dataframe indexed by ac with columns YYYY-MM
         """
-        query = "SELECT (to_char(odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE, 'YYYY-MM')) AS BLAH, " \
-                "SUM( ROUND( odb.AC_ACTUAL_FLIGHTS.FLIGHT_HOURS + " \
-                "( odb.AC_ACTUAL_FLIGHTS.FLIGHT_MINUTES / 60 ), 5 ) ) AS FLIGHT_HOURS, " \
-                "SUM ( odb.AC_ACTUAL_FLIGHTS.CYCLES ) AS FLIGHT_CYCLES " \
-                "FROM odb.AC_ACTUAL_FLIGHTS " \
-                "WHERE ( ( odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE + " \
-                    "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_HOUR, 0) / 24 ) + " \
-                    "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_MINUTE, 0) / 1440 )) >= to_date('{}', 'YYYY-MM-DD HH24:MI:SS')) " \
-                "AND ( ( odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE + " \
-                    "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_HOUR, 0) / 24 ) + " \
-                    "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_MINUTE, 0) / 1440 )) <= to_date('{}', 'YYYY-MM-DD HH24:MI:SS')) " \
-                "AND ( odb.AC_ACTUAL_FLIGHTS.AC = '{}' ) " \
-                "GROUP BY to_char(odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE, 'YYYY-MM') " \
-                "ORDER BY BLAH".format(startdate, enddate, ac)
-
-        df = pd.read_sql(query, self.trax)
-        if df.empty:
-            query = query.replace("AC_ACTUAL_FLIGHTS", "AC_ACTUAL_FLIGHTS_HD")
-            df = pd.read_sql(query, self.trax)
-        else:
-            pass
-
-        df.rename(columns={'BLAH': 'YYYY-MM'}, inplace=True)
+        df = self.flight_source.totals(['YYYY-MM'], [ac], startdate, enddate)
         self.esn_history.update(df)
         return df
 
-    def run(self):
+    def run(self, mode='vectorized'):
+        """
+        :param mode: 'vectorized' pulls every flight once and joins it to the install/removal pairs,
+                     'pushdown' lets TRAX pair, join and aggregate in a single query,
+                     'loop' issues one query per install/removal pair (legacy)
+        :return: dataframe with flight hours and cycles for each ESN, filtered to YYYY-MM with totals
+        """
         print("Collecting Engine Data...")
-        pairs = self._get_install_removal_pairs()
+        if mode not in ('vectorized', 'pushdown', 'loop'):
+            raise ValueError("Engine run mode {} invalid.".format(mode))
 
-        return self._build_dataframe(pairs)
+        with self.session.profile('engine.run', mode=mode) as span:
+            if mode == 'pushdown':
+                return span.record(self._build_dataframe_pushdown())
+
+            with self.session.profile('engine.pairs') as pairs_span:
+                pairs = pairs_span.record(self._get_install_removal_pairs())
+
+            if mode == 'vectorized':
+                return span.record(self._build_dataframe_vectorized(pairs))
+            return span.record(self._build_dataframe(pairs))
 
     def _build_dataframe(self, pairs):
         """
-        Needs revision.  This method calls on 'get_install_time_by_yyyy_mm()' for each install-removal pair and merges
-        unique records based on ESN. This is time-consuming (~50s) and should be written as an array function (df.apply)
+        Legacy method.  This method calls on 'get_install_time_by_yyyy_mm()' for each install-removal pair and merges
+        unique records based on ESN. This is time-consuming (~50s), see _build_dataframe_vectorized().
         :return: dataframe with flight hours and cycles for each ESN in the fleet's history, filtered to YYYY-MM with totals
         """
         pbar = tqdm(total=len(pairs))
         pbar.bar_format = "{l_bar}%s{bar}%s{r_bar}" % (Fore.GREEN, Fore.RESET)
 
-        df_result = pd.DataFrame(columns=['ESN', 'INSTALLED_AC', 'YYYY-MM', 'FLIGHT_HOURS', 'FLIGHT_CYCLES'])
+        columns = ['ESN', 'INSTALLED_AC', 'YYYY-MM', 'FLIGHT_HOURS', 'FLIGHT_CYCLES']
+        parts = []
 
         for i, esn in pairs.iterrows():
             df_tmp = self.get_install_time_by_yyyy_mm(esn['INSTALL_DATE'], esn['REMOVAL_DATE'], esn['AC'])
@@ -144,21 +262,363 @@ class Engine(Airframe):
             else:
                 df_tmp['INSTALLED_AC'] = 'SPARE'
 
-            df_result = df_result.append(df_tmp, ignore_index=True)
+            # Appending to a dataframe copies it every time and leaves every column as object, concatenate once
+            parts.append(schema.compact(df_tmp[columns].copy()))
             pbar.update(1)
 
         pbar.close()
 
-        piv = self.filter_to_yyyy_mm(
-            pd.pivot_table(df_result, index=['ESN'], columns=['YYYY-MM'], fill_value=0, aggfunc=np.sum, margins=True))
-        installed_ac = df_result.loc[df_result['YYYY-MM'] == self.yyyymm]
-        installed_ac = installed_ac[['ESN', 'INSTALLED_AC']]
-        installed_ac.set_index('ESN', inplace=True)
+        df_result = schema.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+        return self._pivot_esn_history(df_result)
+
+    def _build_dataframe_vectorized(self, pairs):
+        """
+        Same result as _build_dataframe(), but the flight records for every aircraft in 'pairs' are read once
+        (AC_ACTUAL_FLIGHTS and AC_ACTUAL_FLIGHTS_HD, see reports.flightsource) and assigned to ESNs with an interval
+        join.
+        :param pairs: dataframe from _get_install_removal_pairs()
+        :return: dataframe with flight hours and cycles for each ESN in the fleet's history, filtered to YYYY-MM with totals
+        """
+        if self.session.chunksize:
+            with self.session.profile('engine.attribute', chunksize=self.session.chunksize) as span:
+                df_result = span.record(self._attribute_flights_chunked(pairs))
+            return self._pivot_esn_history(df_result)
+
+        acs = list(pairs['AC'].dropna().unique())
+        with self.session.profile('engine.flights') as span:
+            flights = span.record(self.get_flights(acs, end=self.endDate))
+        with self.session.profile('engine.attribute') as span:
+            df_result = span.record(self._attribute_flights(pairs, flights))
+
+        return self._pivot_esn_history(df_result)
+
+    def get_esn_flights(self):
+        """
+        This method returns every flight attributed to the ESNs installed on the aircraft at the time.
+        :return: dataframe with ESN, AC, FLIGHT_DATETIME, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES (reports.schema types)
+        """
+        pairs = self._get_install_removal_pairs()
+        acs = list(pairs['AC'].dropna().unique())
+        df = self._attribute_flight_records(pairs, self.get_flights(acs, end=self.endDate))
+        df.insert(0, 'ESN', pairs['ESN'].values[df['PAIR'].values])
+
+        return schema.compact(df.drop(columns=['PAIR']))
+
+    def get_esn_index(self):
+        """
+        :return: reports.timeindex.UtilizationIndex keyed by ESN (memoized per session)
+        """
+        return self.session.memo(('esn_index', self.endDate, self.cache is not None),
+                                 lambda: UtilizationIndex(self.get_esn_flights(), key='ESN'))
+
+    def get_esn_series(self):
+        """
+        Daily cumulative flight hours and cycles of every ESN up to end_date, counted from its first install in TRAX,
+        with weekly, monthly, quarterly and yearly rollups.  See reports.timeseries.
+        :return: reports.timeseries.UtilizationSeries keyed by ESN (memoized per session)
+        """
+        def build():
+            with self.session.profile('engine.series') as span:
+                series = UtilizationSeries(self.get_esn_flights(), key='ESN', end=self.endDate)
+                span.record(series.daily)
+                return series
+        return self.session.memo(('esn_series', self.endDate, self.cache is not None), build)
+
+    def get_esn_forecast(self, window=12):
+        """
+        Utilization rate of every ESN over the last 'window' months up to end_date (days off wing count at 0), and the
+        date each reaches a flight hour or cycle threshold.  See reports.forecast.
+        :return: reports.forecast.UtilizationForecast keyed by ESN (memoized per session)
+        """
+        def build():
+            with self.session.profile('engine.forecast', window=window) as span:
+                forecast = UtilizationForecast(self.get_esn_series(), window=window)
+                span.record(forecast.get_rates())
+                return forecast
+        return self.session.memo(('esn_forecast', self.endDate, window, self.cache is not None), build)
+
+    def get_tsi_csi_pairs(self):
+        """
+        Time and cycles since install for every install/removal pair in one pass over the flight records, instead of a
+        get_tsi_csi() query per pair.  Flights are attributed like the engine report (install <= flight <= removal,
+        from both flight tables), so the TSN/CSN of an ESN's last pair is its 'All' total in run().
+        :return: dataframe from _get_install_removal_pairs() with TSI and CSI (hours and cycles of the pair) and TSN
+                 and CSN (running totals of the ESN at REMOVAL_DATE, since its first install in TRAX)
+        """
+        pairs = self._get_install_removal_pairs()
+        acs = list(pairs['AC'].dropna().unique())
+        records = self._attribute_flight_records(pairs, self.get_flights(acs))
+
+        pairs['TSI'] = np.bincount(records['PAIR'].values, weights=records['FLIGHT_HOURS'].values,
+                                   minlength=len(pairs))
+        pairs['CSI'] = np.bincount(records['PAIR'].values, weights=records['FLIGHT_CYCLES'].values,
+                                   minlength=len(pairs)).astype(np.int64)
 
+        # Pairs are sorted by ESN and INSTALL_DATE
+        pairs['TSN'] = pairs.groupby('ESN')['TSI'].cumsum()
+        pairs['CSN'] = pairs.groupby('ESN')['CSI'].cumsum()
+        return pairs
+
+    def get_tsn_csn(self):
+        """
+        Life to date of every ESN for life-limited part tracking.
+        :return: dataframe indexed by ESN with the current (or last) AC and POSITION, INSTALL_DATE and REMOVAL_DATE of
+                 the last pair, INSTALLED_AC (AC, or SPARE when removed), TSI and CSI of the last pair and TSN and CSN
+        """
+        pairs = self.get_tsi_csi_pairs()
+        df = pairs.groupby('ESN', sort=True).last()
+        df['INSTALLED_AC'] = np.where(df['REMOVAL_DATE'].astype(str) == self.endDate, df['AC'], 'SPARE')
+        return df[['AC', 'POSITION', 'INSTALL_DATE', 'REMOVAL_DATE', 'INSTALLED_AC', 'TSI', 'CSI', 'TSN', 'CSN']]
+
+    def _attribute_flights(self, pairs, flights):
+        """
+        Monthly totals of _attribute_flight_records() for each install/removal pair.
+        :param pairs: dataframe from _get_install_removal_pairs()
+        :param flights: dataframe from get_flights()
+        :return: dataframe with ESN, INSTALLED_AC, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES per pair and month
+        """
+        pairs = pairs.reset_index(drop=True)
+        df_result = self._attribute_flight_records(pairs, flights)\
+            .groupby(['PAIR', 'YYYY-MM'], sort=True, observed=True)[['FLIGHT_HOURS', 'FLIGHT_CYCLES']].sum()\
+            .reset_index()
+
+        return self._label_pairs(pairs, df_result)
+
+    def _attribute_flights_chunked(self, pairs):
+        """
+        Same result as _attribute_flights(), but the flight records are streamed session.chunksize rows at a time and
+        folded into running totals by pair and month, so only one chunk of flights is in memory.
+        :param pairs: dataframe from _get_install_removal_pairs()
+        :return: dataframe with ESN, INSTALLED_AC, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES per pair and month
+        """
+        pairs = pairs.reset_index(drop=True)
+        acs = list(pairs['AC'].dropna().unique())
+
+        totals = RunningTotals(['PAIR', 'YYYY-MM'])
+        for chunk in self.iter_flights(acs, end=self.endDate):
+            totals.add(self._attribute_flight_records(pairs, chunk))
+
+        return self._label_pairs(pairs, totals.frame())
+
+    def _label_pairs(self, pairs, df_result):
+        """
+        :param pairs: dataframe from _get_install_removal_pairs() with a default index
+        :param df_result: dataframe with PAIR (row number in pairs), YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES
+        :return: df_result with ESN and INSTALLED_AC (AC while installed at end_date, else SPARE) instead of PAIR
+        """
+        installed = np.where(pairs['REMOVAL_DATE'].astype(str) == self.endDate, pairs['AC'], 'SPARE')
+        df_result['ESN'] = pairs['ESN'].values[df_result['PAIR'].values]
+        df_result['INSTALLED_AC'] = installed[df_result['PAIR'].values]
+
+        return df_result[['ESN', 'INSTALLED_AC', 'YYYY-MM', 'FLIGHT_HOURS', 'FLIGHT_CYCLES']]
+
+    def _attribute_flight_records(self, pairs, flights):
+        """
+        Assigns each flight to every install/removal pair on that aircraft with INSTALL_DATE <= flight <= REMOVAL_DATE.
+        :param pairs: dataframe from _get_install_removal_pairs()
+        :param flights: dataframe from get_flights()
+        :return: dataframe with PAIR (row number in pairs), AC, FLIGHT_DATETIME, YYYY-MM, FLIGHT_HOURS and
+                 FLIGHT_CYCLES for every attributed flight, ordered by pair and time (reports.schema types)
+        """
+        pairs = pairs.reset_index(drop=True)
+        tails = pd.Index(pd.concat([pairs['AC'], flights['AC'].astype(object)]).dropna().unique())
+
+        pair_tail = tails.get_indexer(pairs['AC'])
+        key = self._sort_key(tails.get_indexer(flights['AC']), flights['FLIGHT_DATETIME'])
+        order = np.argsort(key, kind='mergesort')
+        lo = np.searchsorted(key[order], self._sort_key(pair_tail, pairs['INSTALL_DATE']), side='left')
+        hi = np.searchsorted(key[order], self._sort_key(pair_tail, pairs['REMOVAL_DATE']), side='right')
+
+        counts = np.where(pair_tail >= 0, np.maximum(hi - lo, 0), 0)
+        pair_idx = np.repeat(np.arange(len(pairs)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = flights.iloc[order[np.repeat(lo, counts) + offsets]]
+        df = schema.compact(pd.DataFrame({
+            'PAIR': pair_idx,
+            'AC': rows['AC'].values,
+            'FLIGHT_DATETIME': pd.to_datetime(rows['FLIGHT_DATETIME']).values,
+            'YYYY-MM': rows['YYYY-MM'].values,
+            # An empty result set comes back as object columns
+            'FLIGHT_HOURS': pd.to_numeric(rows['FLIGHT_HOURS']).values,
+            'FLIGHT_CYCLES': pd.to_numeric(rows['FLIGHT_CYCLES']).values}))
+
+        return df.sort_values(by=['PAIR', 'FLIGHT_DATETIME'], kind='mergesort', ignore_index=True)
+
+    def _build_dataframe_pushdown(self):
+        """
+        Same result as _build_dataframe(), but the install/removal pairing, the flight join and the monthly
+        aggregation all run server side.  Only one row per install/removal pair and month is returned.
+        :return: dataframe with flight hours and cycles for each ESN in the fleet's history, filtered to YYYY-MM with totals
+        """
+        query, params = self._get_esn_history_query()
+        df = self.read_sql(query, params=params)
+        df.rename(columns={'BLAH': 'YYYY-MM'}, inplace=True)
+
+        return self._pivot_esn_history(df)
+
+    def _get_esn_history_query(self):
+        """
+        Builds the push-down query for _build_dataframe_pushdown().  It mirrors _get_install_removal_pairs() (including
+        the exclusion rules) and get_install_time_by_yyyy_mm().  ROUTES is the routing of reports.flightsource
+        computed server side: archive flights are only read before the first FLIGHT_DATE of the tail in
+        AC_ACTUAL_FLIGHTS.
+        :return: SQL string returning ESN, INSTALLED_AC, BLAH (YYYY-MM), FLIGHT_HOURS and FLIGHT_CYCLES, and its bind
+                 parameters
+        """
+        transactions = "SELECT DISTINCT SN, TRANSACTION_TYPE, AC, " + TRANSACTION_DATETIME + " AS TRANSACTION_DATE, " \
+                       "POSITION " \
+                       "FROM odb.AC_PN_TRANSACTION_HISTORY " \
+                       "WHERE " + ENGINE_PN + " " \
+                       "AND ( TRANSACTION_TYPE LIKE '{}' )"
+
+        installs, install_params = self.exclusions.sql('i', 'install')
+        removes, remove_params = self.exclusions.sql('r', 'remove')
+
+        flight_date = "( {0}.FLIGHT_DATE + ( NVL( {0}.TO_HOUR, 0) / 24 ) + ( NVL( {0}.TO_MINUTE, 0) / 1440 ))"
+        flight_slice = "SELECT p.ESN, p.AC, p.INSTALL_DATE, p.INSTALLED_AC, " \
+                       "to_char(f.FLIGHT_DATE, 'YYYY-MM') AS BLAH, " \
+                       "ROUND( f.FLIGHT_HOURS + ( f.FLIGHT_MINUTES / 60 ), 5 ) AS FLIGHT_HOURS, " \
+                       "f.CYCLES AS FLIGHT_CYCLES " \
+                       "FROM PAIRS p JOIN odb.{} f ON ( f.AC = p.AC ) " \
+                       "AND ( " + flight_date.format('f') + " >= p.INSTALL_DATE ) " \
+                       "AND ( " + flight_date.format('f') + " <= p.REMOVAL_DATE ) "
+
+        query = "WITH INSTALLS AS ( " + transactions.format('IN%') + " ), " \
+                "REMOVALS AS ( " + transactions.format('REMOVE') + " ), " \
+                "PAIRS AS ( " \
+                    "SELECT ESN, AC, INSTALL_DATE, REMOVAL_DATE, " \
+                    "( CASE WHEN REMOVAL_DATE = " + TO_DATE + " " \
+                        "THEN AC ELSE 'SPARE' END ) AS INSTALLED_AC " \
+                    "FROM ( " \
+                        "SELECT i.SN AS ESN, i.AC, i.TRANSACTION_DATE AS INSTALL_DATE, " \
+                        "NVL( ( SELECT MIN( r.TRANSACTION_DATE ) FROM REMOVALS r " \
+                            "WHERE r.SN = i.SN AND r.AC = i.AC AND r.TRANSACTION_DATE >= i.TRANSACTION_DATE " \
+                            "AND r.TRANSACTION_DATE <= " + TO_DATE + " AND " + removes + " ), " + \
+                            TO_DATE + " ) AS REMOVAL_DATE " \
+                        "FROM INSTALLS i " \
+                        "WHERE i.TRANSACTION_DATE <= " + TO_DATE + " AND " + installs + " " \
+                    ") ), " \
+                "ROUTES AS ( SELECT AC, MIN( FLIGHT_DATE ) AS BOUNDARY FROM odb.AC_ACTUAL_FLIGHTS GROUP BY AC ), " \
+                "SLICES AS ( " + flight_slice.format('AC_ACTUAL_FLIGHTS') + "UNION ALL " + \
+                    flight_slice.format('AC_ACTUAL_FLIGHTS_HD') + \
+                    "LEFT JOIN ROUTES b ON ( b.AC = f.AC ) " \
+                    "WHERE ( b.BOUNDARY IS NULL OR f.FLIGHT_DATE < b.BOUNDARY ) ) " \
+                "SELECT ESN, INSTALLED_AC, BLAH, SUM( FLIGHT_HOURS ) AS FLIGHT_HOURS, " \
+                "SUM( FLIGHT_CYCLES ) AS FLIGHT_CYCLES " \
+                "FROM SLICES " \
+                "GROUP BY ESN, AC, INSTALL_DATE, INSTALLED_AC, BLAH " \
+                "ORDER BY ESN, INSTALL_DATE, BLAH"
+
+        end = [self.endDate]
+        return query, end * 2 + remove_params + end * 2 + install_params
+
+    @staticmethod
+    def _sort_key(tail_codes, timestamps):
+        """
+        Combines an integer aircraft code and a timestamp (whole seconds) into one sortable int64 key.
+        """
+        seconds = pd.to_datetime(pd.Series(timestamps)).values.astype('datetime64[s]').astype(np.int64)
+        return np.asarray(tail_codes, dtype=np.int64) * 10 ** 10 + seconds
+
+    def _pivot_esn_history(self, df_result):
+        """
+        Totals the ESN attribution records for the requested month and lifetime (see month_totals()) and adds
+        INSTALLED_AC.
+        :param df_result: dataframe with ESN, INSTALLED_AC, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES
+        :return: dataframe with flight hours and cycles for each ESN, filtered to YYYY-MM with totals
+        """
+        with self.session.profile('engine.totals') as span:
+            piv = self.month_totals(df_result, 'ESN')
+            installed_ac = df_result.loc[df_result['YYYY-MM'] == self.yyyymm]
+            installed_ac = schema.to_display(installed_ac[['ESN', 'INSTALLED_AC']])
+
+            return span.record(self._merge_installed_ac(piv, installed_ac))
+
+    @staticmethod
+    def _merge_installed_ac(piv, installed_ac):
+        installed_ac = installed_ac.set_index('ESN')
+        # The sheet's columns are the (value, period) tuples of the pivot followed by INSTALLED_AC.  Merging the
+        # two-level pivot with single-level columns gives the same but is deprecated, flatten them first.
+        piv = piv.set_axis(pd.Index(list(piv.columns), tupleize_cols=False), axis=1)
         df_out = piv.merge(installed_ac, how='outer', left_index=True, right_index=True)
 
         return df_out.sort_values(by='INSTALLED_AC')
 
+    def run_periods(self, periods):
+        """
+        Engine report for several months from a single pass over the flight history, see reports.batch.
+        Totals are cumulative as of the end of each month and INSTALLED_AC is the aircraft the ESN was on at the end
+        of the month (SPARE otherwise).
+        :param periods: list of YYYY-MM, none after the month of end_date
+        :return: dictionary of YYYY-MM and dataframe laid out like run()
+        """
+        print("Collecting Engine Data...")
+        pairs = self._get_install_removal_pairs().reset_index(drop=True)
+        acs = list(pairs['AC'].dropna().unique())
+        records = self._attribute_flight_records(pairs, self.get_flights(acs, end=self.endDate))
+
+        monthly = records.groupby(['PAIR', 'YYYY-MM'], sort=True, observed=True)[['FLIGHT_HOURS', 'FLIGHT_CYCLES']]\
+            .sum().reset_index()
+        monthly = schema.to_display(monthly)
+        monthly['ESN'] = pairs['ESN'].values[monthly['PAIR'].values]
+
+        # Pairs still open at the end of the run have REMOVAL_DATE == end_date
+        still_installed = pairs['REMOVAL_DATE'].astype(str) == self.endDate
+
+        out = OrderedDict()
+        for period in periods:
+            period_end = pd.Period(period, freq='M').end_time.floor('S')
+            rows = monthly.loc[monthly['YYYY-MM'] == period]
+            pair = rows['PAIR'].values
+            installed = still_installed.values[pair] | (pairs['REMOVAL_DATE'].values[pair] > period_end)
+            installed_ac = pd.DataFrame({'ESN': rows['ESN'].values,
+                                         'INSTALLED_AC': np.where(installed, pairs['AC'].values[pair], 'SPARE')})
+            out[period] = self._merge_installed_ac(self.month_totals(monthly, 'ESN', period), installed_ac)
+        return out
+
+    def get_esn_month(self):
+        """
+        Flight hours and cycles of each ESN between start_date and end_date only, attributed to the install/removal
+        pairs like run_periods().  Used to close a month from the previous month's totals, see reports.monthclose.
+        :return: tuple of a dataframe indexed by ESN with FLIGHT_HOURS and FLIGHT_CYCLES, and a dataframe with ESN and
+                 INSTALLED_AC (the aircraft at end_date, SPARE otherwise) for each pair that flew
+        """
+        pairs = self._get_install_removal_pairs().reset_index(drop=True)
+        acs = list(pairs['AC'].dropna().unique())
+        records = self._attribute_flight_records(pairs, self.get_flights(acs, start=self.startDate, end=self.endDate))
+
+        monthly = records.groupby('PAIR', sort=True)[['FLIGHT_HOURS', 'FLIGHT_CYCLES']].sum()
+        pair = monthly.index.values
+        esn = pd.Index(pairs['ESN'].values[pair], name='ESN')
+        month = monthly.set_index(esn).groupby(level='ESN', sort=True).sum()
+
+        # Pairs still open at end_date have REMOVAL_DATE == end_date
+        installed = pairs['REMOVAL_DATE'].values[pair] >= np.datetime64(pd.Timestamp(self.endDate))
+        installed_ac = pd.DataFrame({'ESN': esn.values,
+                                     'INSTALLED_AC': np.where(installed, pairs['AC'].values[pair], 'SPARE')})
+        return schema.to_display(month), installed_ac
+
+    def run_incremental(self, previous):
+        """
+        run_periods() for a single month from the previous month's closing totals and this month's flights, see
+        reports.monthclose.
+        :param previous: dataframe indexed by ESN with FLIGHT_HOURS and FLIGHT_CYCLES as of the end of the previous month
+        :return: dataframe laid out like run()
+        """
+        print("Collecting Engine Data...")
+        month, installed_ac = self.get_esn_month()
+        return self._merge_installed_ac(self.month_sheet(month, previous), installed_ac)
+
+    def get_removals_periods(self, periods):
+        """
+        get_removals() for several months with one query over the whole range.
+        :param periods: list of YYYY-MM within start_date and end_date
+        :return: dictionary of YYYY-MM and dataframe laid out like get_removals()
+        """
+        removals = self.get_removals()
+        month = pd.to_datetime(removals['TRANS_DATE']).dt.strftime('%Y-%m')
+        return OrderedDict((period, removals.loc[month == period].reset_index(drop=True)) for period in periods)
+
     def run_apply(self):
         """
         Under development.  Uses array formula (pd.apply) instead of for loop for each ESN.
@@ -175,18 +635,11 @@ class Engine(Airframe):
         return self.esn_history
 
     def get_tsi_csi(self, startdate, enddate, ac):
-        query = "SELECT SUM ( " \
-            "ROUND( odb.AC_ACTUAL_FLIGHTS.FLIGHT_HOURS + (odb.AC_ACTUAL_FLIGHTS.FLIGHT_MINUTES / 60), 2)) AS TSI, " \
-            "COUNT( odb.AC_ACTUAL_FLIGHTS.CYCLES ) AS CSI " \
-            "FROM odb.AC_ACTUAL_FLIGHTS " \
-            "WHERE ( ( odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE + " \
-                "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_HOUR, 0) / 24 ) + " \
-                "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_MINUTE, 0) / 1440 )) >= to_date('{}', 'YYYY-MM-DD HH24:MI:SS')) " \
-            "AND ( ( odb.AC_ACTUAL_FLIGHTS.FLIGHT_DATE + " \
-                "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_HOUR, 0) / 24 ) + " \
-                "( NVL( odb.AC_ACTUAL_FLIGHTS.TO_MINUTE, 0) / 1440 )) < to_date('{}', 'YYYY-MM-DD HH24:MI:SS')) " \
-            "AND ( odb.AC_ACTUAL_FLIGHTS.AC = '{}' ) ".format(startdate, enddate, ac)
-
-        df = pd.read_sql(query, self.trax)
+        query = Query('AC_ACTUAL_FLIGHTS', ['SUM( ROUND( FLIGHT_HOURS + ( FLIGHT_MINUTES / 60 ), 2 ) ) AS TSI',
+                                            'COUNT( CYCLES ) AS CSI']) \
+            .flights_between(startdate, enddate, include_end=False) \
+            .where('AC = ?', ac)
+
+        df = self.read_sql(query.sql, params=query.params)
         # print(pd.Series(df['TSI'][0], int(df['CSI'][0])))
         return df['TSI'][0], int(df['CSI'][0])
@@ -0,0 +1,156 @@
+__author__ = "evfairchild"
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from reports.query import TO_DATE
+
+# Rule set used when the session does not name one
+DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exclusions.json')
+
+# Transaction columns a rule can match on, a rule matches a record when every one of its columns does
+FIELDS = ('SN', 'AC', 'POSITION', 'TRANSACTION_DATE')
+KINDS = ('install', 'remove')
+
+# Columns of find_anomalies()
+ANOMALY_COLUMNS = ['ANOMALY', 'KIND', 'SN', 'AC', 'POSITION', 'TRANSACTION_DATE', 'DETAIL']
+
+
+class ExclusionRules(object):
+    """
+    Known bad engine transaction records, left out before installs and removals are paired.  Each rule names the
+    values of one or more of the FIELDS (a value or a list of values) and optionally the kind of transaction it applies
+    to, ex. in exclusions.json:
+        {"rules": [{"name": "ESN 397549", "reason": "Erroneous ESN entry", "transactions": "install", "SN": "397549"},
+                   {"name": "...", "SN": ["643151", "643152"], "TRANSACTION_DATE": "2010-09-27 00:00:00"}]}
+    mask() evaluates every rule over whole columns, sql() writes the same rules as a WHERE clause for the push-down
+    query.
+    """
+    def __init__(self, rules=()):
+        """
+        :param rules: list of rule dictionaries, see the class docstring
+        """
+        self.rules = [self._check(dict(rule)) for rule in rules]
+
+    @classmethod
+    def load(cls, source=None):
+        """
+        :param source: JSON file with a 'rules' list, None for reports/exclusions.json.  ExclusionRules are returned
+                       as they are.
+        :return: ExclusionRules
+        """
+        if isinstance(source, ExclusionRules):
+            return source
+        with open(source if source is not None else DEFAULT) as f:
+            return cls(json.load(f)['rules'])
+
+    @staticmethod
+    def _check(rule):
+        fields = [key for key in rule if key in FIELDS]
+        unknown = [key for key in rule if key not in FIELDS and key not in ('name', 'reason', 'transactions')]
+        if unknown or not fields:
+            raise ValueError("Exclusion rule {} invalid, it needs one or more of {} and nothing else ({})."
+                             .format(rule.get('name', rule), ', '.join(FIELDS), ', '.join(unknown)))
+        if rule.get('transactions', 'all') not in KINDS + ('all',):
+            raise ValueError("Exclusion rule {} transactions {} invalid.".format(rule.get('name', rule),
+                                                                                 rule['transactions']))
+        for field in fields:
+            values = rule[field] if type(rule[field]) == list else [rule[field]]
+            rule[field] = [str(pd.Timestamp(v)) if field == 'TRANSACTION_DATE' else str(v) for v in values]
+        return rule
+
+    def _rules(self, kind):
+        if kind not in KINDS:
+            raise ValueError("Transaction kind {} invalid.".format(kind))
+        return [rule for rule in self.rules if rule.get('transactions', 'all') in (kind, 'all')]
+
+    @property
+    def digest(self):
+        """
+        :return: short hash of the rules, kept with anything built from the filtered records
+        """
+        return hashlib.sha1(json.dumps(self.rules, sort_keys=True).encode()).hexdigest()[:12]
+
+    def mask(self, df, kind):
+        """
+        :param df: transactions with the FIELDS the rules use
+        :param kind: 'install' or 'remove'
+        :return: boolean Series, True for the records excluded by a rule
+        """
+        excluded = np.zeros(len(df), dtype=bool)
+        for rule in self._rules(kind):
+            match = np.ones(len(df), dtype=bool)
+            for field in FIELDS:
+                if field not in rule:
+                    continue
+                if field == 'TRANSACTION_DATE':
+                    match &= pd.to_datetime(df[field]).isin(pd.to_datetime(rule[field])).values
+                else:
+                    match &= df[field].astype(str).isin(rule[field]).values
+            excluded |= match
+        return pd.Series(excluded, index=df.index)
+
+    def apply(self, df, kind):
+        """
+        :return: 'df' without the records excluded by a rule, see mask()
+        """
+        return df.loc[~self.mask(df, kind)]
+
+    def sql(self, alias, kind):
+        """
+        :param alias: table alias of the transaction columns, ex. i for i.SN
+        :param kind: 'install' or 'remove'
+        :return: SQL condition keeping the records no rule excludes and its bind parameters
+        """
+        clauses, params = [], []
+        for rule in self._rules(kind):
+            conditions = []
+            for field in FIELDS:
+                if field not in rule:
+                    continue
+                marker = TO_DATE if field == 'TRANSACTION_DATE' else '?'
+                conditions.append("{}.{} IN ( {} )".format(alias, field, ', '.join([marker] * len(rule[field]))))
+                params += rule[field]
+            clauses.append("NOT ( " + " AND ".join(conditions) + " )")
+        return "( " + " AND ".join(clauses or ['1 = 1']) + " )", params
+
+
+def find_anomalies(installs, removals, pairs):
+    """
+    Suspect records left after the exclusion rules, found with a sort and a few shifted comparisons:
+        repeated install        an install of an ESN on an aircraft it was already installed on (not removed since)
+        removal without install a removal of an ESN from an aircraft it was not installed on
+        ESN on two aircraft     an install of an ESN still installed on another aircraft
+        position taken          an install on an aircraft position another ESN was still installed on
+    :param installs: install transactions with SN, AC, TRANSACTION_DATE and POSITION
+    :param removals: same for the removals
+    :param pairs: install/removal pairs of them, see reports.installindex.pair_transactions()
+    :return: dataframe with ANOMALY_COLUMNS, one row per suspect record ordered by TRANSACTION_DATE
+    """
+    cols = ['SN', 'AC', 'POSITION', 'TRANSACTION_DATE']
+    events = pd.concat([installs[cols].assign(KIND='install'), removals[cols].assign(KIND='remove')],
+                       ignore_index=True)
+    # An install and removal at the same time pair, the install goes first
+    events = events.sort_values(by=['SN', 'AC', 'TRANSACTION_DATE', 'KIND'], kind='mergesort', ignore_index=True)
+    same = (events['SN'] == events['SN'].shift()) & (events['AC'] == events['AC'].shift())
+    previous = events['KIND'].shift()
+
+    found = [events.loc[(events['KIND'] == 'install') & same & (previous == 'install')]
+             .assign(ANOMALY='repeated install', DETAIL=None),
+             events.loc[(events['KIND'] == 'remove') & (~same | (previous == 'remove'))]
+             .assign(ANOMALY='removal without install', DETAIL=None)]
+
+    for anomaly, keys, other in (('ESN on two aircraft', ['ESN'], 'AC'), ('position taken', ['AC', 'POSITION'], 'ESN')):
+        df = pairs.sort_values(by=keys + ['INSTALL_DATE'], kind='mergesort', ignore_index=True)
+        before = df.shift()
+        overlap = (df[keys] == before[keys]).all(axis=1) & (df[other] != before[other]) & \
+            (before['REMOVAL_DATE'].isnull() | (df['INSTALL_DATE'] < before['REMOVAL_DATE']))
+        detail = before.loc[overlap, 'ESN'] + ' on ' + before.loc[overlap, 'AC'] + ' since ' + \
+            before.loc[overlap, 'INSTALL_DATE'].dt.strftime('%Y-%m-%d %H:%M')
+        found.append(df.loc[overlap].rename(columns={'ESN': 'SN', 'INSTALL_DATE': 'TRANSACTION_DATE'})
+                     .assign(ANOMALY=anomaly, KIND='install', DETAIL=detail))
+
+    df = pd.concat([f[ANOMALY_COLUMNS] for f in found], ignore_index=True)
+    return df.sort_values(by=['TRANSACTION_DATE', 'SN'], kind='mergesort', ignore_index=True)
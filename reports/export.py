@@ -0,0 +1,242 @@
+__author__ = "evfairchild"
+
+import os
+import csv
+import pandas as pd
+from reports.profiler import stage
+from reports.schema import to_display
+
+FORMATS = ('xlsx', 'parquet', 'csv')
+
+
+def column_label(column):
+    """
+    :param column: column name, a tuple for the (FLIGHT_HOURS, YYYY-MM) pivot columns
+    :return: flat string name, ex. 'FLIGHT_HOURS 2020-03'
+    """
+    if isinstance(column, tuple):
+        return ' '.join(str(c) for c in column)
+    return str(column)
+
+
+def header_rows(df, repeat_labels=False):
+    """
+    Header rows in the layout DataFrame.to_excel writes: one row per column level with the level name in the index
+    column, and for multi level columns one more row holding the index name.
+    :param df: dataframe
+    :param repeat_labels: repeat the upper level labels on every column (to_csv) instead of only the first column of
+                          each group, which to_excel merges
+    :return: list of rows
+    """
+    if not isinstance(df.columns, pd.MultiIndex):
+        return [[df.index.name] + [str(c) if isinstance(c, tuple) else c for c in df.columns]]
+
+    rows = []
+    for level, name in enumerate(df.columns.names):
+        labels = list(df.columns.get_level_values(level))
+        row = [name]
+        for i, label in enumerate(labels):
+            upper = [tuple(df.columns[j][:level + 1]) for j in (i - 1, i)] if i else None
+            if repeat_labels or level == df.columns.nlevels - 1 or upper is None or upper[0] != upper[1]:
+                row.append(label)
+            else:
+                row.append(None)
+        rows.append(row)
+    rows.append([df.index.name] + [None] * len(df.columns))
+    return rows
+
+
+def iter_chunks(frames, chunksize):
+    """
+    :param frames: dataframe or iterable of dataframes with the same columns
+    :param chunksize: maximum rows per chunk
+    :return: generator of dataframes in the display types (see reports.schema), an empty dataframe is passed through
+             so the sheet still gets its header
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for df in frames:
+        for start in range(0, max(len(df), 1), chunksize):
+            yield to_display(df.iloc[start:start + chunksize])
+
+
+def iter_rows(chunk):
+    """
+    :param chunk: dataframe
+    :return: generator of rows (index value first) with numpy scalars as python values and missing values as None
+    """
+    values = chunk.astype(object).where(pd.notnull(chunk), None)
+    index = [None if pd.isnull(i) else i for i in chunk.index]
+    for i, row in zip(index, values.itertuples(index=False, name=None)):
+        yield [i] + list(row)
+
+
+class ReportWriter(object):
+    """
+    Writes report sheets one chunk of rows at a time, so the memory used by the writer does not grow with the size of
+    the sheet.  Use open_writer() to get the writer for a format.
+        with open_writer('utilization_2020-03.xlsx') as writer:
+            for sheet_name, df in sheets.items():
+                writer.write(sheet_name, df)
+    """
+    extension = None
+
+    def __init__(self, path, chunksize=10000):
+        """
+        :param path: output file, for formats with one file per sheet the sheet name is added to the file name
+        :param chunksize: rows converted and written at a time
+        """
+        self.path = path
+        self.chunksize = chunksize
+        self.files = []
+
+    def sheet_path(self, sheet_name):
+        """
+        :return: output file for a sheet, ex. utilization_2020-03_airframe.csv
+        """
+        root = os.path.splitext(self.path)[0]
+        return "{}_{}.{}".format(root, sheet_name.replace(' ', '_'), self.extension)
+
+    def write(self, sheet_name, frames):
+        """
+        :param sheet_name: ex. airframe
+        :param frames: dataframe, or iterable of dataframes with the same columns to stream a sheet
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        :return: list of files written
+        """
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class XlsxWriter(ReportWriter):
+    """
+    Excel workbook through openpyxl's write-only mode, rows are flushed to disk as they are appended.  The cell values
+    and header rows are the ones DataFrame.to_excel writes, the multi level headers are not merged.
+    """
+    extension = 'xlsx'
+
+    def __init__(self, path, chunksize=10000):
+        from openpyxl import Workbook
+        super(XlsxWriter, self).__init__(path, chunksize)
+        self.workbook = Workbook(write_only=True)
+
+    def write(self, sheet_name, frames):
+        sheet = self.workbook.create_sheet(title=sheet_name)
+        header = False
+        for chunk in iter_chunks(frames, self.chunksize):
+            if not header:
+                for row in header_rows(chunk):
+                    sheet.append(row)
+                header = True
+            for row in iter_rows(chunk):
+                sheet.append(row)
+
+    def close(self):
+        if self.path not in self.files:
+            self.workbook.save(self.path)
+            self.files.append(self.path)
+        return self.files
+
+
+class CsvWriter(ReportWriter):
+    """
+    One CSV file per sheet with the header rows DataFrame.to_csv writes.
+    """
+    extension = 'csv'
+
+    def write(self, sheet_name, frames):
+        path = self.sheet_path(sheet_name)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            header = False
+            for chunk in iter_chunks(frames, self.chunksize):
+                if not header:
+                    writer.writerows(header_rows(chunk, repeat_labels=True))
+                    header = True
+                writer.writerows(iter_rows(chunk))
+        self.files.append(path)
+
+
+class ParquetWriter(ReportWriter):
+    """
+    One Parquet file per sheet, a row group per chunk.  Parquet needs flat string column names, the pivot columns are
+    flattened with column_label() and the index is written as the first column.  The schema comes from the whole sheet
+    when it is a dataframe, and from the first chunk when it is streamed.
+    """
+    extension = 'parquet'
+
+    @staticmethod
+    def _flatten(df):
+        df = to_display(df).copy(deep=False)
+        df.columns = [column_label(c) for c in df.columns]
+        df.index.name = df.index.name or 'index'
+        return df.reset_index()
+
+    def write(self, sheet_name, frames):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self.sheet_path(sheet_name)
+        schema = None
+        if isinstance(frames, pd.DataFrame):
+            schema = pa.Schema.from_pandas(self._flatten(frames), preserve_index=False)
+
+        writer = None
+        try:
+            for chunk in iter_chunks(frames, self.chunksize):
+                table = pa.Table.from_pandas(self._flatten(chunk), schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        self.files.append(path)
+
+
+WRITERS = {'xlsx': XlsxWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+def open_writer(path, fmt=None, chunksize=10000):
+    """
+    :param path: output file, ex. utilization_2020-03.xlsx
+    :param fmt: xlsx, parquet or csv, taken from the file extension when None
+    :param chunksize: rows converted and written at a time
+    :return: ReportWriter
+    """
+    fmt = (fmt or os.path.splitext(path)[1].lstrip('.') or 'xlsx').lower()
+    if fmt not in WRITERS:
+        raise ValueError("Unknown export format '{}', expected one of {}".format(fmt, ', '.join(FORMATS)))
+    return WRITERS[fmt](path, chunksize=chunksize)
+
+
+def export(sheets, path, fmt=None, chunksize=10000, profiler=None):
+    """
+    :param sheets: ordered dictionary of sheet name and dataframe (or iterable of dataframes)
+    :param path: output file, ex. utilization_2020-03.xlsx
+    :param fmt: xlsx, parquet or csv, taken from the file extension when None
+    :param chunksize: rows converted and written at a time
+    :param profiler: optional reports.profiler.Profiler, each sheet is timed as an 'export <fmt>' stage
+    :return: list of files written
+    """
+    with open_writer(path, fmt, chunksize) as writer:
+        name = "export " + type(writer).__name__.replace('Writer', '').lower()
+        for sheet_name, df in sheets.items():
+            with stage(profiler, name, sheet=sheet_name) as span:
+                writer.write(sheet_name, df)
+                if isinstance(df, pd.DataFrame):
+                    span.record(df)
+        # The workbook is saved here
+        with stage(profiler, name + " close"):
+            writer.close()
+    return writer.files
@@ -0,0 +1,223 @@
+__author__ = "evfairchild"
+
+import os
+import json
+import hashlib
+import pandas as pd
+from collections import OrderedDict
+from datetime import datetime
+from reports.backend import Backend
+from reports.exclusions import ExclusionRules
+from reports.query import Query, TO_DATE
+
+# Bump when a report changes, so that the sheets stored by an older version are computed again
+VERSION = 3
+
+# dataset: columns the checksums are taken per (with the month), so that a record moved to another tail, ESN or
+# position, or an INSTALL changed to a REMOVE, changes the fingerprint too
+IDENTITY = {'flights': ['AC'],
+            'transactions': ['SN', 'PN', 'AC', 'POSITION', 'TRANSACTION_TYPE']}
+IDENTITY['flights_hd'] = IDENTITY['flights']
+
+# dataset: (checksum column, SQL sum, its terms from the table rows).  Whole numbers, so that TRAX and the cache add
+# up to the same checksums.  DAYS is the day of the month, for a record moved within its month
+CHECKSUMS = {
+    'flights': [('DAYS', "SUM( to_char( FLIGHT_DATE, 'DD' ) * 1 )", lambda df: df['FLIGHT_DATE'].dt.day),
+                ('MINUTES', "SUM( FLIGHT_HOURS * 60 + FLIGHT_MINUTES )",
+                 lambda df: df['FLIGHT_HOURS'] * 60 + df['FLIGHT_MINUTES']),
+                ('CYCLES', "SUM( CYCLES )", lambda df: df['CYCLES']),
+                ('TAKEOFF', "SUM( NVL( TO_HOUR, 0 ) * 60 + NVL( TO_MINUTE, 0 ) )",
+                 lambda df: df['TO_HOUR'].fillna(0) * 60 + df['TO_MINUTE'].fillna(0))],
+    'transactions': [('DAYS', "SUM( to_char( TRANSACTION_DATE, 'DD' ) * 1 )", lambda df: df['TRANSACTION_DATE'].dt.day),
+                     ('TIME', "SUM( NVL( TRANSACTION_HOUR, 0 ) * 60 + NVL( TRANSACTION_MINUTE, 0 ) )",
+                      lambda df: df['TRANSACTION_HOUR'].fillna(0) * 60 + df['TRANSACTION_MINUTE'].fillna(0)),
+                     ('INSTALLED', "SUM( NVL( HOURS_INSTALLED, 0 ) * 60 + NVL( MINUTES_INSTALLED, 0 ) )",
+                      lambda df: df['HOURS_INSTALLED'].fillna(0) * 60 + df['MINUTES_INSTALLED'].fillna(0)),
+                     ('CYCLES', "SUM( NVL( CYCLES_INSTALLED, 0 ) )", lambda df: df['CYCLES_INSTALLED'].fillna(0))]}
+CHECKSUMS['flights_hd'] = CHECKSUMS['flights']
+
+# Sheet: datasets it is built from (reports.backend.Backend.DATASETS)
+SHEETS = OrderedDict([('airframe', ('flights', 'flights_hd')),
+                      ('engines', ('flights', 'flights_hd', 'transactions')),
+                      ('removals', ('transactions', ))])
+
+
+def digest(*parts):
+    """
+    :return: hex digest of JSON serializable parts
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def table_fingerprints(session, end_date):
+    """
+    Row count, last date and CHECKSUMS of every month and IDENTITY of the datasets up to the month of 'end_date', ex.
+    of each tail's flights in a month, one GROUP BY query per table (or the synced cache).  Memoized per session.
+    :param session: reports.session.Session
+    :param end_date: ex. 2020-03-31 23:59:59, the later months are not read
+    :return: dictionary of dataset and dataframe with MONTH (YYYY-MM), the IDENTITY columns, RECORDS, LAST_DATE and
+             the checksum columns, plus 'tails' with the sorted AC_MASTER registrations
+    """
+    # First day after the month of end_date
+    until = (pd.Timestamp(end_date[0:7] + '-01') + pd.DateOffset(months=1)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def read():
+        tables = {}
+        for dataset in CHECKSUMS:
+            with session.profile('fingerprint', dataset=dataset) as span:
+                tables[dataset] = span.record(_read_dataset(session, dataset, until))
+        with session.profile('fingerprint', dataset='tails'):
+            tails = session.read_sql(Query('AC_MASTER', ['AC']).sql)
+        tables['tails'] = sorted(tails['AC'].astype(str))
+        return tables
+    return session.memo(('fingerprints', session.cache is not None, until), read)
+
+
+def _read_dataset(session, dataset, until):
+    table, date_col, columns, where = Backend.DATASETS[dataset]
+    checksums, identity = CHECKSUMS[dataset], IDENTITY[dataset]
+    if session.cache is not None:
+        df = session.cache.read(table).copy()
+        df[date_col] = pd.to_datetime(df[date_col])
+        df = df.loc[df[date_col] < pd.Timestamp(until)]
+        sums = pd.DataFrame({name: terms(df) for name, sql, terms in checksums})
+        sums['MONTH'], sums['RECORDS'], sums['LAST_DATE'] = df[date_col].dt.strftime('%Y-%m'), 1, df[date_col]
+        for col in identity:
+            # groupby() leaves out missing keys
+            sums[col] = df[col].astype(object).where(df[col].notnull(), '')
+        out = sums.groupby(['MONTH'] + identity).agg(dict([('RECORDS', 'sum'), ('LAST_DATE', 'max')] +
+                                                          [(name, 'sum') for name, sql, terms in checksums]))
+        out = out.reset_index()
+    else:
+        month = "to_char({}, 'YYYY-MM')".format(date_col)
+        query = Query(table, [month + ' AS MONTH'] + identity +
+                      ['COUNT(*) AS RECORDS', 'MAX( {} ) AS LAST_DATE'.format(date_col)] +
+                      ['{} AS {}'.format(sql, name) for name, sql, terms in checksums]).group_by(month, *identity)
+        query.where("{} < {}".format(date_col, TO_DATE), until)
+        if where:
+            query.where(where)
+        out = session.read_sql(query.sql, params=query.params)
+
+    for col in identity:
+        out[col] = out[col].astype(object).where(out[col].notnull(), '').astype(str)
+    out = out.sort_values(by=['MONTH'] + identity, ignore_index=True)
+    out['RECORDS'] = out['RECORDS'].astype('int64')
+    out['LAST_DATE'] = pd.to_datetime(out['LAST_DATE']).dt.strftime('%Y-%m-%d %H:%M:%S')
+    for name, sql, terms in checksums:
+        out[name] = pd.to_numeric(out[name]).astype('float64').fillna(0).round(3)
+    return out[['MONTH'] + identity + ['RECORDS', 'LAST_DATE'] + [name for name, sql, terms in checksums]]
+
+
+def sheet_fingerprints(session, start_date, end_date, **settings):
+    """
+    Fingerprint of the inputs of each sheet of the report for 'start_date' to 'end_date':
+        airframe    every flight month up to the end of the period (lifetime totals) and the AC_MASTER tails
+        engines     every flight and engine transaction month up to the end of the period (later records are left
+                    out of the pairs), the tails and the exclusion rules
+        removals    the engine transactions of the months in the period
+    :param session: reports.session.Session
+    :param start_date: ex. 2020-03-01 00:00:00
+    :param end_date: ex. 2020-03-31 23:59:59
+    :param settings: anything else the engines sheet depends on, ex. engine_mode='vectorized'
+    :return: ordered dictionary of sheet name and hex digest
+    """
+    tables = table_fingerprints(session, end_date)
+    first, last = start_date[0:7], end_date[0:7]
+
+    fingerprints = OrderedDict()
+    for sheet, datasets in SHEETS.items():
+        parts = {'version': VERSION, 'start': start_date, 'end': end_date}
+        for dataset in datasets:
+            df = tables[dataset]
+            if sheet == 'removals':
+                df = df.loc[(df['MONTH'] >= first) & (df['MONTH'] <= last)]
+            else:
+                df = df.loc[df['MONTH'] <= last]
+            parts[dataset] = df.values.tolist()
+        if sheet != 'removals':
+            parts['tails'] = tables['tails']
+        if sheet == 'engines':
+            parts['exclusions'] = ExclusionRules.load(session.exclusions).digest
+            parts.update(settings)
+        fingerprints[sheet] = digest(parts)
+    return fingerprints
+
+
+class ResultStore(object):
+    """
+    Sheets of earlier runs, kept with the fingerprint of their inputs (see sheet_fingerprints()), one Parquet file per
+    sheet and period, ex. results/engines_2020-03-01_2020-03-31.parquet.  results.json records the fingerprints, the
+    pivot columns Parquet cannot name (ex. ('FLIGHT_HOURS', '2020-03')) and the exported files, so an unchanged report
+    is neither computed nor written again.
+    """
+    def __init__(self, directory='results'):
+        self.directory = directory
+        self.meta_file = os.path.join(directory, 'results.json')
+        self.meta = self._read_meta()
+
+    def _read_meta(self):
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as f:
+                return json.load(f)
+        return {}
+
+    def _write_meta(self):
+        with open(self.meta_file, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @staticmethod
+    def key(start_date, end_date):
+        return "{}_{}".format(start_date[0:10], end_date[0:10])
+
+    def path(self, sheet, key):
+        return os.path.join(self.directory, "{}_{}.parquet".format(sheet, key))
+
+    def load(self, sheet, key, fingerprint):
+        """
+        :param sheet: airframe, engines or removals
+        :param key: period, see key()
+        :param fingerprint: fingerprint of the sheet's inputs now
+        :return: stored dataframe, None if there is none or its inputs have changed since
+        """
+        stored = self.meta.get('sheets', {}).get(key, {}).get(sheet, {})
+        if stored.get('fingerprint') != fingerprint or not os.path.exists(self.path(sheet, key)):
+            return None
+        df = pd.read_parquet(self.path(sheet, key))
+        if stored.get('columns') is not None:
+            df.columns = pd.Index([tuple(c) if isinstance(c, list) else c for c in stored['columns']],
+                                  tupleize_cols=False)
+        return df
+
+    def save(self, sheet, key, df, fingerprint):
+        os.makedirs(self.directory, exist_ok=True)
+        # Flat columns holding tuples, ex. the engines sheet, are written by position and named again by load()
+        columns = None
+        if not isinstance(df.columns, pd.MultiIndex) and any(isinstance(c, tuple) for c in df.columns):
+            columns = [list(c) if isinstance(c, tuple) else c for c in df.columns]
+            df = df.set_axis([str(i) for i in range(len(columns))], axis=1)
+        df.to_parquet(self.path(sheet, key))
+        self.meta.setdefault('sheets', {}).setdefault(key, {})[sheet] = {
+            'fingerprint': fingerprint, 'rows': len(df), 'columns': columns,
+            'written': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        self._write_meta()
+
+    def exported(self, path, fingerprint):
+        """
+        :param path: output file, ex. utilization_2020-03.xlsx
+        :return: list of the files record_export() saw written to 'path' from inputs with the same 'fingerprint', None
+                 if there are none or one of them is gone
+        """
+        export = self.meta.get('exports', {}).get(os.path.abspath(path), {})
+        if export.get('fingerprint') != fingerprint or not all(os.path.exists(f) for f in export['files']):
+            return None
+        return export['files']
+
+    def record_export(self, path, fingerprint, files):
+        """
+        :param path: output file
+        :param fingerprint: fingerprint of every sheet's inputs and the format
+        :param files: files written, a file per sheet for csv and parquet
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.meta.setdefault('exports', {})[os.path.abspath(path)] = {'fingerprint': fingerprint, 'files': files}
+        self._write_meta()
@@ -0,0 +1,254 @@
+__author__ = "evfairchild"
+
+import pandas as pd
+from reports import schema
+from reports.accumulator import RunningTotals
+from reports.profiler import stage
+from reports.query import Query, date_param, in_list, FLIGHT_DATETIME, FLIGHT_HOURS, FLIGHT_MONTH, TO_DATE
+
+CURRENT = 'AC_ACTUAL_FLIGHTS'
+ARCHIVE = 'AC_ACTUAL_FLIGHTS_HD'
+
+# Columns of FlightSource.flights() and their select expressions
+COLUMNS = ['AC', 'FLIGHT_DATETIME', 'YYYY-MM', 'FLIGHT_HOURS', 'FLIGHT_CYCLES']
+SELECT = ['AC', FLIGHT_DATETIME + ' AS FLIGHT_DATETIME', FLIGHT_MONTH + ' AS BLAH', FLIGHT_HOURS + ' AS FLIGHT_HOURS',
+          'CYCLES AS FLIGHT_CYCLES']
+
+# Group by columns of FlightSource.totals() and their select expressions
+KEYS = {'AC': 'AC', 'YYYY-MM': FLIGHT_MONTH}
+
+
+class FlightSource(object):
+    """
+    The flight records of AC_ACTUAL_FLIGHTS and of its archive AC_ACTUAL_FLIGHTS_HD as one source.  TRAX moves the
+    older flights of a tail to the archive table, so every tail's history is split at a date, its BOUNDARY: the first
+    FLIGHT_DATE left in AC_ACTUAL_FLIGHTS.  Flights before the boundary are read from AC_ACTUAL_FLIGHTS_HD (every
+    flight of a tail with nothing left in AC_ACTUAL_FLIGHTS) and flights on or after it from AC_ACTUAL_FLIGHTS, so each
+    flight is read from exactly one table and archive rows copied to the current table are not counted twice.
+
+    routes() holds the boundary and the dates each table has flights for, per tail, and is read once per session.
+    A table is then only queried for the tails and dates it has flights for, with a single query per table (the
+    tails sharing a boundary are one condition of the archive query), and an interval straddling the boundary,
+    ex. an engine installed before the archive date and removed after it, is read from both tables.
+        source = FlightSource(session)
+        source.flights(['N521VA'], '2015-06-01 00:00:00', '2016-06-30 23:59:59')
+        source.totals(['AC'], asof='2020-03-31 23:59:59')
+    """
+    def __init__(self, session=None, cache=None):
+        """
+        :param session: reports.session.Session, only None with an offline cache
+        :param cache: optional reports.cache.FlightCache, its tables are read instead of the database
+        """
+        self.session = session
+        self.cache = cache
+        self._routes = None
+
+    def routes(self):
+        """
+        :return: dataframe indexed by AC with FIRST_DATE and LAST_DATE (FLIGHT_DATE range in AC_ACTUAL_FLIGHTS),
+                 HD_FIRST_DATE and HD_LAST_DATE (same in AC_ACTUAL_FLIGHTS_HD) and BOUNDARY (NaT when every flight of
+                 the tail is archived), memoized per session
+        """
+        if self.session is None:
+            if self._routes is None:
+                self._routes = self._read_routes()
+            return self._routes
+        return self.session.memo(('flight_routes', self.cache is not None), self._read_routes)
+
+    def _read_routes(self):
+        with stage(self.session.profiler if self.session is not None else None, 'flights.routes') as span:
+            frames = []
+            for table, prefix in ((CURRENT, ''), (ARCHIVE, 'HD_')):
+                if self.cache is not None:
+                    df = self.cache.flights(table)
+                    df = schema.to_display(df.groupby('AC', observed=True)['FLIGHT_DATE'].agg(['min', 'max'])
+                                           .rename(columns={'min': 'FIRST_DATE', 'max': 'LAST_DATE'}))
+                else:
+                    query = Query(table, ['AC', 'MIN( FLIGHT_DATE ) AS FIRST_DATE',
+                                          'MAX( FLIGHT_DATE ) AS LAST_DATE']).group_by('AC')
+                    df = self.session.read_sql(query.sql, index_col='AC')
+                frames.append(df[['FIRST_DATE', 'LAST_DATE']].apply(pd.to_datetime).add_prefix(prefix))
+
+            df = frames[0].join(frames[1], how='outer')
+            df.index.name = 'AC'
+            df['BOUNDARY'] = df['FIRST_DATE']
+            return span.record(df.sort_index())
+
+    def tails(self, archived=True):
+        """
+        :param archived: include the tails whose flights are all in the archive table (retired)
+        :return: list of every AC with flights in either table, or in AC_ACTUAL_FLIGHTS only
+        """
+        routes = self.routes()
+        return list(routes.index if archived else routes.index[routes['FIRST_DATE'].notnull()])
+
+    def segments(self, acs=None, start=None, end=None, asof=None):
+        """
+        Splits a lookup into one read per table.
+        :param acs: list of AC registrations, None for the whole fleet
+        :param start: first takeoff time, used with end
+        :param end: last takeoff time
+        :param asof: last FLIGHT_DATE, instead of start and end
+        :return: list of (table, groups), groups a list of (tails, boundary) read from the table: tails is a list of
+                 AC or None for every tail, boundary the first FLIGHT_DATE not read (archive table) or None.  The
+                 archive table has a group per boundary date.
+        """
+        routes = self.routes()
+        if acs is not None:
+            acs = sorted(set(ac.upper() for ac in acs))
+            routes = routes.reindex(acs)
+
+        # FLIGHT_DATE range of the lookup, a flight takes off on FLIGHT_DATE before FLIGHT_DATE + 1
+        first = pd.Timestamp(start) - pd.Timedelta(days=1) if start is not None else pd.Timestamp.min
+        last = asof if asof is not None else end
+        last = pd.Timestamp(last) if last is not None else pd.Timestamp.max
+
+        segments = []
+        # The current table is still growing, only its first date is used.  Tails without routes flew since they
+        # were read, or not at all.
+        current = (routes['FIRST_DATE'].isnull() & routes['HD_FIRST_DATE'].isnull()) | (routes['FIRST_DATE'] <= last)
+        if acs is None:
+            segments.append((CURRENT, [(None, None)]))
+        elif current.any():
+            segments.append((CURRENT, [(list(routes.index[current]), None)]))
+
+        archived = (routes['HD_FIRST_DATE'] <= last) & (routes['HD_LAST_DATE'] >= first) & \
+            (routes['BOUNDARY'].isnull() | ((routes['BOUNDARY'] > routes['HD_FIRST_DATE']) &
+                                            (routes['BOUNDARY'] > first)))
+        routes = routes.loc[archived]
+        only = routes['BOUNDARY'].isnull()
+        groups = [(list(routes.index[only]), None)] if only.any() else []
+        for boundary, df in routes.loc[~only].groupby('BOUNDARY', sort=True):
+            groups.append((list(df.index), boundary))
+        if groups:
+            segments.append((ARCHIVE, groups))
+        return segments
+
+    def queries(self, columns, acs=None, start=None, end=None, asof=None):
+        """
+        :param columns: list of select expressions
+        :return: a reports.query.Query for each of segments(), to complete with group_by() / order_by()
+        """
+        queries = []
+        for table, groups in self.segments(acs, start, end, asof):
+            query = Query(table, columns)
+            if len(groups) == 1:
+                tails, boundary = groups[0]
+                if tails is not None:
+                    query.where_in('AC', tails)
+                if boundary is not None:
+                    query.where('FLIGHT_DATE < ' + TO_DATE, date_param(boundary))
+            else:
+                conditions, params = [], []
+                for tails, boundary in groups:
+                    condition, values = in_list('AC', tails)
+                    if boundary is not None:
+                        condition = "( {} ) AND FLIGHT_DATE < {}".format(condition, TO_DATE)
+                        values.append(date_param(boundary))
+                    conditions.append("( {} )".format(condition))
+                    params.extend(values)
+                query.where(' OR '.join(conditions), *params)
+            if asof is not None:
+                query.where('FLIGHT_DATE <= ' + TO_DATE, date_param(asof))
+            elif start is not None:
+                query.flights_between(start, end)
+            elif end is not None:
+                query.flights_until(end)
+            queries.append(query)
+        return queries
+
+    def _cached(self, acs, start, end, asof):
+        """
+        :return: generator of the cached flight records (reports.cache.FlightCache.flights()) of each segment
+        """
+        for table, groups in self.segments(acs, start, end, asof):
+            df = self.cache.flights(table)
+            mask = pd.Series(False, index=df.index)
+            for tails, boundary in groups:
+                group = pd.Series(True, index=df.index)
+                if tails is not None:
+                    group &= df['AC'].isin(tails)
+                if boundary is not None:
+                    group &= df['FLIGHT_DATE'] < boundary
+                mask |= group
+            if asof is not None:
+                mask &= df['FLIGHT_DATE'] <= pd.Timestamp(asof)
+            else:
+                if start is not None:
+                    mask &= df['FLIGHT_DATETIME'] >= pd.Timestamp(start)
+                if end is not None:
+                    mask &= df['FLIGHT_DATETIME'] <= pd.Timestamp(end)
+            yield df.loc[mask]
+
+    def flights(self, acs=None, start=None, end=None):
+        """
+        :param acs: list of AC registrations, None for the whole fleet
+        :param start: first takeoff time included, ex. 2020-03-01 00:00:00.  None for every flight until end.
+        :param end: last takeoff time included, ex. 2020-03-31 23:59:59.  None for every flight.
+        :return: dataframe with AC, FLIGHT_DATETIME, YYYY-MM, FLIGHT_HOURS and FLIGHT_CYCLES sorted by AC and time
+                 (reports.schema types)
+        """
+        if self.cache is not None:
+            frames = [df.drop(columns=['FLIGHT_DATE']) for df in self._cached(acs, start, end, None)]
+        else:
+            frames = []
+            for query in self.queries(SELECT, acs, start, end):
+                df = self.session.read_sql(query.sql, params=query.params)
+                frames.append(schema.compact(df.rename(columns={'BLAH': 'YYYY-MM'})))
+
+        if not frames:
+            return schema.compact(pd.DataFrame({col: [] for col in COLUMNS}))
+        return schema.concat(frames, ignore_index=True).sort_values(by=['AC', 'FLIGHT_DATETIME'], kind='mergesort',
+                                                                    ignore_index=True)
+
+    def iter_flights(self, acs=None, chunksize=None, start=None, end=None):
+        """
+        flights() one chunk at a time, in no particular order.
+        :param acs: list of AC registrations, None for the whole fleet
+        :param chunksize: rows per chunk, defaults to the session's chunksize
+        :param start: first takeoff time included, None for every flight until end
+        :param end: last takeoff time included, None for every flight
+        :return: generator of dataframes with the columns of flights()
+        """
+        chunksize = chunksize or self.session.chunksize
+        if self.cache is not None:
+            # Sliced by tail and date before chunking, without concatenating and sorting the history
+            for df in self._cached(acs, start, end, None):
+                df = df.drop(columns=['FLIGHT_DATE'])
+                for first in range(0, len(df), chunksize):
+                    yield df.iloc[first:first + chunksize]
+            return
+
+        for query in self.queries(SELECT, acs, start, end):
+            for df in self.session.read_sql_chunks(query.sql, chunksize=chunksize, params=query.params):
+                yield schema.compact(df.rename(columns={'BLAH': 'YYYY-MM'}))
+
+    def totals(self, by, acs=None, start=None, end=None, asof=None):
+        """
+        Flight hours and cycles summed over both tables.  A tail and month straddling the boundary is one row.
+        :param by: list of AC and / or YYYY-MM
+        :param acs: list of AC registrations, None for the whole fleet
+        :param start: first takeoff time included, used with end
+        :param end: last takeoff time included, None for every flight
+        :param asof: last FLIGHT_DATE included, instead of start and end
+        :return: dataframe with the 'by' columns, FLIGHT_HOURS and FLIGHT_CYCLES sorted by 'by' (plain types)
+        """
+        values = ['FLIGHT_HOURS', 'FLIGHT_CYCLES']
+        totals = RunningTotals(by, values)
+        if self.cache is not None:
+            for df in self._cached(acs, start, end, asof):
+                totals.add(df)
+            return totals.frame()
+
+        names = ['BLAH' if key == 'YYYY-MM' else key for key in by]
+        columns = ["{} AS {}".format(KEYS[key], name) if KEYS[key] != name else name for key, name in zip(by, names)]
+        columns += ['SUM( {} ) AS FLIGHT_HOURS'.format(FLIGHT_HOURS), 'SUM( CYCLES ) AS FLIGHT_CYCLES']
+        for query in self.queries(columns, acs, start, end, asof):
+            query.group_by(*[KEYS[key] for key in by])
+            if self.session.chunksize:
+                chunks = self.session.read_sql_chunks(query.sql, params=query.params)
+            else:
+                chunks = [self.session.read_sql(query.sql, params=query.params)]
+            for df in chunks:
+                totals.add(df.rename(columns=dict(zip(names, by))))
+        return totals.frame()
@@ -0,0 +1,169 @@
+__author__ = "evfairchild"
+
+import numpy as np
+import pandas as pd
+from reports.timeseries import VALUES
+
+# Measure names, as answered to pkg.customGUI.UserPrompts or written out: column of the series
+MEASURES = {'FH': 'FLIGHT_HOURS', 'FC': 'FLIGHT_CYCLES', 'FLIGHT_HOURS': 'FLIGHT_HOURS',
+            'FLIGHT_CYCLES': 'FLIGHT_CYCLES'}
+
+
+class UtilizationForecast(object):
+    """
+    Utilization rate of every key (AC registration or ESN) from the last months of its monthly history, and the
+    projections of the whole fleet made from them as array operations, one column per key:
+        forecast = Engine(start, end).get_esn_forecast(window=12)
+        forecast.crossing('FC', 20000)                   # date each ESN reaches 20,000 cycles
+        forecast.crossing('FH', 750, relative=True)      # date each ESN has flown another 750 hours
+        forecast.projected(['2020-12-31', '2021-12-31']) # totals at those dates
+    A key's rate counts the days from its first flight only, and every day after it, ex. an ESN on the shelf flies at
+    0 hours a day and an ESN removed for good is never projected to cross.
+    """
+    def __init__(self, series, window=12):
+        """
+        :param series: reports.timeseries.UtilizationSeries, ex. Airframe.get_series() or Engine.get_esn_series()
+        :param window: number of months (the last one up to the end of the series) the rates are averaged over
+        """
+        if window < 1:
+            raise ValueError("The forecast window is at least 1 month, not {}.".format(window))
+        self.series = series
+        self.key = series.key
+        self.keys = series.keys
+        self.window = window
+        self.asof = series.dates[-1] if len(series.dates) else None
+
+        flown = series.utilization('monthly').iloc[-window:]
+
+        # Days from the first day of the window, or of the key's first flight if later, to the end of the series
+        active = np.zeros(len(self.keys))
+        if len(flown):
+            month = flown.index[0]
+            start = max(month - pd.Timedelta(days=month.days_in_month - 1), series.dates[0])
+            first = np.maximum(self._first_days(), np.datetime64(start))
+            active = (np.datetime64(self.asof) - first) / np.timedelta64(1, 'D') + 1
+
+        self.totals, self.rates = {}, {}
+        for value in VALUES:
+            self.totals[value] = series.daily[value].values[-1].astype(np.float64) if len(series.dates) else \
+                np.zeros(len(self.keys))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rate = flown[value].values.sum(axis=0) / active
+            self.rates[value] = np.where(active > 0, rate, 0.)
+
+    def _first_days(self):
+        """
+        :return: datetime64 array of the first day with flights of each key
+        """
+        flown = np.zeros(self.series.daily.shape[0:1] + (len(self.keys), ), dtype=bool)
+        for value in VALUES:
+            flown |= self.series.daily[value].values > 0
+        return self.series.dates.values[np.argmax(flown, axis=0)] if len(self.series.dates) else \
+            np.zeros(len(self.keys), dtype='datetime64[ns]')
+
+    def _positions(self, keys):
+        if keys is None:
+            return np.arange(len(self.keys))
+        keys = [keys] if type(keys) != list else keys
+        keys = [k.upper() if self.key == 'AC' else k for k in keys]
+        positions = self.keys.get_indexer(keys)
+        if (positions < 0).any():
+            missing = [str(k) for k, p in zip(keys, positions) if p < 0]
+            raise LookupError("{} {} invalid.".format(self.key, ', '.join(missing[:5])))
+        return positions
+
+    @staticmethod
+    def _measure(measure):
+        if measure.upper() not in MEASURES:
+            raise ValueError("Measure {} invalid, one of FH or FC.".format(measure))
+        return MEASURES[measure.upper()]
+
+    def get_rates(self, keys=None):
+        """
+        :param keys: AC registration(s) or ESN(s), None for every key
+        :return: dataframe indexed by key with FLIGHT_HOURS and FLIGHT_CYCLES, the totals at the end of the series,
+                 and FH_PER_DAY and FC_PER_DAY
+        """
+        positions = self._positions(keys)
+        return pd.DataFrame({'FLIGHT_HOURS': self.totals[VALUES[0]][positions],
+                             'FLIGHT_CYCLES': self.totals[VALUES[1]][positions].astype(np.int64),
+                             'FH_PER_DAY': self.rates[VALUES[0]][positions],
+                             'FC_PER_DAY': self.rates[VALUES[1]][positions]},
+                            index=pd.Index(self.keys[positions], name=self.key))
+
+    def crossing(self, measure, threshold, relative=False, keys=None):
+        """
+        Date each key reaches 'threshold' at its current rate.  A key past the threshold already gets the day it
+        crossed it, and a key that is not flying (its rate is 0) gets NaT.
+        :param measure: FH or FC
+        :param threshold: number, or a dictionary / series of key and number, ex. the life limit of each ESN's LLPs
+        :param relative: threshold counted from the totals at the end of the series, ex. the next 750 hours
+        :param keys: AC registration(s) or ESN(s), None for every key
+        :return: dataframe indexed by key with TOTAL, RATE (per day), THRESHOLD, REMAINING, DAYS and DATE
+        """
+        value = self._measure(measure)
+        positions = self._positions(keys)
+        if isinstance(threshold, (dict, pd.Series)):
+            threshold = pd.Series(threshold, dtype=np.float64).reindex(self.keys[positions]).values
+        total, rate = self.totals[value][positions], self.rates[value][positions]
+        threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), total.shape)
+        if relative:
+            threshold = total + threshold
+
+        remaining = threshold - total
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days = np.where(remaining <= 0, 0., np.where(rate > 0, remaining / rate, np.nan))
+        dates = self.asof + pd.to_timedelta(np.ceil(days), unit='D') if self.asof is not None else \
+            pd.DatetimeIndex([pd.NaT] * len(positions))
+
+        # Already crossed: the first day the cumulative series reached it
+        crossed = remaining <= 0
+        if crossed.any():
+            history = self.series.daily[value].values[:, positions[crossed]]
+            days_in = np.argmax(history >= threshold[crossed], axis=0)
+            dates = dates.values.copy()
+            dates[crossed] = self.series.dates.values[days_in]
+            days[crossed] = (dates[crossed] - np.datetime64(self.asof)) / np.timedelta64(1, 'D')
+
+        return pd.DataFrame({'TOTAL': total, 'RATE': rate, 'THRESHOLD': threshold, 'REMAINING': remaining,
+                             'DAYS': days, 'DATE': pd.to_datetime(dates)},
+                            index=pd.Index(self.keys[positions], name=self.key))
+
+    def projected(self, dates, keys=None):
+        """
+        :param dates: date or list of dates after the end of the series
+        :param keys: AC registration(s) or ESN(s), None for every key
+        :return: dataframe indexed by DATE with columns (FLIGHT_HOURS / FLIGHT_CYCLES, key), like
+                 UtilizationSeries.cumulative(), holding the totals projected at the end of each day
+        """
+        positions = self._positions(keys)
+        dates = pd.DatetimeIndex(pd.to_datetime([dates] if np.ndim(dates) == 0 else list(dates))).floor('D')
+        days = ((dates - self.asof) / pd.Timedelta(days=1)).values[:, None]
+        columns = [self.totals[value][positions] + np.maximum(days, 0) * self.rates[value][positions]
+                   for value in VALUES]
+        df = pd.DataFrame(np.hstack(columns), index=dates.rename('DATE'),
+                          columns=pd.MultiIndex.from_product([VALUES, self.keys[positions]], names=[None, self.key]))
+        return df.round({(VALUES[1], k): 0 for k in self.keys[positions]})
+
+    def answer(self, unit, ranges, keys=None):
+        """
+        Projections for the answers to pkg.customGUI.UserPrompts, ex. answer(*UserPrompts().run()).
+        :param unit: Date, FH or FC
+        :param ranges: numbers, or their text, ex. '10, 100, 750': days for Date, else hours or cycles from now
+        :return: dataframe with RANGE, the key and, for Date, the DATE and projected FLIGHT_HOURS and FLIGHT_CYCLES,
+                 else crossing() with relative thresholds
+        """
+        if isinstance(ranges, str):
+            ranges = [float(r) for r in ranges.replace(',', ' ').split()]
+        ranges = [ranges] if np.ndim(ranges) == 0 else list(ranges)
+
+        frames = []
+        for r in ranges:
+            if unit.upper() == 'DATE':
+                df = self.projected(self.asof + pd.Timedelta(days=r), keys).stack(level=self.key).reset_index()
+                df = df[[self.key, 'DATE'] + list(VALUES)]
+            else:
+                df = self.crossing(unit, r, relative=True, keys=keys).reset_index()
+            df.insert(0, 'RANGE', r)
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True)
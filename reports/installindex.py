@@ -0,0 +1,227 @@
+__author__ = "evfairchild"
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Columns of the transactions the index is built from, see Engine._get_transactions()
+COLUMNS = ['SN', 'TRANSACTION_TYPE', 'AC', 'TRANSACTION_DATE', 'POSITION']
+
+# Interval end of an engine still installed
+OPEN = np.iinfo(np.int64).max
+
+
+def pair_transactions(installs, removals):
+    """
+    Pairs every install with the first removal of the ESN from the same aircraft at or after it.
+    :param installs: dataframe with the COLUMNS of the install transactions, sorted by TRANSACTION_DATE
+    :param removals: same for the removals
+    :return: dataframe with ESN, AC, INSTALL_DATE, POSITION and REMOVAL_DATE (NaT while installed), one row per install
+    """
+    pairs = pd.merge_asof(installs.rename(columns={'TRANSACTION_DATE': 'INSTALL_DATE'}),
+                          removals.rename(columns={'TRANSACTION_DATE': 'REMOVAL_DATE'}),
+                          left_on='INSTALL_DATE',
+                          right_on='REMOVAL_DATE',
+                          by=['SN', 'AC'], direction='forward')
+
+    pairs.rename(columns={'SN': 'ESN', 'TRANSACTION_TYPE_x': 'INSTALL', 'TRANSACTION_TYPE_y': 'REMOVE',
+                          'POSITION_x': 'POSITION'}, inplace=True)
+    return pairs.drop(['INSTALL', 'REMOVE', 'POSITION_y'], axis=1)
+
+
+def _to_seconds(timestamps):
+    return pd.to_datetime(np.asarray(timestamps, dtype=object).ravel()).values.astype('datetime64[s]').astype(np.int64)
+
+
+class _Intervals(object):
+    """
+    Intervals sorted by key and start, searched with one binary search over a combined (key, start) int64 array.
+    """
+    def __init__(self, keys, starts, ends):
+        self.index = pd.Index(np.asarray(keys, dtype=object)).unique().sort_values()
+        codes = self.index.get_indexer(np.asarray(keys, dtype=object))
+        starts = _to_seconds(starts)
+        ends = np.where(pd.isnull(ends), OPEN, _to_seconds(ends))
+        self.order = np.lexsort((starts, codes))
+        self.codes, self.ends = codes[self.order], ends[self.order]
+        self.flat = self._combine(self.codes, starts[self.order])
+
+    @staticmethod
+    def _combine(codes, seconds):
+        # 2**33 seconds is 272 years from 1970, keys get the upper bits
+        return codes.astype(np.int64) * 2 ** 33 + seconds
+
+    def lookup(self, keys, timestamps):
+        """
+        :return: position in the sorted intervals of the interval of each key holding each timestamp (the last one
+                 started when several do), -1 where there is none
+        """
+        codes = self.index.get_indexer(np.asarray(keys, dtype=object).ravel())
+        seconds = _to_seconds(timestamps)
+        pos = np.searchsorted(self.flat, self._combine(codes, seconds), side='right') - 1
+        found = (codes >= 0) & (pos >= 0)
+        found[found] &= (self.codes[pos[found]] == codes[found]) & (self.ends[pos[found]] >= seconds[found])
+        return np.where(found, pos, -1)
+
+
+class InstallIndex(object):
+    """
+    Engine install/removal intervals, indexed by tail and position ("which ESN was on N521VA position 1 at t") and by
+    ESN ("where was 600001 at t").  Lookups are a binary search, inclusive of the install and removal times, and take
+    arrays of keys and timestamps.
+        index = Engine(start, end).get_install_index()
+        index.installed('N521VA', '1', '2019-06-30 12:00:00')
+        index.batch_locate(['600001', '600002'], ['2019-06-30', '2020-03-31'])
+
+    The index keeps the transactions it was built from, so new INSTALL/REMOVE transactions are added with update()
+    and only the ESN/aircraft combinations they touch are paired again.  save() and load() keep it between runs, the
+    pairs included, so a loaded index is not paired again either.
+    """
+    def __init__(self, installs, removals, pairs=None):
+        """
+        :param installs: dataframe with SN, TRANSACTION_TYPE, AC, TRANSACTION_DATE and POSITION of the installs
+        :param removals: same for the removals
+        :param pairs: pair_transactions() of installs and removals if already known, ex. saved with them
+        """
+        self.installs = self._clean(installs)
+        self.removals = self._clean(removals)
+        # Written to install_index.json by save(), ex. what the watermark was checked against
+        self.meta = {}
+        self.pairs = self._sort(pair_transactions(self.installs, self.removals) if pairs is None else pairs)
+        self._build()
+
+    @staticmethod
+    def _clean(df):
+        return df[COLUMNS].drop_duplicates().sort_values(by='TRANSACTION_DATE', kind='mergesort', ignore_index=True)
+
+    @staticmethod
+    def _sort(pairs):
+        return pairs.sort_values(by=['ESN', 'INSTALL_DATE'], kind='mergesort', ignore_index=True)
+
+    def _build(self):
+        pairs = self.pairs
+        self._slots = _Intervals(self._slot(pairs['AC'], pairs['POSITION']), pairs['INSTALL_DATE'],
+                                 pairs['REMOVAL_DATE'])
+        self._esns = _Intervals(pairs['ESN'], pairs['INSTALL_DATE'], pairs['REMOVAL_DATE'])
+
+    @staticmethod
+    def _slot(acs, positions):
+        positions = pd.Series(np.asarray(positions, dtype=object).ravel()).fillna('').astype(str)
+        return pd.Series(np.asarray(acs, dtype=object).ravel()).astype(str).str.upper().values + '/' + \
+            positions.values
+
+    @property
+    def watermark(self):
+        """
+        :return: first day (YYYY-MM-DD 00:00:00) that update() needs transactions from, None for an empty index
+        """
+        last = pd.concat([self.installs['TRANSACTION_DATE'], self.removals['TRANSACTION_DATE']]).max()
+        return None if pd.isnull(last) else last.strftime('%Y-%m-%d 00:00:00')
+
+    def update(self, installs, removals):
+        """
+        Adds new transactions, ex. those since the watermark.  Transactions already in the index are ignored.
+        :param installs: dataframe like the constructor's
+        :param removals: same
+        :return: number of new transactions
+        """
+        new = []
+        for name, df in (('installs', installs), ('removals', removals)):
+            old = getattr(self, name)
+            df = self._clean(df)
+            df = df.loc[~self._keys(df).isin(self._keys(old))]
+            setattr(self, name, self._clean(pd.concat([old, df], ignore_index=True)))
+            new.append(df)
+
+        touched = pd.concat(new)[['SN', 'AC']].drop_duplicates()
+        if touched.empty:
+            return 0
+
+        # Pairs never span two ESN/aircraft combinations, only the touched ones change
+        keys = self._keys(touched, ['SN', 'AC'])
+        repaired = pair_transactions(self.installs.loc[self._keys(self.installs, ['SN', 'AC']).isin(keys)],
+                                     self.removals.loc[self._keys(self.removals, ['SN', 'AC']).isin(keys)])
+        kept = self.pairs.loc[~self._keys(self.pairs, ['ESN', 'AC']).isin(keys)]
+        self.pairs = self._sort(pd.concat([kept, repaired], ignore_index=True))
+        self._build()
+        return sum(len(df) for df in new)
+
+    @staticmethod
+    def _keys(df, columns=COLUMNS):
+        return pd.Series(list(zip(*[df[col].astype(str) for col in columns])), index=df.index, dtype=object)
+
+    def batch_installed(self, acs, positions, timestamps):
+        """
+        :param acs: AC registration(s)
+        :param positions: engine position(s), ex. '1'
+        :param timestamps: time(s), broadcast against acs and positions
+        :return: numpy array of the ESN installed at each time, None where the position was empty
+        """
+        acs, positions, timestamps = np.broadcast_arrays(np.asarray(acs, dtype=object),
+                                                         np.asarray(positions, dtype=object),
+                                                         np.asarray(timestamps, dtype=object))
+        pos = self._slots.lookup(self._slot(acs, positions), timestamps)
+        esns = self.pairs['ESN'].values[self._slots.order][np.maximum(pos, 0)] if len(self.pairs) else \
+            np.empty(len(pos), dtype=object)
+        return np.where(pos >= 0, esns, None)
+
+    def batch_locate(self, esns, timestamps):
+        """
+        :param esns: ESN(s)
+        :param timestamps: time(s), broadcast against esns
+        :return: dataframe with ESN, time (TIMESTAMP), AC and POSITION, AC and POSITION are None when not installed
+        """
+        esns, timestamps = np.broadcast_arrays(np.asarray(esns, dtype=object), np.asarray(timestamps, dtype=object))
+        pos = self._esns.lookup(esns, timestamps)
+        rows = self.pairs.iloc[self._esns.order[np.maximum(pos, 0)]] if len(self.pairs) else \
+            pd.DataFrame({'AC': [None] * len(pos), 'POSITION': [None] * len(pos)})
+        return pd.DataFrame({'ESN': esns.ravel(),
+                             'TIMESTAMP': pd.to_datetime(timestamps.ravel()),
+                             'AC': np.where(pos >= 0, rows['AC'].values, None),
+                             'POSITION': np.where(pos >= 0, rows['POSITION'].values, None)})
+
+    def installed(self, ac, position, timestamp):
+        """
+        :return: ESN on 'ac' at 'position' at 'timestamp', None if the position was empty
+        """
+        return self.batch_installed([ac], [position], [timestamp])[0]
+
+    def locate(self, esn, timestamp):
+        """
+        :return: tuple of the AC and POSITION of 'esn' at 'timestamp', (None, None) if it was not installed
+        """
+        row = self.batch_locate([esn], [timestamp]).iloc[0]
+        return row['AC'], row['POSITION']
+
+    def save(self, directory):
+        """
+        Writes the transactions to install_index.parquet, the pairs to install_index_pairs.parquet and the watermark
+        to install_index.json in 'directory'.
+        """
+        os.makedirs(directory, exist_ok=True)
+        pd.concat([self.installs.assign(KIND='INSTALL'), self.removals.assign(KIND='REMOVE')], ignore_index=True)\
+            .to_parquet(os.path.join(directory, 'install_index.parquet'), index=False)
+        self.pairs.to_parquet(os.path.join(directory, 'install_index_pairs.parquet'), index=False)
+        self.meta.update({'watermark': self.watermark, 'installs': len(self.installs), 'removals': len(self.removals),
+                          'pairs': len(self.pairs), 'saved': datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        with open(os.path.join(directory, 'install_index.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        :return: InstallIndex saved in 'directory', None if there is none.  An index saved without its pairs is paired
+                 again.
+        """
+        path = os.path.join(directory, 'install_index.parquet')
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path)
+        pairs = os.path.join(directory, 'install_index_pairs.parquet')
+        index = cls(df.loc[df['KIND'] == 'INSTALL'], df.loc[df['KIND'] == 'REMOVE'],
+                    pd.read_parquet(pairs) if os.path.exists(pairs) else None)
+        with open(os.path.join(directory, 'install_index.json')) as f:
+            index.meta = json.load(f)
+        return index
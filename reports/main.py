@@ -1,13 +1,36 @@
+"""
+Monthly utilization report.
+
+    python -m reports.main                                  # last month, utilization_YYYY-MM.xlsx
+    python -m reports.main --month 2020-03 --format parquet --output out/
+    python -m reports.main --month 2019-04 2020-03          # backfill, one export per month
+    python -m reports.main --start 2020-03-01 --end 2020-03-15
+    python -m reports.main --backend sqlite --database trax.db --no-cache
+    python -m reports.main --fh-fc N101VA N102VA --asof 2020-03-31 --offline
+    python -m reports.main --month 2020-03 --snapshot-dir snapshots     # previous month's close + March flights
+    python -m reports.main --month 2020-03 --snapshot-dir snapshots --verify
+    python -m reports.main --gui --open                     # date picker, then open the workbook in Excel
+    python -m reports.main --profile --trace trace.json     # time every query and stage, see reports.profiler
+    python -m reports.main --exclusions rules.json          # engine records to leave out, see reports.exclusions
+    python -m reports.main --month 2020-03 --recompute      # ignore the sheets kept from the last run
+    python -m reports.main --forecast FC 500 1000 --asof 2020-03-31     # date each tail / ESN flies 500, 1000 more FC
+
+Only the standard library is imported at startup.  pandas, the database drivers and tkinter (--gui) are imported when
+they are needed, so --help and --offline queries start quickly.
+"""
 __author__ = "evfairchild"
 
 import os
-from pkg.customGUI import Calendar2
-import pandas as pd
-from reports.airframe import Airframe
-from reports.engine import Engine
+import sys
+import argparse
+from datetime import date, timedelta
+
+# reports.export.FORMATS, repeated here so that parsing the arguments does not import pandas
+FORMATS = ('xlsx', 'parquet', 'csv')
 
 
 def select_dates():
+    from pkg.customGUI import Calendar2
     cal_result = Calendar2().run()
     start, end = [i.strftime("%Y-%m-%d") for i in cal_result]
     start += ' 00:00:00'
@@ -15,19 +38,276 @@ def select_dates():
     return start, end
 
 
-if __name__ == "__main__":
-    start_date, end_date = select_dates()
-    # start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
-    airframe = Airframe(start_date, end_date).run()
-    engines = Engine(start_date, end_date).run()
-    removals = Engine(start_date, end_date).get_removals()
+def last_month():
+    """
+    :return: previous calendar month as YYYY-MM
+    """
+    return (date.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m reports.main',
+                                     description="Airframe and engine flight hour / flight cycle utilization report.")
+    dates = parser.add_mutually_exclusive_group()
+    dates.add_argument('--month', nargs='+', metavar='YYYY-MM',
+                       help="month to report, or the first and last month to backfill (default: last month)")
+    dates.add_argument('--start', metavar='YYYY-MM-DD', help="first day of a custom period, used with --end")
+    dates.add_argument('--gui', action='store_true', help="pick the period with the calendar")
+    parser.add_argument('--end', metavar='YYYY-MM-DD', help="last day of a custom period")
+    parser.add_argument('--output', help="output file, or folder for the default file names "
+                                         "(default: utilization_YYYY-MM.<format>)")
+    parser.add_argument('--format', choices=FORMATS, help="export format (default: from --output, else xlsx)")
+    parser.add_argument('--backend', choices=('trax', 'sqlite'), default='trax', help="data source (default: trax)")
+    parser.add_argument('--dsn', help="ODBC connection string for --backend trax")
+    parser.add_argument('--database', help="SQLite file for --backend sqlite")
+    parser.add_argument('--cache-dir', default='cache', help="local Parquet cache (default: cache)")
+    parser.add_argument('--no-cache', action='store_true', help="read everything from the backend")
+    parser.add_argument('--offline', action='store_true', help="use the cache as it is, without syncing")
+    parser.add_argument('--result-dir', help="keep the sheets with a fingerprint of their inputs and only compute the "
+                                             "ones whose inputs changed (default: results in --cache-dir, none with "
+                                             "--no-cache)")
+    parser.add_argument('--recompute', action='store_true', help="compute every sheet even if its inputs are unchanged")
+    parser.add_argument('--fh-fc', nargs='+', metavar='AC', help="print total FH/FC for these tails and exit")
+    parser.add_argument('--asof', metavar='YYYY-MM-DD', help="last day included by --fh-fc and --forecast "
+                                                             "(default: today)")
+    parser.add_argument('--forecast', nargs='+', metavar='VALUE', help="Date, FH or FC and the ranges, ex. FH 10 100: "
+                                                                     "print when each tail and ESN flies each range "
+                                                                     "more (its totals in each range of days for "
+                                                                     "Date) and exit")
+    parser.add_argument('--window', type=int, default=12, help="months the --forecast rates are averaged over "
+                                                               "(default: 12)")
+    parser.add_argument('--chunksize', type=int, help="stream the flight history this many rows at a time to bound "
+                                                      "memory (slower)")
+    parser.add_argument('--snapshot-dir', help="close each month from the previous month's snapshot in this folder "
+                                               "and save its own (see reports.monthclose)")
+    parser.add_argument('--verify', action='store_true', help="with --snapshot-dir, re-derive the totals from the full "
+                                                              "history and print any drift from the snapshots")
+    parser.add_argument('--engine-mode', choices=('vectorized', 'pushdown', 'loop'), default='vectorized',
+                        help="Engine.run() mode (default: vectorized)")
+    parser.add_argument('--exclusions', metavar='FILE', help="JSON rules of the bad engine transactions to leave out "
+                                                             "(default: reports/exclusions.json)")
+    parser.add_argument('--profile', action='store_true', help="print the time, rows and memory of every query and "
+                                                               "report stage")
+    parser.add_argument('--trace', metavar='FILE', help="write the timings of every query and stage to a JSON file")
+    parser.add_argument('--open', action='store_true', help="open the workbook in Excel when done (Windows)")
+    args = parser.parse_args(argv)
+
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end go together")
+    if args.month is not None and len(args.month) > 2:
+        parser.error("--month takes one month, or the first and last month")
+    if args.backend == 'sqlite' and args.database is None:
+        parser.error("--backend sqlite needs --database")
+    if args.offline and args.no_cache:
+        parser.error("--offline reads from the cache and cannot be combined with --no-cache")
+    if args.snapshot_dir is not None and (args.start is not None or args.gui):
+        parser.error("--snapshot-dir closes whole months, use --month")
+    if args.verify and args.snapshot_dir is None:
+        parser.error("--verify needs --snapshot-dir")
+    if args.forecast is not None:
+        if len(args.forecast) < 2 or args.forecast[0].upper() not in ('DATE', 'FH', 'FC'):
+            parser.error("--forecast takes Date, FH or FC and one or more ranges, ex. --forecast FH 10 100 750")
+        try:
+            [float(r) for r in args.forecast[1:]]
+        except ValueError:
+            parser.error("--forecast ranges are numbers, ex. --forecast FH 10 100 750")
+    if args.window < 1:
+        parser.error("--window is at least 1 month")
+    return args
+
+
+def output_path(output, fmt, name):
+    """
+    :param output: --output, a file, a folder or None
+    :param fmt: --format or None
+    :param name: default file name without extension, ex. utilization_2020-03
+    :return: output file and format
+    """
+    if output is not None and not os.path.isdir(output) and os.path.splitext(output)[1]:
+        return output, fmt or os.path.splitext(output)[1].lstrip('.')
+    fmt = fmt or 'xlsx'
+    return os.path.join(output or '', "{}.{}".format(name, fmt)), fmt
+
+
+def make_session(args):
+    from reports.session import Session
+
+    if args.backend == 'sqlite':
+        from reports.backend import SQLiteBackend
+        backend = SQLiteBackend(args.database)
+    else:
+        from reports.backend import TraxBackend
+        backend = TraxBackend(args.dsn) if args.dsn else TraxBackend()
+
+    cache = None
+    if not args.no_cache:
+        from reports.cache import FlightCache
+        cache = FlightCache(args.cache_dir, offline=args.offline)
+
+    profiler = None
+    if args.profile or args.trace:
+        from reports.profiler import Profiler
+        profiler = Profiler()
+    return Session(backend=backend, cache=cache, chunksize=args.chunksize, profiler=profiler,
+                   exclusions=args.exclusions)
+
+
+def print_fh_fc(args):
+    asof = (args.asof or date.today().strftime("%Y-%m-%d"))[0:10] + " 23:59:59"
+
+    if args.offline:
+        from reports.cache import FlightCache
+        df = FlightCache(args.cache_dir, offline=True).fh_fc(args.fh_fc, asof)
+    else:
+        from reports.airframe import Airframe
+        session = make_session(args)
+        df = Airframe(asof[0:7] + '-01 00:00:00', asof, session=session).get_fh_fc(args.fh_fc, asof)
+        session.close()
+    print(df.to_string())
+
+
+def print_forecast(args):
+    """
+    The answer to pkg.customGUI.UserPrompts for every tail and ESN, from their last --window months up to --asof.
+    """
+    from reports.airframe import Airframe
+    from reports.engine import Engine
 
-    file = "utilization_{}.xlsx".format(Airframe(start_date, end_date).yyyymm)
+    asof = (args.asof or date.today().strftime("%Y-%m-%d"))[0:10] + " 23:59:59"
+    unit, ranges = args.forecast[0], [float(r) for r in args.forecast[1:]]
+    session = make_session(args)
+    start = asof[0:7] + '-01 00:00:00'
+    tails = Airframe(start, asof, session=session).get_forecast(args.window).answer(unit, ranges)
+    esns = Engine(start, asof, session=session).get_esn_forecast(args.window).answer(unit, ranges)
+    session.close()
+    print(tails.to_string(index=False))
+    print(esns.to_string(index=False))
+    return tails, esns
 
-    with pd.ExcelWriter(file) as writer:
-        airframe.to_excel(writer, sheet_name="airframe")
-        engines.to_excel(writer, sheet_name="engines")
-        removals.to_excel(writer, sheet_name="removals")
-    file = os.path.join(os.getcwd(), file)
 
-    os.system("start EXCEL.EXE {}".format(file))
+def close_months(args, session, periods):
+    """
+    Month close from the snapshots in --snapshot-dir, one month after the other so that each builds on the last.
+    :return: list of files written and list of YYYY-MM and dataframe of the drift found by --verify
+    """
+    from reports.export import export
+    from reports.monthclose import MonthClose, SnapshotStore
+
+    store = SnapshotStore(args.snapshot_dir)
+    files, drift = [], []
+    if args.output is not None and len(periods) > 1:
+        os.makedirs(args.output, exist_ok=True)
+    for period in periods:
+        close = MonthClose(period, session=session, store=store)
+        files += export(close.run(), *output_path(args.output, args.format, "utilization_{}".format(period)),
+                        profiler=session.profiler)
+        if args.verify:
+            drift.append((period, close.verify()))
+    return files, drift
+
+
+def result_store(args):
+    """
+    :return: reports.fingerprint.ResultStore of --result-dir (or the cache's), None without one
+    """
+    if args.result_dir is None and args.no_cache:
+        return None
+    from reports.fingerprint import ResultStore
+    return ResultStore(args.result_dir if args.result_dir is not None else os.path.join(args.cache_dir, 'results'))
+
+
+def export_unchanged(orchestrator, sheets, file, fmt, profiler=None):
+    """
+    Exports the sheets, unless 'file' was written from the same inputs already.
+    :return: list of files written
+    """
+    from reports.export import export
+    from reports.fingerprint import digest
+
+    store = orchestrator.store
+    if store is None:
+        return export(sheets, file, fmt, profiler=profiler)
+
+    fingerprint = digest(fmt, list(orchestrator.fingerprints.values()))
+    if store.exported(file, fingerprint) is not None:
+        print("{} is up to date, its inputs have not changed".format(file))
+        return []
+    files = export(sheets, file, fmt, profiler=profiler)
+    store.record_export(file, fingerprint, files)
+    return files
+
+
+def run(args):
+    """
+    :return: list of files written and list of YYYY-MM and drift dataframe (--verify)
+    """
+    if args.gui:
+        start_date, end_date = select_dates()
+    elif args.start is not None:
+        start_date, end_date = args.start[0:10] + ' 00:00:00', args.end[0:10] + ' 23:59:59'
+    else:
+        from reports.batch import month_range, period_bounds
+        periods = month_range(*(args.month or [last_month()]))
+        start_date, end_date = period_bounds(periods[0])
+
+    from reports.export import export
+    session = make_session(args)
+    files, drift = [], []
+    if args.snapshot_dir is not None:
+        files, drift = close_months(args, session, periods)
+    elif args.month is not None and len(periods) > 1:
+        from reports.batch import BatchReport
+        if args.output is not None:
+            os.makedirs(args.output, exist_ok=True)
+        for period, sheets in BatchReport(periods, session=session).run().items():
+            files += export(sheets, *output_path(args.output, args.format, "utilization_{}".format(period)),
+                            profiler=session.profiler)
+    else:
+        from reports.orchestrator import ReportOrchestrator
+        orchestrator = ReportOrchestrator(start_date, end_date, session=session, engine_mode=args.engine_mode,
+                                          store=result_store(args), reuse=not args.recompute)
+        sheets = orchestrator.run()
+        file, fmt = output_path(args.output, args.format, "utilization_{}".format(orchestrator.yyyymm))
+        files += export_unchanged(orchestrator, sheets, file, fmt, session.profiler)
+    session.close()
+
+    if session.profiler is not None:
+        if args.profile:
+            session.profiler.print_summary()
+        if args.trace:
+            print("Written {}".format(session.profiler.write_trace(args.trace)))
+        session.profiler.close()
+    return files, drift
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.fh_fc:
+        print_fh_fc(args)
+        return 0
+    if args.forecast:
+        print_forecast(args)
+        return 0
+
+    files, drift = run(args)
+    for file in files:
+        print("Written {}".format(file))
+
+    status = 0
+    for period, df in drift:
+        if df.empty:
+            print("{} snapshots match the full history".format(period))
+        else:
+            print("{} snapshots drifted from the full history:".format(period))
+            print(df.to_string(index=False))
+            status = 1
+
+    if args.open:
+        for file in files:
+            if file.endswith('.xlsx'):
+                os.system("start EXCEL.EXE {}".format(os.path.abspath(file)))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
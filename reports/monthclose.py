@@ -0,0 +1,173 @@
+__author__ = "evfairchild"
+
+import os
+import json
+import pandas as pd
+from collections import OrderedDict
+from datetime import datetime
+from reports.airframe import Airframe
+from reports.batch import period_bounds
+from reports.engine import Engine
+from reports.session import Session
+
+
+def previous_period(period):
+    """
+    :param period: YYYY-MM
+    :return: the month before, YYYY-MM
+    """
+    return str(pd.Period(period, freq='M') - 1)
+
+
+def totals_of(sheet):
+    """
+    :param sheet: airframe or engines sheet, ex. Airframe.run_periods() or MonthClose.run()
+    :return: dataframe indexed by AC / ESN with the cumulative FLIGHT_HOURS and FLIGHT_CYCLES, without the 'All' row
+    """
+    df = pd.DataFrame({'FLIGHT_HOURS': sheet[('FLIGHT_HOURS', 'All')],
+                       'FLIGHT_CYCLES': sheet[('FLIGHT_CYCLES', 'All')]}, index=sheet.index)
+    # The engines sheet repeats an ESN that flew on two aircraft in the month
+    df = df.loc[(df.index != 'All') & ~df.index.duplicated()]
+    df.index.name = sheet.index.name
+    return df
+
+
+class SnapshotStore(object):
+    """
+    Month-close snapshots of the cumulative flight hours and cycles per tail (airframe) and per ESN (engines), one
+    Parquet file per report and month, ex. snapshots/engines_2020-03.parquet.  snapshots.json records when each one
+    was written and whether it came from the full history or from the previous snapshot.
+    """
+    REPORTS = ('airframe', 'engines')
+
+    def __init__(self, directory='snapshots'):
+        self.directory = directory
+        self.meta_file = os.path.join(directory, 'snapshots.json')
+        self.meta = self._read_meta()
+
+    def _read_meta(self):
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as f:
+                return json.load(f)
+        return {}
+
+    def _write_meta(self):
+        with open(self.meta_file, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    def path(self, report, period):
+        return os.path.join(self.directory, "{}_{}.parquet".format(report, period))
+
+    def load(self, report, period):
+        """
+        :param report: airframe or engines
+        :param period: YYYY-MM
+        :return: dataframe indexed by AC / ESN with FLIGHT_HOURS and FLIGHT_CYCLES, or None if there is no snapshot
+        """
+        if not os.path.exists(self.path(report, period)):
+            return None
+        df = pd.read_parquet(self.path(report, period))
+        return df.set_index(df.columns[0])
+
+    def save(self, report, period, df, source):
+        """
+        :param report: airframe or engines
+        :param period: YYYY-MM
+        :param df: dataframe indexed by AC / ESN with FLIGHT_HOURS and FLIGHT_CYCLES, ex. totals_of(sheet)
+        :param source: how the totals were derived, 'full' or 'incremental'
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        df.reset_index().to_parquet(self.path(report, period), index=False)
+        self.meta.setdefault(report, {})[period] = {'source': source,
+                                                    'rows': len(df),
+                                                    'written': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        self._write_meta()
+
+    def periods(self, report):
+        """
+        :param report: airframe or engines
+        :return: sorted list of YYYY-MM with a snapshot
+        """
+        return sorted(self.meta.get(report, {}))
+
+
+class MonthClose(object):
+    """
+    Month-end report computed from the previous month's closing totals plus the month's flights, instead of summing
+    the fleet history since 2005 again.  run() saves the month's own snapshot for the next close.  Without a snapshot
+    for the previous month the totals come from the full history (like reports.batch) and the chain starts there.
+
+    verify() derives the totals from scratch again and lists the tails and ESNs whose snapshot has drifted, ex. after
+    flights were corrected in a month that was already closed.
+        close = MonthClose('2020-04', store=SnapshotStore('snapshots'))
+        sheets = close.run()
+        drift = close.verify()
+    """
+    def __init__(self, period, session=None, store=None):
+        """
+        :param period: YYYY-MM to close
+        :param session: reports.session.Session, a new TRAX session when None
+        :param store: SnapshotStore, snapshots/ when None
+        """
+        self.period = period
+        self.session = session if session is not None else Session()
+        self.store = store if store is not None else SnapshotStore()
+        self.startDate, self.endDate = period_bounds(period)
+
+        # Report name: 'full' or 'incremental', filled in by run()
+        self.sources = OrderedDict()
+
+    def run(self):
+        """
+        :return: ordered dictionary of sheet name and dataframe (airframe, engines, removals), laid out like
+                 reports.batch.BatchReport for the month
+        """
+        airframe = Airframe(self.startDate, self.endDate, session=self.session)
+        engine = Engine(self.startDate, self.endDate, session=self.session)
+
+        sheets = OrderedDict()
+        for report, obj in (('airframe', airframe), ('engines', engine)):
+            previous = self.store.load(report, previous_period(self.period))
+            if previous is None:
+                sheets[report] = obj.run_periods([self.period])[self.period]
+                self.sources[report] = 'full'
+            else:
+                sheets[report] = obj.run_incremental(previous)
+                self.sources[report] = 'incremental'
+            self.store.save(report, self.period, totals_of(sheets[report]), self.sources[report])
+
+        sheets['removals'] = engine.get_removals()
+        return sheets
+
+    def verify(self, tolerance=1e-6, repair=False):
+        """
+        :param tolerance: largest difference in flight hours or cycles that is not reported
+        :param repair: replace the snapshots with the totals derived from scratch
+        :return: dataframe with REPORT, KEY (AC or ESN), VALUE (FLIGHT_HOURS or FLIGHT_CYCLES), SNAPSHOT, FULL and
+                 DRIFT (FULL - SNAPSHOT) for every difference, empty when the snapshots match the full history
+        """
+        full = OrderedDict([
+            ('airframe', Airframe(self.startDate, self.endDate, session=self.session).run_periods([self.period])),
+            ('engines', Engine(self.startDate, self.endDate, session=self.session).run_periods([self.period]))])
+
+        drift = []
+        for report, sheets in full.items():
+            snapshot = self.store.load(report, self.period)
+            if snapshot is None:
+                raise LookupError("No {} snapshot for {}, run the month close first.".format(report, self.period))
+
+            expected = totals_of(sheets[self.period])
+            df = snapshot.join(expected, how='outer', lsuffix='_SNAPSHOT', rsuffix='_FULL').fillna(0)
+            for value in ('FLIGHT_HOURS', 'FLIGHT_CYCLES'):
+                diff = df[value + '_FULL'] - df[value + '_SNAPSHOT']
+                bad = diff.abs() > tolerance
+                drift.append(pd.DataFrame({'REPORT': report,
+                                           'KEY': df.index[bad],
+                                           'VALUE': value,
+                                           'SNAPSHOT': df.loc[bad, value + '_SNAPSHOT'].values,
+                                           'FULL': df.loc[bad, value + '_FULL'].values,
+                                           'DRIFT': diff[bad].values}))
+            if repair:
+                self.store.save(report, self.period, expected, 'full')
+
+        return pd.concat(drift, ignore_index=True)
@@ -0,0 +1,126 @@
+__author__ = "evfairchild"
+
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from colorama import Fore
+from reports.airframe import Airframe
+from reports.engine import Engine
+from reports.fingerprint import ResultStore, sheet_fingerprints
+from reports.session import Session
+
+
+class ReportOrchestrator(object):
+    """
+    Runs the independent report stages (airframe history, engine attribution and engine removals) concurrently.
+    Most of a run is spent waiting on the database, so each stage gets its own connection on a bounded thread pool,
+    borrowed from the session's connection pool (Session.fork()) and reused by the next stage or run.  If one stage
+    fails the stages that have not started are cancelled, the statements of the running stages are cancelled
+    (Session.interrupt()) and the error is raised once every thread has stopped.
+
+    With a reports.fingerprint.ResultStore the inputs of each sheet are fingerprinted first (row counts, last dates and
+    checksums per table and month) and only the sheets whose inputs changed since they were stored are computed.
+    """
+    def __init__(self, start_date, end_date, session=None, workers=3, engine_mode='vectorized', store=None,
+                 reuse=True):
+        """
+        :param start_date: ex. 2020-03-01 00:00:00
+        :param end_date: ex. 2020-03-31 23:59:59
+        :param session: reports.session.Session, a new TRAX session when None
+        :param workers: maximum number of stages running at the same time
+        :param engine_mode: Engine.run() mode
+        :param store: optional reports.fingerprint.ResultStore keeping the sheets between runs
+        :param reuse: return the stored sheets whose inputs are unchanged, False to compute (and store) every sheet
+        """
+        self.startDate = start_date
+        self.endDate = end_date
+        self.yyyymm = start_date[0:7]
+        self.session = session if session is not None else Session()
+        self.workers = workers
+        self.engine_mode = engine_mode
+        self.store = store
+        self.reuse = reuse
+
+        # Sheet name: fingerprint of its inputs, and the sheets taken from the store, filled in by run() with a store
+        self.fingerprints = OrderedDict()
+        self.reused = []
+        self.timings = OrderedDict()
+        self._cancelled = threading.Event()
+        self._sessions = []
+
+    def stages(self):
+        """
+        :return: ordered dictionary of sheet name and function(session) returning the sheet's dataframe
+        """
+        return OrderedDict([
+            ('airframe', lambda session: Airframe(self.startDate, self.endDate, session=session).run()),
+            ('engines', lambda session: Engine(self.startDate, self.endDate, session=session).run(self.engine_mode)),
+            ('removals', lambda session: Engine(self.startDate, self.endDate, session=session).get_removals())])
+
+    def _run_stage(self, name, func):
+        if self._cancelled.is_set():
+            return None
+
+        session = self.session.fork()
+        self._sessions.append(session)
+        print("{}{:<10}{} started".format(Fore.CYAN, name, Fore.RESET))
+        start = time.perf_counter()
+        try:
+            df = func(session)
+        except Exception:
+            print("{}{:<10}{} failed after {:.1f}s".format(Fore.RED, name, Fore.RESET, time.perf_counter() - start))
+            raise
+        finally:
+            session.close()
+
+        self.timings[name] = time.perf_counter() - start
+        print("{}{:<10}{} done in {:.1f}s ({} rows)".format(Fore.GREEN, name, Fore.RESET, self.timings[name], len(df)))
+        return df
+
+    def run(self):
+        """
+        :return: ordered dictionary of sheet name and dataframe (airframe, engines, removals)
+        """
+        stages = self.stages()
+        names = list(stages)
+
+        # The cache is not thread safe, bring it up to date before the stages read from it
+        if self.session.cache is not None:
+            self.session.cache.sync(self.session)
+
+        stored = OrderedDict()
+        if self.store is not None:
+            key = ResultStore.key(self.startDate, self.endDate)
+            self.fingerprints = sheet_fingerprints(self.session, self.startDate, self.endDate,
+                                                   engine_mode=self.engine_mode)
+            for name in names:
+                df = self.store.load(name, key, self.fingerprints[name]) if self.reuse else None
+                if df is not None:
+                    print("{}{:<10}{} unchanged since the last run".format(Fore.GREEN, name, Fore.RESET))
+                    stored[name] = df
+                    del stages[name]
+            self.reused = list(stored)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = OrderedDict((pool.submit(self._run_stage, name, func), name) for name, func in stages.items())
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+
+            failed = [f for f in done if f.exception() is not None]
+            if failed:
+                self._cancelled.set()
+                for future in pending:
+                    future.cancel()
+                for session in self._sessions:
+                    session.interrupt()
+                wait(pending)
+
+                name = futures[failed[0]]
+                raise RuntimeError("Report stage '{}' failed, the other stages were cancelled.".format(name)) \
+                    from failed[0].exception()
+
+        computed = OrderedDict((name, future.result()) for future, name in futures.items())
+        if self.store is not None:
+            for name, df in computed.items():
+                self.store.save(name, key, df, self.fingerprints[name])
+        return OrderedDict((name, stored[name] if name in stored else computed[name]) for name in names)
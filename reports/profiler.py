@@ -0,0 +1,245 @@
+__author__ = "evfairchild"
+
+import re
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import pandas as pd
+
+
+def query_name(sql):
+    """
+    :param sql: SQL string
+    :return: stage name for a query, ex. 'query AC_ACTUAL_FLIGHTS' (the first table it reads)
+    """
+    match = re.search(r"FROM\s+(?:odb\.)?(\w+)", sql, re.IGNORECASE)
+    return "query " + (match.group(1) if match else "?")
+
+
+def frame_bytes(df):
+    """
+    :param df: dataframe
+    :return: memory used by the dataframe including its strings
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class Span(object):
+    """
+    One timed query or processing stage.  The code inside the stage adds what it produced with record().
+    """
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.rows = None
+        self.bytes = None
+        self.start = None
+        self.wall = None
+        self.memory = 0
+        self.peak = 0
+        self.thread = threading.current_thread().name
+
+    def record(self, df):
+        """
+        :param df: dataframe produced by the stage, or several chunks in turn
+        :return: df
+        """
+        self.rows = (self.rows or 0) + len(df)
+        self.bytes = (self.bytes or 0) + frame_bytes(df)
+        return df
+
+    def to_dict(self):
+        return {'name': self.name, 'parent': self.parent, 'thread': self.thread, 'start': self.start,
+                'wall': self.wall, 'rows': self.rows, 'bytes': self.bytes,
+                'peak_bytes': max(self.peak - self.memory, 0) if self.peak else None, 'attrs': self.attrs}
+
+
+class NullSpan(object):
+    """
+    Stand-in for Span when the session is not profiled.  It is shared by every stage, so what the stages write to it,
+    ex. span.rows = n, is dropped.
+    """
+    rows = None
+    bytes = None
+
+    def __setattr__(self, name, value):
+        pass
+
+    @staticmethod
+    def record(df):
+        return df
+
+
+NULL_SPAN = NullSpan()
+
+
+def stage(profiler, name, **attrs):
+    """
+    Profiler.stage() when there is a profiler, otherwise a context manager doing nothing.
+    :param profiler: Profiler or None
+    :param name: stage name
+    :param attrs: extra values kept in the trace
+    :return: context manager yielding a Span (or NULL_SPAN)
+    """
+    if profiler is None:
+        return nullcontext(NULL_SPAN)
+    return profiler.stage(name, **attrs)
+
+
+class Profiler(object):
+    """
+    Collects a Span for every query (through reports.session.Session) and processing stage of a run: wall time, rows,
+    bytes of the resulting dataframe and peak memory above the memory in use when the stage started.
+        profiler = Profiler()
+        session = Session(profiler=profiler)
+        Airframe(start, end, session=session).run()
+        profiler.print_summary()
+        profiler.write_trace('trace.json')
+    Peak memory comes from tracemalloc (memory=False skips it), which slows down allocation heavy code and counts every
+    thread, so stages running concurrently share their peaks.  Before Python 3.9 the peak cannot be reset and is the
+    highest so far in the run.
+    """
+    def __init__(self, memory=True):
+        """
+        :param memory: trace allocations for the peak memory of each stage
+        """
+        self.memory = memory
+        self.spans = []
+        self.started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._open = []
+        self._tracing = memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _fold_peak(self):
+        # tracemalloc keeps one peak for the process, hand it to every open span before it is reset
+        if not self.memory or not tracemalloc.is_tracing():
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        for span in self._open:
+            span.peak = max(span.peak, peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def stage(self, name, **attrs):
+        """
+        Times the block as one span, nested stages name the enclosing stage as their parent.
+        :param name: stage name, ex. 'engine.attribute'
+        :param attrs: extra values kept in the trace, ex. sql
+        :return: context manager yielding the Span
+        """
+        stack = self._stack()
+        span = Span(name, parent=stack[-1].name if stack else None, **attrs)
+        with self._lock:
+            span.memory = span.peak = self._fold_peak()
+            self._open.append(span)
+        stack.append(span)
+        span.start = round(time.perf_counter() - self._t0, 6)
+        begin = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.wall = time.perf_counter() - begin
+            stack.pop()
+            with self._lock:
+                self._fold_peak()
+                self._open.remove(span)
+                self.spans.append(span)
+
+    def iterate(self, name, chunks, **attrs):
+        """
+        Times each chunk of a generator (the time spent fetching it, not the time the caller spends on it) as a span.
+        Finding the end of the result set is a last span without rows.
+        :param name: stage name
+        :param chunks: iterable of dataframes
+        :return: generator of the same dataframes
+        """
+        chunks = iter(chunks)
+        while True:
+            with self.stage(name, **attrs) as span:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                span.record(chunk)
+            yield chunk
+
+    def summary(self):
+        """
+        :return: dataframe indexed by stage name (in order of first use) with calls, total wall time (s), rows, MB and
+                 the largest peak memory (MB)
+        """
+        columns = ['calls', 'wall_s', 'rows', 'MB', 'peak_MB']
+        if not self.spans:
+            return pd.DataFrame(columns=columns)
+
+        df = pd.DataFrame([span.to_dict() for span in sorted(self.spans, key=lambda s: s.start)])
+        df = df.groupby('name', sort=False).agg(calls=('name', 'size'), wall_s=('wall', 'sum'),
+                                                rows=('rows', 'sum'), MB=('bytes', 'sum'),
+                                                peak_MB=('peak_bytes', 'max'))
+        df['MB'] = df['MB'] / 1e6
+        df['peak_MB'] = df['peak_MB'] / 1e6
+        df['rows'] = df['rows'].astype('int64')
+        return df.round({'wall_s': 3, 'MB': 2, 'peak_MB': 2})
+
+    def print_summary(self):
+        print(self.summary().to_string())
+
+    def trace(self):
+        """
+        :return: dictionary with the start time, every span (start and wall in seconds from the profiler's creation,
+                 bytes) and the summary
+        """
+        return {'started': self.started,
+                'spans': [span.to_dict() for span in sorted(self.spans, key=lambda s: s.start)],
+                'summary': json.loads(self.summary().reset_index().to_json(orient='records'))}
+
+    def write_trace(self, path):
+        """
+        :param path: JSON file
+        :return: path
+        """
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f, indent=2, default=str)
+        return path
+
+    def close(self):
+        """
+        Stops tracing allocations if this profiler started it.
+        """
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+
+def compare(before, after):
+    """
+    Compares the stage totals of two traces, ex. before and after a change or TRAX against the cache.
+    :param before: JSON trace file or Profiler.trace() dictionary
+    :param after: same
+    :return: dataframe indexed by stage name with wall_s and rows of both runs and the wall time ratio (after / before)
+    """
+    frames = []
+    for trace in (before, after):
+        if isinstance(trace, str):
+            with open(trace) as f:
+                trace = json.load(f)
+        frames.append(pd.DataFrame(trace['summary'], columns=['name', 'wall_s', 'rows']).set_index('name'))
+
+    df = frames[0].join(frames[1], how='outer', lsuffix='_before', rsuffix='_after')
+    df['ratio'] = df['wall_s_after'] / df['wall_s_before']
+    return df
@@ -0,0 +1,137 @@
+__author__ = "evfairchild"
+
+DATE_FORMAT = 'YYYY-MM-DD HH24:MI:SS'
+
+# Bound date parameter, ex. to_date('2020-03-31 23:59:59', 'YYYY-MM-DD HH24:MI:SS')
+TO_DATE = "to_date(?, '{}')".format(DATE_FORMAT)
+
+# Takeoff time of a flight, FLIGHT_DATE is the day and TO_HOUR / TO_MINUTE the time of day
+FLIGHT_DATETIME = "( FLIGHT_DATE + ( NVL( TO_HOUR, 0) / 24 ) + ( NVL( TO_MINUTE, 0) / 1440 ) )"
+
+# Time of an engine transaction, TRANSACTION_DATE is the day and TRANSACTION_HOUR / TRANSACTION_MINUTE the time of day
+TRANSACTION_DATETIME = "( TRUNC(TRANSACTION_DATE) + ( NVL( TRANSACTION_HOUR, 0) / 24 ) + " \
+                       "( NVL( TRANSACTION_MINUTE, 0) / 1440 ) )"
+
+# Flight hours (hours and minutes) and month of a flight
+FLIGHT_HOURS = "ROUND( FLIGHT_HOURS + ( FLIGHT_MINUTES / 60 ), 5 )"
+FLIGHT_MONTH = "to_char(FLIGHT_DATE, 'YYYY-MM')"
+
+# Most values in an Oracle IN list (ORA-01795), longer lists are split into IN lists joined by OR
+IN_LIMIT = 1000
+
+# Engine part numbers: 1887M10G% for the CFM56-5B and 2489M10G% for the LEAP-1A
+ENGINE_PN = "( PN LIKE '1887M10G%' OR PN LIKE '2489M10G%' )"
+
+
+def date_param(value):
+    """
+    :param value: date string or datetime, ex. an INSTALL_DATE from a dataframe
+    :return: YYYY-MM-DD HH:MM:SS string for a TO_DATE parameter
+    """
+    return value if isinstance(value, str) else str(value)
+
+
+def in_list(column, values):
+    """
+    :param column: ex. AC
+    :param values: list of values
+    :return: SQL condition and its parameters, ex. ("AC IN (?, ?)", ['N521VA', 'N522VA']), with at most IN_LIMIT
+             values per IN list
+    """
+    values = list(values)
+    lists = ["{} IN ({})".format(column, ', '.join('?' * len(values[i:i + IN_LIMIT])))
+             for i in range(0, max(len(values), 1), IN_LIMIT)]
+    return (lists[0] if len(lists) == 1 else ' OR '.join("( {} )".format(sql) for sql in lists)), values
+
+
+class Query(object):
+    """
+    Builds a SELECT with bind parameters (qmark style, '?', as used by pyodbc and sqlite3) so that the statement text
+    stays the same from one run to the next and the database can reuse its plan.
+        query = Query('AC_ACTUAL_FLIGHTS', ['AC', 'SUM( CYCLES ) AS FLIGHT_CYCLES']).where_in('AC', ['N521VA'])
+        df = session.read_sql(query.sql, params=query.params)
+
+    The flight time predicates (flights_between, flights_until) filter on the FLIGHT_DATE column itself so an index on
+    it can be used, and only evaluate the takeoff time (FLIGHT_DATETIME) for the flights on the first and last day of
+    the range.  This relies on TO_HOUR / TO_MINUTE being a time of day (less than 24 hours), as in TRAX.
+    """
+    def __init__(self, table, columns):
+        """
+        :param table: table in the odb schema, ex. AC_ACTUAL_FLIGHTS
+        :param columns: list of select expressions
+        """
+        self.table = table
+        self.columns = list(columns)
+        self.predicates = []
+        self.params = []
+        self.group = []
+        self.order = []
+
+    def where(self, predicate, *params):
+        """
+        :param predicate: SQL condition with a '?' for each parameter, ex. "AC = ?"
+        :param params: values bound to the placeholders, in order
+        :return: self
+        """
+        self.predicates.append("( {} )".format(predicate))
+        self.params.extend(params)
+        return self
+
+    def where_in(self, column, values):
+        """
+        :param column: ex. AC
+        :param values: list of values
+        :return: self
+        """
+        predicate, params = in_list(column, values)
+        return self.where(predicate, *params)
+
+    def flights_between(self, start, end, include_end=True):
+        """
+        Flights that took off between start and end.  Same result as
+        FLIGHT_DATETIME >= start AND FLIGHT_DATETIME <= end (or < end when include_end is False)
+        :param start: YYYY-MM-DD HH:MM:SS or datetime
+        :param end: YYYY-MM-DD HH:MM:SS or datetime
+        :param include_end: keep flights taking off exactly at end
+        :return: self
+        """
+        upper = '<=' if include_end else '<'
+        start, end = date_param(start), date_param(end)
+        # A flight takes off on FLIGHT_DATE, before FLIGHT_DATE + 1
+        self.where("FLIGHT_DATE >= {0} - 1 AND FLIGHT_DATE {1} {0}".format(TO_DATE, upper), start, end)
+        # Only flights on the boundary days need the exact takeoff time
+        return self.where("( FLIGHT_DATE >= {0} AND FLIGHT_DATE <= {0} - 1 ) OR "
+                          "( {1} >= {0} AND {1} {2} {0} )".format(TO_DATE, FLIGHT_DATETIME, upper),
+                          start, end, start, end)
+
+    def flights_until(self, end):
+        """
+        Flights that took off at or before end.  Same result as FLIGHT_DATETIME <= end
+        :param end: YYYY-MM-DD HH:MM:SS or datetime
+        :return: self
+        """
+        end = date_param(end)
+        self.where("FLIGHT_DATE <= {}".format(TO_DATE), end)
+        return self.where("FLIGHT_DATE <= {0} - 1 OR {1} <= {0}".format(TO_DATE, FLIGHT_DATETIME), end, end)
+
+    def group_by(self, *columns):
+        self.group.extend(columns)
+        return self
+
+    def order_by(self, *columns):
+        self.order.extend(columns)
+        return self
+
+    @property
+    def sql(self):
+        query = "SELECT {} FROM odb.{}".format(', '.join(self.columns), self.table)
+        if self.predicates:
+            query += " WHERE " + " AND ".join(self.predicates)
+        if self.group:
+            query += " GROUP BY " + ", ".join(self.group)
+        if self.order:
+            query += " ORDER BY " + ", ".join(self.order)
+        return query
+
+    def __str__(self):
+        return self.sql
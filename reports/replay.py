@@ -0,0 +1,89 @@
+__author__ = "evfairchild"
+
+import os
+import json
+import hashlib
+import threading
+import pandas as pd
+from reports.backend import Backend
+
+# Environment variable naming the database the tests record their fixtures from: 'trax' (ODBC) or a SQLite file,
+# see tests/replay_fixtures.py
+RECORD = 'REPORTS_RECORD'
+
+
+class ReplayConnection(object):
+    """
+    Connection of a replaying ReplayBackend, there is nothing to open or close.
+    """
+    def close(self):
+        pass
+
+
+class ReplayBackend(Backend):
+    """
+    Query results recorded once into a folder of fixtures and replayed from there, so the reports (and their tests)
+    run without TRAX.  Each result is a Parquet file named after a hash of the SQL text (whitespace aside) and its bind
+    parameters, and fixtures.json lists the SQL of each file.
+        backend = ReplayBackend('tests/fixtures/trax', record=TraxBackend())   # on the network, writes the fixtures
+        backend = ReplayBackend('tests/fixtures/trax')                         # anywhere, reads them
+    A query that was not recorded raises a LookupError instead of reaching a database.
+    """
+    def __init__(self, directory, record=None):
+        """
+        :param directory: fixture folder
+        :param record: reports.backend.Backend to run the queries on and record them from, None to replay
+        """
+        self.directory = directory
+        self.record = record
+        self.index_file = os.path.join(directory, 'fixtures.json')
+        self.index = self._read_index()
+        self._lock = threading.Lock()
+
+    def _read_index(self):
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                return json.load(f)
+        return {}
+
+    def connect(self):
+        return self.record.connect() if self.record is not None else ReplayConnection()
+
+    @staticmethod
+    def key(query, **kwargs):
+        """
+        :return: fixture name of a query and its pd.read_sql arguments, ex. params
+        """
+        params = [str(p) for p in kwargs.pop('params', None) or []]
+        other = sorted((k, str(v)) for k, v in kwargs.items())
+        return hashlib.sha1(json.dumps([' '.join(query.split()), params, other]).encode()).hexdigest()[:16]
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.parquet')
+
+    def read_sql(self, query, con, **kwargs):
+        key = self.key(query, **kwargs)
+        if self.record is None:
+            if not os.path.exists(self.path(key)):
+                raise LookupError("Query not recorded in {}, record the fixtures again ({}): {}"
+                                  .format(self.directory, RECORD, ' '.join(query.split())[:200]))
+            return pd.read_parquet(self.path(key))
+
+        df = self.record.read_sql(query, con, **kwargs)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            df.to_parquet(self.path(key))
+            # Another backend may have recorded into the folder since
+            self.index = self._read_index()
+            self.index[key] = {'sql': ' '.join(query.split()), 'params': [str(p) for p in kwargs.get('params') or []],
+                               'rows': len(df)}
+            with open(self.index_file, 'w') as f:
+                json.dump(self.index, f, indent=2, sort_keys=True)
+        return df
+
+    def read_sql_chunks(self, query, con, chunksize, **kwargs):
+        # Recorded whole, replayed a slice at a time
+        df = self.read_sql(query, con, **kwargs)
+        for start in range(0, max(len(df), 1), chunksize):
+            yield df.iloc[start:start + chunksize]
+
@@ -0,0 +1,85 @@
+__author__ = "evfairchild"
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype, is_categorical_dtype, is_integer_dtype, is_numeric_dtype
+
+# Identifiers and periods repeat on every flight record, they are stored once per value as categories
+CATEGORIES = ('AC', 'ESN', 'SN', 'YYYY-MM', 'INSTALLED_AC')
+
+# Whole numbers (cycles) are downcast to the smallest integer type that holds them.  Flight hours stay float64,
+# float32 would change the totals in the 5th decimal.
+COUNTS = ('FLIGHT_CYCLES', 'CYCLES')
+
+
+def compact(df):
+    """
+    Converts the identifier and period columns to categoricals and the cycle counts to small integers.
+    :param df: dataframe of flight records, ex. Airframe.get_flights()
+    :return: the same dataframe (converted in place)
+    """
+    for col in CATEGORIES:
+        if col in df.columns and not is_categorical_dtype(df[col]):
+            df[col] = df[col].astype('category')
+    for col in COUNTS:
+        if col in df.columns and is_numeric_dtype(df[col]) and not df[col].isnull().any():
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def to_display(df):
+    """
+    Back to the types the reports are written with: categoricals (columns and index) to their values and small
+    integers to int64.
+    :param df: dataframe
+    :return: new dataframe, or df itself when there is nothing to convert
+    """
+    columns = [col for col in df.columns if is_categorical_dtype(df[col]) or
+               (is_integer_dtype(df[col]) and df[col].dtype != np.int64)]
+    index = isinstance(df.index, pd.CategoricalIndex)
+    if not columns and not index:
+        return df
+
+    df = df.copy()
+    for col in columns:
+        if is_categorical_dtype(df[col]):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+        else:
+            df[col] = df[col].astype(np.int64)
+    if index:
+        df.index = pd.Index(np.asarray(df.index), name=df.index.name)
+    return df
+
+
+def month_category(dates):
+    """
+    YYYY-MM of each date as a categorical, formatting each month once instead of once per row.
+    :param dates: datetime series
+    :return: categorical series
+    """
+    dates = pd.to_datetime(dates)
+    months = (dates.dt.year * 100 + dates.dt.month).values
+    codes, uniques = pd.factorize(months, sort=True)
+    labels = ["{:04d}-{:02d}".format(int(m) // 100, int(m) % 100) for m in uniques]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=dates.index)
+
+
+def concat(frames, **kwargs):
+    """
+    pd.concat that keeps categorical columns categorical.  pd.concat turns them into object columns unless every frame
+    has the same categories, so the categories are unified first.  Empty frames are left out when there are others.
+    :param frames: list of dataframes with the same columns
+    :param kwargs: passed to pd.concat, ex. ignore_index
+    :return: dataframe
+    """
+    frames = list(frames)
+    # Empty frames (ex. no archive flights) would still decide the result dtypes, ex. object or float cycles
+    frames = [df for df in frames if len(df)] or frames[:1]
+    for col in frames[0].columns:
+        if all(is_categorical_dtype(df[col]) for df in frames):
+            categories = frames[0][col].cat.categories
+            for df in frames[1:]:
+                categories = categories.union(df[col].cat.categories)
+            dtype = CategoricalDtype(categories)
+            frames = [df.assign(**{col: df[col].astype(dtype)}) for df in frames]
+    return pd.concat(frames, **kwargs)
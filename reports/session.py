@@ -0,0 +1,228 @@
+__author__ = "evfairchild"
+
+import threading
+from concurrent.futures import Future
+from queue import LifoQueue, Empty
+from reports.backend import TraxBackend
+from reports.profiler import query_name, stage
+
+
+class _Statements(object):
+    """
+    Connection handed to the backend for one statement: the cursor the backend runs it on is registered with the
+    session until the statement is read, so Session.interrupt() can cancel it from another thread.
+    """
+    def __init__(self, session, con):
+        self._session = session
+        self._con = con
+        self._cursors = []
+
+    def cursor(self):
+        cursor = self._con.cursor()
+        self._cursors.append(cursor)
+        with self._session._cursor_lock:
+            self._session._cursors[id(cursor)] = (cursor, self._con)
+        return cursor
+
+    def release(self):
+        with self._session._cursor_lock:
+            for cursor in self._cursors:
+                self._session._cursors.pop(id(cursor), None)
+        self._cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+
+class Session(object):
+    """
+    One TRAX session shared by every Airframe/Engine object in a run.  It owns the connections (a primary
+    connection plus a small pool lent to its forks for concurrent work) and memoizes fleet metadata such as the tail
+    list and the fleet history pivot, so each connection and metadata query is paid once per run.
+    """
+    def __init__(self, backend=None, pool_size=4, cache=None, chunksize=None, profiler=None, exclusions=None):
+        """
+        :param backend: reports.backend.Backend, defaults to TRAX through ODBC
+        :param pool_size: maximum number of idle connections kept for the forks, see fork()
+        :param cache: optional reports.cache.FlightCache shared by the report objects
+        :param chunksize: stream the large result sets 'chunksize' rows at a time and fold them into running totals,
+                          so memory is bounded by the size of the report instead of the flight history
+        :param profiler: optional reports.profiler.Profiler timing every query and report stage
+        :param exclusions: engine transaction exclusion rules, a JSON file or reports.exclusions.ExclusionRules.  None
+                           for reports/exclusions.json.
+        """
+        self.backend = backend if backend is not None else TraxBackend()
+        self.pool_size = pool_size
+        self.cache = cache
+        self.chunksize = chunksize
+        self.profiler = profiler
+        self.exclusions = exclusions
+
+        self._connection = None
+        # Held while the connection is opened, not shared with the forks: a slow connect only blocks this session
+        self._connection_lock = threading.Lock()
+        # Session the connections are borrowed from and returned to, see fork()
+        self._parent = None
+        self._pool = LifoQueue()
+        self._lock = threading.Lock()
+        self._memo = {}
+        # Cursors of the statements running on this session, see interrupt()
+        self._cursors = {}
+        self._cursor_lock = threading.Lock()
+
+    def _open(self):
+        if self._parent is not None:
+            return self._parent._borrow()
+        return self.backend.connect()
+
+    def _borrow(self):
+        """
+        :return: an idle connection of the pool, or a new one if none are idle
+        """
+        try:
+            return self._pool.get_nowait()
+        except Empty:
+            return self._open()
+
+    def _give_back(self, con):
+        """
+        Keeps 'con' for the next fork, or closes it when the pool is full.
+        """
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(con)
+        else:
+            con.close()
+
+    @property
+    def connection(self):
+        """
+        Primary connection, opened on first use.
+        """
+        with self._connection_lock:
+            if self._connection is None:
+                self._connection = self._open()
+        return self._connection
+
+    def fork(self):
+        """
+        New session for another thread.  It shares the backend, cache and memoized metadata, and its connection is
+        borrowed from this session's pool and returned to it by close(), so the next fork reuses it.  DB-API
+        connections (pyodbc, sqlite3) must not be used by two threads at once, a connection is lent to one fork at a
+        time.
+        """
+        child = Session(backend=self.backend, pool_size=self.pool_size, cache=self.cache, chunksize=self.chunksize,
+                        profiler=self.profiler, exclusions=self.exclusions)
+        child._lock, child._memo, child._parent = self._lock, self._memo, self
+        return child
+
+    def interrupt(self):
+        """
+        Aborts the statements running on this session from another thread: their cursors are cancelled (pyodbc) or
+        their connection interrupted (sqlite3), and the reading thread gets the driver's error.
+        """
+        with self._cursor_lock:
+            running = list(self._cursors.values())
+        for cursor, con in running:
+            try:
+                if hasattr(cursor, 'cancel'):
+                    cursor.cancel()
+                elif hasattr(con, 'interrupt'):
+                    con.interrupt()
+            except Exception:
+                # Finished or closed by its own thread in the meantime, nothing left to abort
+                pass
+
+    def read_sql(self, query, con=None, **kwargs):
+        """
+        :param query: SQL string
+        :param con: connection to use, defaults to the primary connection
+        :param kwargs: passed to Backend.read_sql, ex. params
+        :return: dataframe
+        """
+        statements = _Statements(self, con if con is not None else self.connection)
+        try:
+            with self.profile(query_name(query), sql=query) as span:
+                return span.record(self.backend.read_sql(query, statements, **kwargs))
+        finally:
+            statements.release()
+
+    def read_sql_chunks(self, query, con=None, chunksize=None, **kwargs):
+        """
+        :param query: SQL string
+        :param con: connection to use, defaults to the primary connection
+        :param chunksize: rows per dataframe, defaults to the session's chunksize
+        :param kwargs: passed to Backend.read_sql, ex. params
+        :return: generator of dataframes
+        """
+        chunks = self._stream(query, _Statements(self, con if con is not None else self.connection),
+                              chunksize or self.chunksize, **kwargs)
+        if self.profiler is None:
+            return chunks
+        return self.profiler.iterate(query_name(query), chunks, sql=query)
+
+    def _stream(self, query, statements, chunksize, **kwargs):
+        try:
+            for df in self.backend.read_sql_chunks(query, statements, chunksize, **kwargs):
+                yield df
+        finally:
+            statements.release()
+
+    def profile(self, name, **attrs):
+        """
+        Times a report stage when the session is profiled.
+            with self.session.profile('engine.attribute') as span:
+                df = span.record(...)
+        :param name: stage name
+        :param attrs: extra values kept in the trace
+        :return: context manager yielding a reports.profiler.Span (or a stand-in doing nothing)
+        """
+        return stage(self.profiler, name, **attrs)
+
+    def memo(self, key, func):
+        """
+        Returns the memoized result for 'key', calling func() the first time it is requested.  Forks asking for a key
+        while it is computed wait for it instead of computing it again, and a failed func() is not memoized.
+        :param key: hashable key, ex. ('fh_fc_history', end_date)
+        :param func: function without arguments computing the value
+        """
+        with self._lock:
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                future = self._memo[key] = Future()
+
+        if owner:
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                with self._lock:
+                    if self._memo.get(key) is future:
+                        del self._memo[key]
+                future.set_exception(e)
+        return future.result()
+
+    def clear(self):
+        """
+        Drops the memoized metadata, ex. after the cache was refreshed.
+        """
+        with self._lock:
+            self._memo.clear()
+
+    def close(self):
+        """
+        Closes the connections, a fork returns its connection to the pool of the session it was forked from.
+        """
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        if self._connection is not None:
+            if self._parent is not None:
+                self._parent._give_back(self._connection)
+            else:
+                self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,141 @@
+__author__ = "evfairchild"
+
+import heapq
+import numpy as np
+import pandas as pd
+from reports.timeindex import UtilizationIndex
+
+
+def generate_fleet(n_tails=71, n_spares=None, start_date='2005-12-01', end_date='2020-03-31', flights_per_day=4.,
+                   archive_date='2012-01-01', mean_time_on_wing=700, shop_days=90, seed=0):
+    """
+    Builds a synthetic fleet in the TRAX table layout, for the SQLite backend and the benchmarks.
+    Aircraft are delivered over the first half of the period with two new engines each, fly every day and have their
+    engines swapped with spares at random intervals.  Removed engines return to the spare pool after a shop visit.
+    :param n_tails: number of aircraft
+    :param n_spares: number of spare engines, defaults to 15% of the installed engines
+    :param start_date: first delivery
+    :param end_date: last flight
+    :param flights_per_day: average flights per aircraft per day
+    :param archive_date: flights before this date are written to AC_ACTUAL_FLIGHTS_HD instead of AC_ACTUAL_FLIGHTS
+    :param mean_time_on_wing: average days between engine removals
+    :param shop_days: days a removed engine stays in the shop before it can be installed again
+    :param seed: random seed, the same arguments always give the same fleet
+    :return: dictionary of TRAX table name and dataframe (AC_MASTER, AC_ACTUAL_FLIGHTS, AC_ACTUAL_FLIGHTS_HD and
+             AC_PN_TRANSACTION_HISTORY)
+    """
+    rng = np.random.RandomState(seed)
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    n_spares = int(np.ceil(0.15 * 2 * n_tails)) if n_spares is None else n_spares
+
+    tails = np.array(['N{}VA'.format(101 + i) for i in range(n_tails)])
+    esns = np.array([str(600001 + i) for i in range(2 * n_tails + n_spares)])
+    # The LEAP-1A arrives with the later deliveries
+    pns = np.where(np.arange(len(esns)) < len(esns) * 0.8, '1887M10G01', '2489M10G01')
+
+    delivery = start + pd.to_timedelta(np.sort(rng.randint(0, max((end - start).days // 2, 1), n_tails)), unit='D')
+    flights = _generate_flights(rng, tails, delivery, end, flights_per_day)
+
+    transactions = _generate_transactions(rng, tails, esns, pns, delivery, end, mean_time_on_wing, shop_days)
+    transactions = _add_time_since_install(transactions, flights)
+
+    archived = flights['FLIGHT_DATE'] < pd.Timestamp(archive_date)
+    return {'AC_MASTER': pd.DataFrame({'AC': tails}),
+            'AC_ACTUAL_FLIGHTS': flights.loc[~archived].reset_index(drop=True),
+            'AC_ACTUAL_FLIGHTS_HD': flights.loc[archived].reset_index(drop=True),
+            'AC_PN_TRANSACTION_HISTORY': transactions}
+
+
+def _generate_flights(rng, tails, delivery, end, flights_per_day):
+    days = (end - delivery).days + 1
+    per_day = [rng.poisson(flights_per_day, max(d, 0)) for d in days]
+
+    counts = np.array([p.sum() for p in per_day])
+    ac = np.repeat(tails, counts)
+    day_offset = np.concatenate([np.repeat(np.arange(len(p)), p) for p in per_day]) if len(per_day) else np.array([])
+    flight_date = np.repeat(delivery.values, counts) + day_offset.astype('timedelta64[D]')
+
+    n = len(ac)
+    minutes = rng.randint(30, 330, n)
+    return pd.DataFrame({'AC': ac,
+                         'FLIGHT_DATE': pd.to_datetime(flight_date),
+                         'TO_HOUR': rng.randint(5, 23, n).astype(float),
+                         'TO_MINUTE': rng.randint(0, 60, n).astype(float),
+                         'FLIGHT_HOURS': (minutes // 60).astype(float),
+                         'FLIGHT_MINUTES': (minutes % 60).astype(float),
+                         'CYCLES': np.ones(n, dtype=np.int64)})
+
+
+def _generate_transactions(rng, tails, esns, pns, delivery, end, mean_time_on_wing, shop_days):
+    rows = []
+
+    def record(esn, tx_type, ac, when, position, reason=None):
+        rows.append({'SN': esns[esn], 'PN': pns[esn], 'TRANSACTION_TYPE': tx_type, 'AC': ac,
+                     'TRANSACTION_DATE': when.normalize(), 'TRANSACTION_HOUR': float(when.hour),
+                     'TRANSACTION_MINUTE': float(when.minute),
+                     'SCHEDULE_CATEGORY': None if reason is None else
+                     ('UNSCHEDULED' if reason != 'LLP LIMIT' else 'SCHEDULED'),
+                     'POSITION': str(position), 'REMOVAL_REASON': reason})
+
+    # Two new engines per aircraft at delivery, the rest are spares
+    events = []
+    spares = list(range(2 * len(tails), len(esns)))
+    for i, (ac, delivered) in enumerate(zip(tails, delivery)):
+        for position in (1, 2):
+            esn = 2 * i + position - 1
+            installed = delivered + pd.Timedelta(hours=int(rng.randint(1, 12)))
+            record(esn, 'INSTALL', ac, installed, position)
+            removal = installed + pd.Timedelta(days=int(rng.exponential(mean_time_on_wing)) + 30)
+            heapq.heappush(events, (removal, ac, position, esn))
+
+    in_shop = []
+    while events:
+        removal, ac, position, esn = heapq.heappop(events)
+        if removal > end:
+            continue
+
+        record(esn, 'REMOVE', ac, removal, position, reason=rng.choice(['LLP LIMIT', 'EGT MARGIN', 'BIRD STRIKE']))
+        heapq.heappush(in_shop, (removal + pd.Timedelta(days=shop_days), esn))
+
+        while in_shop and in_shop[0][0] <= removal:
+            spares.append(heapq.heappop(in_shop)[1])
+        if not spares:
+            ready, spare = heapq.heappop(in_shop)
+            spares.append(spare)
+            removal = max(removal, ready)
+
+        spare = spares.pop(rng.randint(len(spares)))
+        installed = removal + pd.Timedelta(hours=int(rng.randint(2, 48)))
+        if installed > end:
+            continue
+        record(spare, 'INSTALL', ac, installed, position)
+        next_removal = installed + pd.Timedelta(days=int(rng.exponential(mean_time_on_wing)) + 30)
+        heapq.heappush(events, (next_removal, ac, position, spare))
+
+    return pd.DataFrame(rows).sort_values(by=['TRANSACTION_DATE', 'TRANSACTION_HOUR'], kind='mergesort',
+                                          ignore_index=True)
+
+
+def _add_time_since_install(transactions, flights):
+    """
+    Fills HOURS_INSTALLED, MINUTES_INSTALLED and CYCLES_INSTALLED on removal records.
+    """
+    df = transactions.copy()
+    df['WHEN'] = df['TRANSACTION_DATE'] + pd.to_timedelta(df['TRANSACTION_HOUR'] * 60 + df['TRANSACTION_MINUTE'],
+                                                          unit='m')
+    installs = df.loc[df['TRANSACTION_TYPE'] == 'INSTALL', ['SN', 'AC', 'WHEN']].sort_values(by='WHEN')
+    removals = df.loc[df['TRANSACTION_TYPE'] == 'REMOVE'].reset_index().sort_values(by='WHEN')
+    removals = pd.merge_asof(removals, installs.rename(columns={'WHEN': 'INSTALLED'}), left_on='WHEN',
+                             right_on='INSTALLED', by=['SN', 'AC'], direction='backward')
+
+    index = UtilizationIndex(flights.assign(FLIGHT_DATETIME=flights['FLIGHT_DATE'] + pd.to_timedelta(
+        flights['TO_HOUR'] * 60 + flights['TO_MINUTE'], unit='m'),
+        FLIGHT_HOURS=flights['FLIGHT_HOURS'] + flights['FLIGHT_MINUTES'] / 60,
+        FLIGHT_CYCLES=flights['CYCLES']), key='AC')
+    fh, fc = index.batch_between(removals['AC'].values, removals['INSTALLED'].values, removals['WHEN'].values)
+
+    df['HOURS_INSTALLED'], df['MINUTES_INSTALLED'], df['CYCLES_INSTALLED'] = np.nan, np.nan, np.nan
+    df.loc[removals['index'], 'HOURS_INSTALLED'] = np.floor(fh)
+    df.loc[removals['index'], 'MINUTES_INSTALLED'] = np.round((fh - np.floor(fh)) * 60)
+    df.loc[removals['index'], 'CYCLES_INSTALLED'] = fc
+    return df.drop(columns=['WHEN'])
@@ -0,0 +1,112 @@
+__author__ = "evfairchild"
+
+import numpy as np
+import pandas as pd
+
+
+class UtilizationIndex(object):
+    """
+    In-memory prefix-sum index of flight hours and cycles by key (AC registration or ESN).
+
+    Flights are sorted by key and FLIGHT_DATETIME and the running FH/FC totals are stored next to them, so any as-of
+    or interval total is a binary search instead of a SUM query.  Lookups are inclusive of flights departing exactly
+    at the requested time (whole seconds).  Note that Airframe.get_fh_fc() compares FLIGHT_DATE, not the departure
+    time, so the two only differ for an as-of time part way through a day.
+    """
+    def __init__(self, flights, key='AC'):
+        """
+        :param flights: dataframe with 'key', FLIGHT_DATETIME, FLIGHT_HOURS and FLIGHT_CYCLES,
+                        ex. Airframe.get_flights() or Engine.get_esn_flights()
+        :param key: column identifying the tail or engine, AC or ESN
+        """
+        self.key = key
+        self.keys = pd.Index(np.asarray(flights[key].dropna().unique())).sort_values()
+
+        codes = self.keys.get_indexer(flights[key])
+        times = self._to_seconds(flights['FLIGHT_DATETIME'])
+        keep = codes >= 0
+        order = np.lexsort((times[keep], codes[keep]))
+
+        codes, times = codes[keep][order], times[keep][order]
+        self.starts = np.searchsorted(codes, np.arange(len(self.keys) + 1), side='left')
+
+        # One monotonic int64 array: each key owns a block of 'span' seconds, so a single searchsorted covers all keys
+        self.t0 = (times.min() - 1) if len(times) else 0
+        self.span = (times.max() - self.t0 + 2) if len(times) else 1
+        self.flat = codes * self.span + (times - self.t0)
+
+        # Leading zero so that cum[i] is the total of the first i flights
+        hours = flights['FLIGHT_HOURS'].values[keep][order].astype(np.float64)
+        cycles = flights['FLIGHT_CYCLES'].values[keep][order].astype(np.float64)
+        self.cum_hours = np.concatenate([[0.], np.cumsum(hours)])
+        self.cum_cycles = np.concatenate([[0.], np.cumsum(cycles)])
+
+    @staticmethod
+    def _to_seconds(timestamps):
+        return pd.to_datetime(np.asarray(timestamps).ravel()).values.astype('datetime64[s]').astype(np.int64)
+
+    def _codes(self, keys):
+        keys = np.asarray([k.upper() if isinstance(k, str) else k for k in np.asarray(keys, dtype=object).ravel()],
+                          dtype=object)
+        codes = self.keys.get_indexer(keys)
+        if (codes < 0).any():
+            raise LookupError("{} {} invalid.".format(self.key, ', '.join(str(k) for k in keys[codes < 0][:5])))
+        return codes
+
+    def _position(self, codes, times, side='right'):
+        """
+        Index into cum_hours/cum_cycles of the flights at or before (side='right') or strictly before (side='left')
+        'times' for each key.
+        """
+        offset = np.clip(times - self.t0, 0, self.span - 1)
+        return np.searchsorted(self.flat, codes * self.span + offset, side=side)
+
+    def batch(self, keys, timestamps):
+        """
+        As-of totals for arrays of keys and timestamps (broadcast against each other).
+        :param keys: AC registration(s) or ESN(s)
+        :param timestamps: as-of time(s), ex. '2020-03-31 23:59:59'
+        :return: tuple of numpy arrays (flight hours, flight cycles)
+        """
+        keys, timestamps = np.broadcast_arrays(np.asarray(keys, dtype=object), np.asarray(timestamps, dtype=object))
+        codes = self._codes(keys)
+        pos = self._position(codes, self._to_seconds(timestamps))
+        return self.cum_hours[pos] - self.cum_hours[self.starts[codes]], \
+            self.cum_cycles[pos] - self.cum_cycles[self.starts[codes]]
+
+    def batch_between(self, keys, starts, ends):
+        """
+        Interval totals (start <= FLIGHT_DATETIME <= end) for arrays of keys, start and end times.
+        :return: tuple of numpy arrays (flight hours, flight cycles)
+        """
+        keys, starts, ends = np.broadcast_arrays(np.asarray(keys, dtype=object), np.asarray(starts, dtype=object),
+                                                 np.asarray(ends, dtype=object))
+        codes = self._codes(keys)
+        first = self._position(codes, self._to_seconds(starts), side='left')
+        last = self._position(codes, self._to_seconds(ends))
+        last = np.maximum(last, first)
+        return self.cum_hours[last] - self.cum_hours[first], self.cum_cycles[last] - self.cum_cycles[first]
+
+    def asof(self, key, timestamp):
+        """
+        :return: tuple of flight hours and flight cycles for a single key up to and including 'timestamp'
+        """
+        fh, fc = self.batch([key], [timestamp])
+        return fh[0], fc[0]
+
+    def between(self, key, start, end):
+        """
+        :return: tuple of flight hours and flight cycles for a single key from 'start' to 'end' (inclusive)
+        """
+        fh, fc = self.batch_between([key], [start], [end])
+        return fh[0], fc[0]
+
+    def get_fh_fc(self, keys, asof):
+        """
+        Same layout as Airframe.get_fh_fc()
+        :return: dataframe indexed by key with FLIGHT_HOURS and FLIGHT_CYCLES
+        """
+        keys = ([keys] if type(keys) != list else keys)
+        fh, fc = self.batch(keys, asof)
+        return pd.DataFrame({'FLIGHT_HOURS': fh, 'FLIGHT_CYCLES': fc},
+                            index=pd.Index([k.upper() for k in keys], name=self.key))
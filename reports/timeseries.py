@@ -0,0 +1,91 @@
+__author__ = "evfairchild"
+
+import numpy as np
+import pandas as pd
+
+VALUES = ('FLIGHT_HOURS', 'FLIGHT_CYCLES')
+
+# Rollup name: pandas frequency
+FREQUENCIES = {'daily': 'D', 'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q', 'yearly': 'A'}
+
+
+class UtilizationSeries(object):
+    """
+    Cumulative flight hours and cycles of every key (AC registration or ESN) at the end of each day, from one pass
+    over the flight records (a sum per key and day, then a running total).  Weekly, monthly, quarterly and yearly
+    series are taken from the daily series, the value on the last day of each period, instead of being read again.
+        series = Airframe(start, end).get_series()
+        series.cumulative('quarterly')['FLIGHT_HOURS']['N521VA']
+        series.utilization('weekly', ['N521VA', 'N522VA'])
+    Totals count from the first flight of each key in the records, ex. since the first install in TRAX for an ESN.
+    """
+    def __init__(self, flights, key='AC', end=None):
+        """
+        :param flights: dataframe with 'key', FLIGHT_DATETIME, FLIGHT_HOURS and FLIGHT_CYCLES,
+                        ex. Airframe.get_flights() or Engine.get_esn_flights()
+        :param key: column identifying the tail or engine, AC or ESN
+        :param end: last day of the series, ex. 2020-03-31 23:59:59.  Later flights are left out.  None for the day of
+                    the last flight.
+        """
+        self.key = key
+        days = pd.to_datetime(np.asarray(flights['FLIGHT_DATETIME'])).floor('D')
+        keep = pd.notnull(np.asarray(flights[key], dtype=object))
+        if end is not None:
+            keep &= days <= pd.Timestamp(end).floor('D')
+
+        self.keys = pd.Index(np.asarray(flights[key].values[keep], dtype=object)).unique().sort_values()
+        last = pd.Timestamp(end).floor('D') if end is not None else days[keep].max()
+        self.dates = pd.date_range(days[keep].min(), last, freq='D', name='DATE') if keep.any() else \
+            pd.DatetimeIndex([], name='DATE')
+
+        # Flat (day, key) cell of each flight, summed with bincount and accumulated down the days
+        cells = self.dates.get_indexer(days[keep]) * len(self.keys) + \
+            self.keys.get_indexer(np.asarray(flights[key].values[keep], dtype=object))
+        size = len(self.dates) * len(self.keys)
+        columns = []
+        for value in VALUES:
+            grid = np.bincount(cells, weights=pd.to_numeric(flights[value]).values[keep].astype(np.float64),
+                               minlength=size).reshape(len(self.dates), len(self.keys)).cumsum(axis=0)
+            columns.append(np.round(grid).astype(np.int64) if value == 'FLIGHT_CYCLES' else grid)
+
+        self.daily = pd.DataFrame(np.hstack(columns) if size else np.empty((len(self.dates), 0)), index=self.dates,
+                                  columns=pd.MultiIndex.from_product([VALUES, self.keys], names=[None, key]))
+        self.daily = self.daily.astype({(VALUES[1], k): np.int64 for k in self.keys})
+        self._rollups = {'D': self.daily}
+
+    def _select(self, df, keys):
+        if keys is None:
+            return df
+        keys = [keys] if type(keys) != list else keys
+        keys = [k.upper() if self.key == 'AC' else k for k in keys]
+        missing = [k for k in keys if k not in self.keys]
+        if missing:
+            raise LookupError("{} {} invalid.".format(self.key, ', '.join(str(k) for k in missing[:5])))
+        return df.loc[:, pd.MultiIndex.from_product([VALUES, keys], names=df.columns.names)]
+
+    def cumulative(self, freq='daily', keys=None):
+        """
+        :param freq: daily, weekly, monthly, quarterly, yearly or a pandas frequency, ex. 'W-SUN'
+        :param keys: AC registration(s) or ESN(s), None for every key
+        :return: dataframe indexed by DATE (the last day of each period) with columns (FLIGHT_HOURS / FLIGHT_CYCLES,
+                 key) holding the totals at the end of that day
+        """
+        freq = FREQUENCIES.get(freq, freq)
+        if freq not in self._rollups:
+            # The daily series has every day, the last row of each period is its closing total
+            self._rollups[freq] = self.daily.resample(freq).last()
+        return self._select(self._rollups[freq], keys)
+
+    def utilization(self, freq='daily', keys=None):
+        """
+        :return: cumulative() as the flight hours and cycles flown in each period
+        """
+        df = self.cumulative(freq, keys)
+        return df - df.shift(1, fill_value=0)
+
+    def to_long(self, freq='daily', keys=None):
+        """
+        :return: cumulative() as one row per DATE and key, with FLIGHT_HOURS and FLIGHT_CYCLES
+        """
+        df = self.cumulative(freq, keys).stack(level=self.key)
+        return df.reset_index()[['DATE', self.key] + list(VALUES)]
@@ -0,0 +1,41 @@
+"""
+Writes the synthetic fleet the fixtures in tests/fixtures/trax were recorded from to a SQLite file: 71 tails since
+2005-12, renamed to the registrations the tests use.  To record the fixtures again, ex. after a query changed:
+
+    python tests/fixtures/make_trax.py trax.db
+    rm tests/fixtures/trax/*
+    REPORTS_RECORD=trax.db python -m pytest tests/test_airframe.py tests/test_engine.py
+"""
+__author__ = "evfairchild"
+
+import os
+import sys
+
+# Run as a script, the repository root is not on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from reports.backend import SQLiteBackend
+from reports.synthetic import generate_fleet
+
+NUMBERS = list(range(281, 285)) + list(range(521, 531)) + list(range(621, 630)) + list(range(835, 866)) + \
+    list(range(921, 938))
+TAILS = ['N{}VA'.format(n) for n in NUMBERS]
+
+
+def make_fleet():
+    """
+    :return: dictionary of TRAX table name and dataframe, see reports.synthetic.generate_fleet()
+    """
+    fleet = generate_fleet(n_tails=len(TAILS), start_date='2005-12-01', end_date='2020-03-31', flights_per_day=0.15,
+                           archive_date='2012-01-01', seed=1)
+    rename = dict(zip(fleet['AC_MASTER']['AC'], TAILS))
+    for df in fleet.values():
+        df['AC'] = df['AC'].map(rename).fillna(df['AC'])
+    return fleet
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit("usage: python tests/fixtures/make_trax.py DATABASE")
+    SQLiteBackend(sys.argv[1]).load(make_fleet()).close()
+    print("Written {}".format(sys.argv[1]))
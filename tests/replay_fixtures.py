@@ -0,0 +1,19 @@
+import os
+from reports.backend import TraxBackend, SQLiteBackend
+from reports.replay import ReplayBackend, RECORD
+
+# Query results recorded from the synthetic fleet of tests/fixtures/make_trax.py
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'trax')
+
+
+def fixture_backend(directory=FIXTURES):
+    """
+    Backend of the tests that need TRAX.  They replay the fixtures in 'directory', or record them again when the
+    REPORTS_RECORD environment variable is set:
+        REPORTS_RECORD=trax.db python -m pytest tests/test_airframe.py tests/test_engine.py
+    :return: reports.replay.ReplayBackend
+    """
+    source = os.environ.get(RECORD)
+    if not source:
+        return ReplayBackend(directory)
+    return ReplayBackend(directory, record=TraxBackend() if source == 'trax' else SQLiteBackend(source))
@@ -2,10 +2,14 @@ import sys
 import unittest
 import logging
 from reports.airframe import Airframe
+from reports.session import Session
+from replay_fixtures import fixture_backend
 
 fleet_size = 71
 start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
-A = Airframe(start_date, end_date)
+# Query results recorded from a synthetic fleet (tests/fixtures/make_trax.py), not TRAX data.  Recording them again
+# needs REPORTS_RECORD, see tests/replay_fixtures.py
+A = Airframe(start_date, end_date, session=Session(backend=fixture_backend()))
 logger = logging.getLogger("Airframe unit tests starting...")
 
 
@@ -0,0 +1,166 @@
+import sys
+import tempfile
+import unittest
+import logging
+import pandas as pd
+from reports import schema
+from reports.accumulator import RunningTotals
+from reports.airframe import Airframe
+from reports.engine import Engine
+from reports.backend import SQLiteBackend
+from reports.cache import FlightCache
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+fleet_size = 12
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+fleet = generate_fleet(n_tails=fleet_size, start_date='2012-01-01', end_date='2020-04-15', archive_date='2016-01-01',
+                       mean_time_on_wing=400)
+S = Session(backend=SQLiteBackend().load(fleet))
+A = Airframe(start_date, end_date, session=S)
+E = Engine(start_date, end_date, session=S)
+logger = logging.getLogger("SQLite backend unit tests starting...")
+
+
+def assert_esn_frames_equal(left, right):
+    left, right = left.sort_index(kind='mergesort'), right.sort_index(kind='mergesort')
+    cols = [col for col in left.columns if col != 'INSTALLED_AC']
+    pd.testing.assert_frame_equal(left[cols].astype(float), right[cols].astype(float))
+    assert list(left['INSTALLED_AC'].fillna('')) == list(right['INSTALLED_AC'].fillna(''))
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    def test_synthetic_fleet(self):
+        logger.info("Testing synthetic fleet tables.")
+        tx = fleet['AC_PN_TRANSACTION_HISTORY']
+        self.assertEqual(len(A.tails), fleet_size)
+        self.assertGreater(len(fleet['AC_ACTUAL_FLIGHTS_HD']), 0)
+        self.assertGreater((tx['TRANSACTION_TYPE'] == 'REMOVE').sum(), 0)
+        self.assertEqual(len(generate_fleet(n_tails=3, seed=1)['AC_PN_TRANSACTION_HISTORY']),
+                         len(generate_fleet(n_tails=3, seed=1)['AC_PN_TRANSACTION_HISTORY']))
+
+    def test_airframe(self):
+        logger.info("Testing Airframe report on the SQLite backend.")
+        df = A.run()
+        flights = pd.concat([fleet['AC_ACTUAL_FLIGHTS'], fleet['AC_ACTUAL_FLIGHTS_HD']])
+        month = flights.loc[flights['FLIGHT_DATE'].dt.strftime('%Y-%m') == '2020-03']
+
+        self.assertEqual(df.shape[0], fleet_size + 1)
+        self.assertEqual(df[('FLIGHT_CYCLES', '2020-03')]['All'], month['CYCLES'].sum())
+        # Lifetime totals include the archived flights
+        self.assertEqual(df[('FLIGHT_CYCLES', 'All')]['All'], flights.loc[flights['FLIGHT_DATE'] <= '2020-03-31',
+                                                                          'CYCLES'].sum())
+        asof = flights.loc[flights['FLIGHT_DATE'] <= '2020-03-31']
+        self.assertAlmostEqual(A.get_fh(A.tails, asof='2020-03-31').sum(),
+                               (asof['FLIGHT_HOURS'] + asof['FLIGHT_MINUTES'] / 60).round(5).sum(), places=3)
+
+    def test_month_totals(self):
+        logger.info("Testing month and lifetime totals against the history pivot.")
+        history = A.get_fh_fc_by_month()
+        pivot = A.get_fh_fc_history()
+        pd.testing.assert_frame_equal(A.month_totals(history, 'AC'), A.filter_to_yyyy_mm(pivot))
+        pd.testing.assert_frame_equal(A.month_totals(history, 'AC', '2019-07'), A.filter_to_period(pivot, '2019-07'))
+
+        records = E.get_esn_flights()
+        pivot = pd.pivot_table(schema.to_display(records), index=['ESN'], columns=['YYYY-MM'],
+                               values=['FLIGHT_HOURS', 'FLIGHT_CYCLES'], fill_value=0, aggfunc='sum', margins=True)
+        pd.testing.assert_frame_equal(E.month_totals(records, 'ESN'), E.filter_to_yyyy_mm(pivot))
+
+    def test_engine_modes(self):
+        logger.info("Testing Engine run modes against each other.")
+        vectorized = E.run(mode='vectorized')
+        assert_esn_frames_equal(E.run(mode='loop'), vectorized)
+        assert_esn_frames_equal(E.run(mode='pushdown'), vectorized)
+
+    def test_tsi_csi_pairs(self):
+        logger.info("Testing bulk time and cycles since install against the removal records.")
+        pairs = E.get_tsi_csi_pairs()
+        tx = fleet['AC_PN_TRANSACTION_HISTORY']
+        removals = tx.loc[tx['TRANSACTION_TYPE'] == 'REMOVE']
+        removals = removals.assign(REMOVAL_DATE=removals['TRANSACTION_DATE'] + pd.to_timedelta(
+            removals['TRANSACTION_HOUR'] * 60 + removals['TRANSACTION_MINUTE'], unit='m'))
+        df = pairs.merge(removals, left_on=['ESN', 'AC', 'REMOVAL_DATE'], right_on=['SN', 'AC', 'REMOVAL_DATE'])
+        # Including the pairs straddling the archive date, read from both flight tables
+        self.assertGreater(((df['INSTALL_DATE'] < '2016-01-01') & (df['REMOVAL_DATE'] > '2016-01-01')).sum(), 0)
+        self.assertListEqual(list(df['CSI']), list(df['CYCLES_INSTALLED'].astype(int)))
+        self.assertLess(abs(df['TSI'] - df['HOURS_INSTALLED'] - df['MINUTES_INSTALLED'] / 60).max(), 0.01)
+
+        life = E.get_tsn_csn()
+        totals = E.run().drop('All').reindex(life.index)
+        self.assertAlmostEqual(abs(totals[('FLIGHT_HOURS', 'All')] - life['TSN']).max(), 0, places=6)
+        self.assertListEqual(list(totals[('FLIGHT_CYCLES', 'All')]), list(life['CSN']))
+        # The report only names the aircraft of ESNs that flew in the month
+        flew = totals['INSTALLED_AC'].notnull()
+        self.assertListEqual(list(life.loc[flew, 'INSTALLED_AC']), list(totals.loc[flew, 'INSTALLED_AC']))
+
+    def test_streaming(self):
+        logger.info("Testing chunked reads folded into running totals.")
+        session = Session(backend=S.backend, chunksize=5000)
+        pd.testing.assert_frame_equal(Airframe(start_date, end_date, session=session).run(), A.run(),
+                                      check_dtype=False)
+        assert_esn_frames_equal(Engine(start_date, end_date, session=session).run(), E.run())
+
+        # A past month, with flights after its end in the database and in the cache
+        past = ('2019-06-01 00:00:00', '2019-06-30 23:59:59')
+        vectorized = Engine(*past, session=S).run()
+        assert_esn_frames_equal(Engine(*past, session=session).run(), vectorized)
+        cached = Session(backend=S.backend, chunksize=5000, cache=FlightCache(tempfile.mkdtemp()))
+        assert_esn_frames_equal(Engine(*past, session=cached).run(), vectorized)
+        flights = list(Airframe(*past, session=cached).iter_flights(end=past[1]))
+        self.assertTrue(all(len(chunk) <= 5000 for chunk in flights))
+        self.assertLessEqual(max(chunk['FLIGHT_DATETIME'].max() for chunk in flights), pd.Timestamp(past[1]))
+
+        chunks = [fleet['AC_ACTUAL_FLIGHTS'].iloc[i:i + 1000] for i in range(0, 5000, 1000)]
+        totals = RunningTotals(['AC'], values=['CYCLES'])
+        for chunk in chunks:
+            totals.add(chunk)
+        expected = pd.concat(chunks).groupby('AC')['CYCLES'].sum()
+        self.assertListEqual(list(totals.frame()['CYCLES']), list(expected))
+        self.assertEqual(totals.rows, 5000)
+
+    def test_cache(self):
+        logger.info("Testing cached reports against the database.")
+        cache = FlightCache(tempfile.mkdtemp())
+        session = Session(backend=S.backend, cache=cache)
+        cached = Engine(start_date, end_date, session=session)
+
+        pd.testing.assert_frame_equal(A.run(), Airframe(start_date, end_date, session=session).run())
+        assert_esn_frames_equal(cached.run(), E.run())
+        self.assertEqual(len(cached.get_removals()), len(E.get_removals()))
+        self.assertEqual(cache.sync(session, full=False), {})
+
+    def test_sync(self):
+        logger.info("Testing that a cache sync only appends the rows from the watermark on.")
+        tables = generate_fleet(n_tails=3, start_date='2019-01-01', end_date='2020-03-31', seed=2)
+        backend = SQLiteBackend().load(tables)
+        session = Session(backend=backend)
+        cache = FlightCache(tempfile.mkdtemp())
+        cache.sync(session)
+
+        delta = {}
+        for table in ('AC_ACTUAL_FLIGHTS', 'AC_PN_TRANSACTION_HISTORY'):
+            date_col = backend.DATASETS[FlightCache.TABLES[table]][1]
+            watermark = pd.Timestamp(cache.watermark(table))
+            df = tables[table].sort_values(date_col).tail(4).copy()
+            # Two new rows on the watermark day itself, two after it
+            df[date_col] = [watermark, watermark, watermark + pd.Timedelta(days=1), watermark + pd.Timedelta(days=20)]
+            backend.load({table: df}, replace=False)
+            # The watermark day is read again, the rows before it are kept from the cache
+            delta[table] = int((tables[table][date_col] >= watermark).sum()) + len(df)
+
+        fetched = FlightCache(cache.directory).sync(session)
+        full = FlightCache(tempfile.mkdtemp())
+        full.sync(session)
+
+        for table, rows in delta.items():
+            synced = FlightCache(cache.directory).read(table)
+            self.assertEqual(fetched[table], rows)
+            self.assertEqual(len(synced), len(tables[table]) + 4)
+            pd.testing.assert_frame_equal(synced.sort_values(list(synced.columns), ignore_index=True),
+                                          full.read(table).sort_values(list(synced.columns), ignore_index=True))
+        backend.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
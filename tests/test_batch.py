@@ -0,0 +1,66 @@
+import sys
+import unittest
+import logging
+import pandas as pd
+from reports.airframe import Airframe
+from reports.engine import Engine
+from reports.backend import SQLiteBackend
+from reports.batch import BatchReport, month_range, period_bounds
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+periods = month_range('2019-12', '2020-03')
+backend = SQLiteBackend().load(generate_fleet(n_tails=8, start_date='2016-01-01', end_date='2020-03-31'))
+results = BatchReport(periods, session=Session(backend=backend)).run()
+logger = logging.getLogger("Batch report unit tests starting...")
+
+
+class TestBatchReport(unittest.TestCase):
+    def test_periods(self):
+        logger.info("Testing month ranges.")
+        self.assertListEqual(month_range('2019-11', '2020-02'), ['2019-11', '2019-12', '2020-01', '2020-02'])
+        self.assertEqual(period_bounds('2020-02'), ('2020-02-01 00:00:00', '2020-02-29 23:59:59'))
+        self.assertListEqual(list(results), periods)
+
+    def test_airframe_matches_single_runs(self):
+        logger.info("Testing batch airframe sheets against one run per month.")
+        for period in periods:
+            single = Airframe(*period_bounds(period), session=Session(backend=backend)).run()
+            pd.testing.assert_frame_equal(results[period]['airframe'], single, check_dtype=False)
+
+    def test_engines(self):
+        logger.info("Testing batch engine sheets.")
+        last = Engine(*period_bounds(periods[-1]), session=Session(backend=backend))
+        single = last.run().sort_index(kind='mergesort')
+        batch = results[periods[-1]]['engines'].sort_index(kind='mergesort')
+        pd.testing.assert_frame_equal(batch.drop(columns='INSTALLED_AC'), single.drop(columns='INSTALLED_AC'),
+                                      check_dtype=False)
+        self.assertListEqual(list(batch['INSTALLED_AC'].fillna('')), list(single['INSTALLED_AC'].fillna('')))
+
+        # Earlier months: cumulative totals as of the month end
+        index = last.get_esn_index()
+        df = results['2020-01']['engines'].drop('All')
+        fh, fc = index.batch(list(df.index), period_bounds('2020-01')[1])
+        self.assertAlmostEqual(abs(df[('FLIGHT_HOURS', 'All')].values - fh).max(), 0, places=6)
+        self.assertAlmostEqual(abs(df[('FLIGHT_CYCLES', 'All')].values - fc).max(), 0, places=6)
+
+    def test_past_months(self):
+        logger.info("Testing a run for a past month counts no later flights, like the batch.")
+        for period in periods[:-1]:
+            engine = Engine(*period_bounds(period), session=Session(backend=backend))
+            batch = results[period]['engines'].drop(columns='INSTALLED_AC').sort_index(kind='mergesort')
+            for mode in ('vectorized', 'pushdown'):
+                single = engine.run(mode).drop(columns='INSTALLED_AC').sort_index(kind='mergesort')
+                pd.testing.assert_frame_equal(batch.astype(float), single.astype(float))
+
+    def test_removals(self):
+        logger.info("Testing batch removal sheets.")
+        for period in periods:
+            single = Engine(*period_bounds(period), session=Session(backend=backend)).get_removals()
+            self.assertEqual(len(results[period]['removals']), len(single))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,35 @@
+import sys
+import unittest
+import logging
+import pandas as pd
+from reports.engine import Engine
+from reports.session import Session
+from replay_fixtures import fixture_backend
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+# Query results recorded from a synthetic fleet (tests/fixtures/make_trax.py), not TRAX data.  Recording them again
+# needs REPORTS_RECORD, see tests/replay_fixtures.py
+E = Engine(start_date, end_date, session=Session(backend=fixture_backend()))
+logger = logging.getLogger("Engine unit tests starting...")
+
+
+class TestEngine(unittest.TestCase):
+    def test_pushdown_parity(self):
+        logger.info("Testing push-down ESN history against client side attribution.")
+        client = E.run(mode='vectorized').sort_index(kind='mergesort')
+        server = E.run(mode='pushdown').sort_index(kind='mergesort')
+        cols = [col for col in client.columns if col != 'INSTALLED_AC']
+
+        self.assertListEqual(list(client.index), list(server.index))
+        pd.testing.assert_frame_equal(client[cols].astype(float), server[cols].astype(float))
+        self.assertListEqual(list(client['INSTALLED_AC'].fillna('')), list(server['INSTALLED_AC'].fillna('')))
+
+    def test_run_mode(self):
+        logger.info("Testing Engine run mode input.")
+        self.assertRaises(ValueError, E.run, mode='apply')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
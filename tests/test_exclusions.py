@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import logging
+from contextlib import redirect_stdout
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.cache import FlightCache
+from reports.engine import Engine
+from reports.exclusions import ExclusionRules, find_anomalies
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+fleet = generate_fleet(n_tails=3, start_date='2016-01-01', end_date='2020-04-15', archive_date='2017-01-01')
+transactions = fleet['AC_PN_TRANSACTION_HISTORY']
+
+
+def record(sn, tx_type, ac, when, position):
+    when = pd.Timestamp(when)
+    return {'SN': sn, 'PN': '1887M10G01', 'TRANSACTION_TYPE': tx_type, 'AC': ac, 'TRANSACTION_DATE': when.normalize(),
+            'TRANSACTION_HOUR': float(when.hour), 'TRANSACTION_MINUTE': float(when.minute), 'POSITION': position}
+
+
+# Bad records: an install repeated a day later, a removal of an engine never installed, the erroneous ESN of the
+# default rules and an install of an engine still on another aircraft
+first = transactions.iloc[0]
+repeated = record(first['SN'], 'INSTALL', first['AC'], first['TRANSACTION_DATE'] + pd.Timedelta(days=1, hours=6),
+                  first['POSITION'])
+bad = pd.DataFrame([repeated,
+                    record('600099', 'REMOVE', 'N103VA', '2019-01-01 12:00', '1'),
+                    record('397549', 'INSTALL', 'N102VA', '2018-01-01 12:00', '1'),
+                    record('600003', 'INSTALL', 'N103VA', '2017-10-01 12:00', '3')])
+fleet['AC_PN_TRANSACTION_HISTORY'] = pd.concat([transactions, bad], ignore_index=True)
+backend = SQLiteBackend().load(fleet)
+E = Engine(start_date, end_date, session=Session(backend=backend))
+logger = logging.getLogger("Exclusion rules unit tests starting...")
+
+
+def legacy(installs):
+    # The loop the default rules replace
+    for i, install in installs.iterrows():
+        if install['AC'] == 'N521VA' and str(install['TRANSACTION_DATE']) == '2006-04-04 00:00:00':
+            installs.drop([i], inplace=True)
+        elif install['SN'] == '397549':
+            installs.drop([i], inplace=True)
+        elif install['SN'] == '643151' and str(install['TRANSACTION_DATE']) == '2010-09-27 00:00:00':
+            installs.drop([i], inplace=True)
+        elif install['SN'] == '643152' and str(install['TRANSACTION_DATE']) == '2010-09-27 00:00:00':
+            installs.drop([i], inplace=True)
+    return installs
+
+
+class TestExclusionRules(unittest.TestCase):
+    def test_default_rules(self):
+        logger.info("Testing the default rules against the loop they replace.")
+        installs = pd.DataFrame({'SN': ['600001', '600002', '397549', '643151', '643151', '643152', '643153'],
+                                 'AC': ['N521VA', 'N521VA', 'N101VA', 'N101VA', 'N101VA', 'N102VA', 'N102VA'],
+                                 'TRANSACTION_DATE': pd.to_datetime(['2006-04-04', '2006-04-04 06:00', '2015-01-01',
+                                                                     '2010-09-27', '2010-09-28', '2010-09-27',
+                                                                     '2010-09-27']),
+                                 'POSITION': ['1', '2', '1', '1', '1', '2', '2']})
+        rules = ExclusionRules.load()
+
+        pd.testing.assert_frame_equal(rules.apply(installs, 'install'), legacy(installs.copy()))
+        self.assertFalse(rules.mask(installs, 'remove').any())
+        self.assertFalse(E.get_install_index().pairs['ESN'].eq('397549').any())
+
+    def test_custom_rules(self):
+        logger.info("Testing rules loaded from a file, in every engine run mode.")
+        path = os.path.join(tempfile.mkdtemp(), 'rules.json')
+        with open(path, 'w') as f:
+            json.dump({'rules': [{'name': 'repeated install', 'transactions': 'install', 'SN': repeated['SN'],
+                                  'TRANSACTION_DATE': str(repeated['TRANSACTION_DATE'] + pd.Timedelta(hours=6))},
+                                 {'name': 'ESN 600099', 'SN': '600099'},
+                                 {'name': '600003 on N103VA', 'SN': '600003', 'AC': 'N103VA', 'POSITION': 3},
+                                 {'name': 'ESN 397549', 'SN': '397549'}]}, f)
+        engine = Engine(start_date, end_date, session=Session(backend=backend, exclusions=path))
+
+        self.assertTrue(engine.get_anomalies().empty)
+        vectorized = engine.run(mode='vectorized')
+        for mode in ('loop', 'pushdown'):
+            df = engine.run(mode=mode)
+            pd.testing.assert_frame_equal(df.drop(columns='INSTALLED_AC').sort_index(kind='mergesort').astype(float),
+                                          vectorized.drop(columns='INSTALLED_AC').sort_index(kind='mergesort')
+                                          .astype(float))
+
+        self.assertRaises(ValueError, ExclusionRules, [{'name': 'no fields', 'transactions': 'install'}])
+        self.assertRaises(ValueError, ExclusionRules, [{'SN': '600001', 'ESN': '600001'}])
+        self.assertRaises(ValueError, ExclusionRules, [{'SN': '600001', 'transactions': 'installs'}])
+
+    def test_anomalies(self):
+        logger.info("Testing the anomaly detector.")
+        anomalies = E.get_anomalies()
+        found = anomalies.set_index('ANOMALY')
+
+        self.assertListEqual(sorted(anomalies['ANOMALY'].unique()),
+                             ['ESN on two aircraft', 'removal without install', 'repeated install'])
+        self.assertEqual(found.loc['repeated install', 'TRANSACTION_DATE'],
+                         repeated['TRANSACTION_DATE'] + pd.Timedelta(hours=6))
+        self.assertEqual(found.loc['removal without install', 'SN'], '600099')
+        # Installed on N103VA and never removed, so its next install is flagged too
+        self.assertListEqual(list(found.loc['ESN on two aircraft', 'AC']), ['N103VA', 'N101VA'])
+        self.assertTrue(found.loc['ESN on two aircraft', 'DETAIL'].iloc[0].startswith('600003 on N102VA'))
+        self.assertTrue(anomalies['NEW'].all())
+
+        index = E.get_install_index()
+        self.assertTrue(find_anomalies(index.installs.iloc[:0], index.removals.iloc[:0], index.pairs.iloc[:0]).empty)
+
+    def test_updated(self):
+        logger.info("Testing the anomalies follow updates of the install index.")
+        engine = Engine(start_date, end_date, session=Session(backend=backend))
+        index = engine.get_install_index()
+        before = engine.get_anomalies()
+
+        removal = index.removals.iloc[[-1]].assign(SN='999999', TRANSACTION_DATE=pd.Timestamp('2020-04-14'))
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            index.update(index.installs.iloc[:0], removal)
+            after = engine.get_anomalies()
+        self.assertEqual(len(after), len(before) + 1)
+        self.assertIn('999999', list(after['SN']))
+
+    def test_reported(self):
+        logger.info("Testing anomalies are only new once when the index is kept.")
+        directory = tempfile.mkdtemp()
+        first = Engine(start_date, end_date, session=Session(backend=backend, cache=FlightCache(directory)))
+        self.assertTrue(first.get_anomalies()['NEW'].all())
+
+        again = Engine(start_date, end_date, session=Session(backend=backend, cache=FlightCache(directory)))
+        self.assertEqual(len(again.get_anomalies()), len(first.get_anomalies()))
+        self.assertFalse(again.get_anomalies()['NEW'].any())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import logging
+import openpyxl
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.export import export, open_writer
+from reports.orchestrator import ReportOrchestrator
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+backend = SQLiteBackend().load(generate_fleet(n_tails=8, start_date='2016-01-01', end_date='2020-04-15',
+                                                 mean_time_on_wing=150))
+sheets = ReportOrchestrator('2020-03-01 00:00:00', '2020-03-31 23:59:59', session=Session(backend=backend)).run()
+logger = logging.getLogger("Export unit tests starting...")
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_xlsx_matches_to_excel(self):
+        logger.info("Testing the streamed workbook against DataFrame.to_excel.")
+        expected = os.path.join(self.directory, 'expected.xlsx')
+        with pd.ExcelWriter(expected) as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name)
+
+        file = os.path.join(self.directory, 'utilization.xlsx')
+        self.assertListEqual(export(sheets, file, chunksize=3), [file])
+
+        expected, workbook = openpyxl.load_workbook(expected), openpyxl.load_workbook(file)
+        self.assertListEqual(workbook.sheetnames, ['airframe', 'engines', 'removals'])
+        for sheet_name in workbook.sheetnames:
+            self.assertListEqual(list(workbook[sheet_name].iter_rows(values_only=True)),
+                                 list(expected[sheet_name].iter_rows(values_only=True)))
+
+    def test_csv_matches_to_csv(self):
+        logger.info("Testing the streamed CSV files against DataFrame.to_csv.")
+        files = export(sheets, os.path.join(self.directory, 'utilization.csv'), chunksize=3)
+        self.assertEqual(len(files), 3)
+        for file, (sheet_name, df) in zip(files, sheets.items()):
+            self.assertTrue(file.endswith('utilization_{}.csv'.format(sheet_name)))
+            with open(file) as f:
+                self.assertEqual(f.read(), df.to_csv())
+
+    def test_parquet(self):
+        logger.info("Testing the Parquet files.")
+        files = export(sheets, os.path.join(self.directory, 'utilization.parquet'), chunksize=3)
+        airframe = pd.read_parquet(files[0]).set_index('AC')
+        self.assertListEqual(list(airframe.columns), ['FLIGHT_HOURS 2020-03', 'FLIGHT_HOURS All',
+                                                      'FLIGHT_CYCLES 2020-03', 'FLIGHT_CYCLES All'])
+        self.assertListEqual(list(airframe.index), list(sheets['airframe'].index))
+        self.assertAlmostEqual(abs(airframe.values - sheets['airframe'].values).max(), 0, places=6)
+        removals = pd.read_parquet(files[2])
+        self.assertGreater(len(removals), 0)
+        self.assertListEqual(list(removals['TRANS_DATE']), list(sheets['removals']['TRANS_DATE']))
+
+    def test_unknown_format(self):
+        logger.info("Testing an unknown export format.")
+        with self.assertRaises(ValueError):
+            open_writer(os.path.join(self.directory, 'utilization.pdf'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import tempfile
+import unittest
+import logging
+from contextlib import redirect_stdout
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.cache import FlightCache
+from reports.fingerprint import ResultStore, sheet_fingerprints, table_fingerprints
+from reports.main import parse_args, run
+from reports.orchestrator import ReportOrchestrator
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+fleet = generate_fleet(n_tails=4, start_date='2016-01-01', end_date='2020-04-15', mean_time_on_wing=200)
+logger = logging.getLogger("Input fingerprint unit tests starting...")
+
+
+def orchestrate(backend, store):
+    orchestrator = ReportOrchestrator(start_date, end_date, session=Session(backend=backend), store=store)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return orchestrator, orchestrator.run()
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_cache(self):
+        logger.info("Testing the fingerprints of TRAX and of the cache agree.")
+        backend = SQLiteBackend().load(fleet)
+        cached = Session(backend=backend, cache=FlightCache(tempfile.mkdtemp()))
+        cached.cache.sync(cached)
+
+        fingerprints = sheet_fingerprints(Session(backend=backend), start_date, end_date)
+        self.assertListEqual(list(fingerprints), ['airframe', 'engines', 'removals'])
+        self.assertEqual(sheet_fingerprints(cached, start_date, end_date), fingerprints)
+        self.assertNotEqual(sheet_fingerprints(Session(backend=backend), start_date, end_date, engine_mode='loop'),
+                            fingerprints)
+        self.assertNotEqual(sheet_fingerprints(Session(backend=backend), '2020-02-01 00:00:00', '2020-02-29 23:59:59'),
+                            fingerprints)
+
+        # The months after the period are not read
+        for session in (Session(backend=backend), cached):
+            tables = table_fingerprints(session, end_date)
+            for dataset in ('flights', 'transactions'):
+                self.assertEqual(tables[dataset]['MONTH'].max(), '2020-03')
+
+    def test_reuse(self):
+        logger.info("Testing only the sheets whose inputs changed are computed again.")
+        backend = SQLiteBackend().load(fleet)
+        store = ResultStore(tempfile.mkdtemp())
+        orchestrator, first = orchestrate(backend, store)
+        self.assertListEqual(orchestrator.reused, [])
+
+        orchestrator, again = orchestrate(backend, ResultStore(store.directory))
+        self.assertListEqual(orchestrator.reused, ['airframe', 'engines', 'removals'])
+        self.assertTrue(os.path.exists(store.path('engines', ResultStore.key(start_date, end_date))))
+        for name in first:
+            pd.testing.assert_frame_equal(again[name], first[name])
+
+        # A flight after the period changes no sheet, a flight in it the airframe and engines sheets
+        flight = fleet['AC_ACTUAL_FLIGHTS'].iloc[[-1]].assign(FLIGHT_DATE=pd.Timestamp('2020-04-15'))
+        backend.load({'AC_ACTUAL_FLIGHTS': flight}, replace=False)
+        orchestrator, sheets = orchestrate(backend, store)
+        self.assertListEqual(orchestrator.reused, ['airframe', 'engines', 'removals'])
+        backend.load({'AC_ACTUAL_FLIGHTS': flight.assign(FLIGHT_DATE=pd.Timestamp('2020-03-15'))}, replace=False)
+        orchestrator, sheets = orchestrate(backend, store)
+        self.assertListEqual(orchestrator.reused, ['removals'])
+
+        # A removal record in the period changes the engines and removals sheets
+        removal = fleet['AC_PN_TRANSACTION_HISTORY'].iloc[[-1]].assign(TRANSACTION_DATE=pd.Timestamp('2020-03-20'),
+                                                                        TRANSACTION_TYPE='REMOVE')
+        backend.load({'AC_PN_TRANSACTION_HISTORY': removal}, replace=False)
+        orchestrator, sheets = orchestrate(backend, store)
+        self.assertListEqual(orchestrator.reused, ['airframe'])
+        self.assertEqual(len(sheets['removals']), len(first['removals']) + 1)
+
+        orchestrator = ReportOrchestrator(start_date, end_date, session=Session(backend=backend), store=store,
+                                          reuse=False)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            orchestrator.run()
+        self.assertListEqual(orchestrator.reused, [])
+
+    def test_identity(self):
+        logger.info("Testing records moved to another tail or ESN are computed again.")
+        backend = SQLiteBackend().load(fleet)
+        store = ResultStore(tempfile.mkdtemp())
+        orchestrate(backend, store)
+
+        # A March flight moved to another tail: same count, hours and cycles in the month
+        flights = fleet['AC_ACTUAL_FLIGHTS'].copy()
+        march = flights.index[(flights['FLIGHT_DATE'] >= '2020-03-01') & (flights['FLIGHT_DATE'] < '2020-04-01')]
+        tails = sorted(flights['AC'].unique())
+        flights.loc[march[0], 'AC'] = [t for t in tails if t != flights.loc[march[0], 'AC']][0]
+        backend.load({'AC_ACTUAL_FLIGHTS': flights})
+        orchestrator, sheets = orchestrate(backend, store)
+        self.assertListEqual(orchestrator.reused, ['removals'])
+        fresh = orchestrate(backend, None)[1]
+        for name in sheets:
+            pd.testing.assert_frame_equal(sheets[name], fresh[name])
+
+        # A misrecorded ESN corrected on an existing transaction
+        transactions = fleet['AC_PN_TRANSACTION_HISTORY'].copy()
+        last = transactions.index[transactions['TRANSACTION_DATE'] < '2020-04-01'][-1]
+        transactions.loc[last, 'SN'] = [sn for sn in transactions['SN'] if sn != transactions.loc[last, 'SN']][0]
+        backend.load({'AC_PN_TRANSACTION_HISTORY': transactions})
+        orchestrator, sheets = orchestrate(backend, store)
+        self.assertNotIn('engines', orchestrator.reused)
+        pd.testing.assert_frame_equal(sheets['engines'], orchestrate(backend, None)[1]['engines'])
+
+    def test_export(self):
+        logger.info("Testing an unchanged workbook is not written again.")
+        directory = tempfile.mkdtemp()
+        database = os.path.join(directory, 'trax.db')
+        SQLiteBackend(database).load(fleet).close()
+        argv = ['--month', '2020-03', '--backend', 'sqlite', '--database', database, '--cache-dir',
+                os.path.join(directory, 'cache'), '--output', directory, '--format', 'csv']
+
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            files, drift = run(parse_args(argv))
+            self.assertEqual(len(files), 3)
+            self.assertTrue(os.path.exists(os.path.join(directory, 'cache', 'results', 'results.json')))
+            self.assertListEqual(run(parse_args(argv))[0], [])
+            self.assertListEqual(run(parse_args(argv + ['--format', 'parquet']))[0][-1:],
+                                 [os.path.join(directory, 'utilization_2020-03_removals.parquet')])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,128 @@
+import sys
+import tempfile
+import unittest
+import logging
+import pandas as pd
+from reports import schema
+from reports.airframe import Airframe
+from reports.backend import SQLiteBackend
+from reports.cache import FlightCache
+from reports.engine import Engine
+from reports.flightsource import FlightSource, CURRENT, ARCHIVE
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+fleet = generate_fleet(n_tails=4, start_date='2014-01-01', end_date='2020-04-15', archive_date='2016-01-01')
+tails = list(fleet['AC_MASTER']['AC'])
+
+# The last tail is retired, every flight of it archived
+retired = fleet['AC_ACTUAL_FLIGHTS']['AC'] == tails[-1]
+fleet['AC_ACTUAL_FLIGHTS_HD'] = pd.concat([fleet['AC_ACTUAL_FLIGHTS_HD'], fleet['AC_ACTUAL_FLIGHTS'].loc[retired]],
+                                          ignore_index=True)
+fleet['AC_ACTUAL_FLIGHTS'] = fleet['AC_ACTUAL_FLIGHTS'].loc[~retired].reset_index(drop=True)
+fleet['AC_MASTER'] = fleet['AC_MASTER'].iloc[:-1]
+# Archive rows still in the current table must not be counted twice
+copies = fleet['AC_ACTUAL_FLIGHTS'].loc[fleet['AC_ACTUAL_FLIGHTS']['FLIGHT_DATE'] < '2016-02-01']
+fleet['AC_ACTUAL_FLIGHTS_HD'] = pd.concat([fleet['AC_ACTUAL_FLIGHTS_HD'], copies], ignore_index=True)
+
+flights = pd.concat([fleet['AC_ACTUAL_FLIGHTS'], fleet['AC_ACTUAL_FLIGHTS_HD'].iloc[:-len(copies)]],
+                    ignore_index=True)
+flights['FLIGHT_DATETIME'] = flights['FLIGHT_DATE'] + pd.to_timedelta(flights['TO_HOUR'] * 60 + flights['TO_MINUTE'],
+                                                                      unit='m')
+session = Session(backend=SQLiteBackend().load(fleet))
+source = FlightSource(session)
+logger = logging.getLogger("Flight source unit tests starting...")
+
+
+class TestFlightSource(unittest.TestCase):
+    def test_routes(self):
+        logger.info("Testing the tail to table routing.")
+        routes = source.routes()
+        first = fleet['AC_ACTUAL_FLIGHTS'].groupby('AC')['FLIGHT_DATE'].min()
+
+        self.assertListEqual(list(routes.index), sorted(tails))
+        self.assertListEqual(list(routes['BOUNDARY'].dropna()), list(first))
+        self.assertTrue(pd.isnull(routes.loc[tails[-1], 'BOUNDARY']))
+
+        ac = tails[0]
+        self.assertListEqual([s[0] for s in source.segments([ac], '2015-06-01 00:00:00', '2016-06-30 23:59:59')],
+                             [CURRENT, ARCHIVE])
+        self.assertListEqual([s[0] for s in source.segments([ac], start_date, end_date)], [CURRENT])
+        archived = routes.loc[ac, 'HD_FIRST_DATE']
+        self.assertListEqual([s[0] for s in source.segments([ac], archived, archived + pd.Timedelta(days=30))],
+                             [ARCHIVE])
+        self.assertListEqual(source.segments([tails[-1]], start_date, end_date),
+                             [(ARCHIVE, [([tails[-1]], None)])])
+
+        # One query per table, the archive query reads the retired tail and the tails of each boundary
+        queries = source.queries(['AC'], tails, '2014-01-01 00:00:00', end_date)
+        self.assertListEqual([query.table for query in queries], [CURRENT, ARCHIVE])
+        self.assertEqual(queries[1].sql.count('FLIGHT_DATE < '), routes['BOUNDARY'][routes['HD_FIRST_DATE'].notnull()]
+                         .nunique())
+        self.assertIn(' OR ', queries[1].sql)
+
+    def test_straddling(self):
+        logger.info("Testing intervals straddling the archive date.")
+        start, end = '2015-06-01 12:00:00', '2016-06-30 23:59:59'
+        expected = flights.loc[flights['AC'].isin(tails[:2]) & (flights['FLIGHT_DATETIME'] >= start) &
+                               (flights['FLIGHT_DATETIME'] <= end)]
+        df = source.flights(tails[:2], start, end)
+
+        self.assertEqual(len(df), len(expected))
+        self.assertEqual(df['FLIGHT_CYCLES'].sum(), expected['CYCLES'].sum())
+        self.assertListEqual(list(df.loc[df['AC'] == tails[0], 'FLIGHT_DATETIME']),
+                             sorted(expected.loc[expected['AC'] == tails[0], 'FLIGHT_DATETIME']))
+
+        monthly = source.totals(['YYYY-MM'], tails[:1], start, end)
+        self.assertEqual(monthly['FLIGHT_CYCLES'].sum(), expected.loc[expected['AC'] == tails[0], 'CYCLES'].sum())
+        self.assertTrue(monthly['YYYY-MM'].is_unique)
+
+    def test_cache(self):
+        logger.info("Testing the routing on the cached tables.")
+        cache = FlightCache(tempfile.mkdtemp())
+        cached = Session(backend=session.backend, cache=cache)
+        airframe = Airframe(start_date, end_date, session=cached, archived=True)
+
+        pd.testing.assert_frame_equal(FlightSource(cached, cache).routes(), source.routes())
+        pd.testing.assert_frame_equal(schema.to_display(airframe.get_flights()),
+                                      schema.to_display(source.flights()), check_dtype=False)
+        pd.testing.assert_frame_equal(cache.fh_fc(tails, '2020-03-31 23:59:59'),
+                                      Airframe(start_date, end_date, session=session, archived=True)
+                                      .get_fh_fc(tails, '2020-03-31'),
+                                      check_dtype=False)
+
+    def test_airframe(self):
+        logger.info("Testing airframe totals over both tables.")
+        airframe = Airframe(start_date, end_date, session=session, archived=True)
+        totals = airframe.get_fh_fc(tails, asof='2020-03-31')
+
+        self.assertListEqual(airframe.tails, tails)
+        self.assertListEqual(list(totals['FLIGHT_CYCLES']),
+                             list(flights.loc[flights['FLIGHT_DATE'] <= '2020-03-31'].groupby('AC')['CYCLES'].sum()))
+        self.assertEqual(airframe.run()[('FLIGHT_CYCLES', 'All')][tails[-1]], totals['FLIGHT_CYCLES'][tails[-1]])
+
+        # By default the tails are AC_MASTER's and the retired tail, only in the archive table, is left out
+        airframe = Airframe(start_date, end_date, session=session)
+        self.assertListEqual(airframe.tails, tails[:-1])
+        self.assertRaises(LookupError, airframe.get_fh_fc, tails[-1])
+        df = airframe.run()
+        self.assertNotIn(tails[-1], df.index)
+        self.assertEqual(df[('FLIGHT_CYCLES', 'All')][tails[0]], totals['FLIGHT_CYCLES'][tails[0]])
+
+    def test_engine_modes(self):
+        logger.info("Testing the engine run modes route flights alike.")
+        engine = Engine(start_date, end_date, session=session)
+        vectorized = engine.run(mode='vectorized').drop(columns='INSTALLED_AC')
+        for mode in ('loop', 'pushdown'):
+            df = engine.run(mode=mode).drop(columns='INSTALLED_AC')
+            pd.testing.assert_frame_equal(df.sort_index(kind='mergesort').astype(float),
+                                          vectorized.sort_index(kind='mergesort').astype(float))
+        self.assertEqual(vectorized[('FLIGHT_CYCLES', 'All')]['All'],
+                         engine.get_tsi_csi_pairs()['CSI'].sum())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+import unittest
+import logging
+from contextlib import redirect_stdout, redirect_stderr
+import numpy as np
+import pandas as pd
+from reports.airframe import Airframe
+from reports.backend import SQLiteBackend
+from reports.engine import Engine
+from reports.forecast import UtilizationForecast
+from reports.main import parse_args, print_forecast
+from reports.session import Session
+from reports.synthetic import generate_fleet
+from reports.timeseries import UtilizationSeries
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+fleet = generate_fleet(n_tails=4, start_date='2016-01-01', end_date='2020-04-15')
+backend = SQLiteBackend().load(fleet)
+logger = logging.getLogger("Utilization forecast unit tests starting...")
+
+
+class TestForecast(unittest.TestCase):
+    def test_rates(self):
+        logger.info("Testing the rates are the hours and cycles flown over the window.")
+        airframe = Airframe(start_date, end_date, session=Session(backend=backend))
+        forecast = airframe.get_forecast(window=3)
+        self.assertIs(airframe.get_forecast(window=3), forecast)
+
+        daily = airframe.get_series().cumulative()
+        rates = forecast.get_rates()
+        flown = daily.loc['2020-03-31'] - daily.loc['2019-12-31']
+        np.testing.assert_allclose(rates['FH_PER_DAY'].values, flown['FLIGHT_HOURS'].values / 91)
+        np.testing.assert_allclose(rates['FC_PER_DAY'].values, flown['FLIGHT_CYCLES'].values / 91)
+        np.testing.assert_allclose(rates['FLIGHT_HOURS'].values, daily.loc['2020-03-31', 'FLIGHT_HOURS'].values)
+
+        # A tail that started flying in the window is averaged over its days in service only
+        flights = pd.DataFrame({'AC': ['N1', 'N1', 'N2'], 'FLIGHT_HOURS': [2., 2., 10.], 'FLIGHT_CYCLES': [1, 1, 4],
+                                'FLIGHT_DATETIME': pd.to_datetime(['2020-01-01', '2020-03-31', '2020-03-22'])})
+        rates = UtilizationForecast(UtilizationSeries(flights, end='2020-03-31'), window=12).get_rates()
+        np.testing.assert_allclose(rates['FH_PER_DAY'].values, [4 / 91, 1.])
+        self.assertRaises(ValueError, UtilizationForecast, UtilizationSeries(flights), window=0)
+
+    def test_crossing(self):
+        logger.info("Testing the threshold dates of every ESN at once.")
+        forecast = Engine(start_date, end_date, session=Session(backend=backend)).get_esn_forecast()
+        series = forecast.series.cumulative()
+        df = forecast.crossing('FC', 3000)
+        self.assertListEqual(list(df.index), list(forecast.keys))
+
+        ahead = df.loc[df['REMAINING'] > 0]
+        flying = ahead.loc[ahead['RATE'] > 0]
+        expected = pd.Timestamp('2020-03-31') + pd.to_timedelta(np.ceil((3000 - flying['TOTAL']) / flying['RATE']),
+                                                                unit='D')
+        self.assertListEqual(list(flying['DATE']), list(expected))
+        self.assertTrue(ahead.loc[ahead['RATE'] == 0, 'DATE'].isnull().all())
+        for esn, row in df.loc[df['REMAINING'] <= 0].iterrows():
+            # The first day the ESN had 3000 cycles
+            self.assertEqual(row['DATE'], (series['FLIGHT_CYCLES'][esn] >= 3000).idxmax())
+
+        # Thresholds per ESN and from now
+        limits = {forecast.keys[0]: 1e6}
+        self.assertEqual(forecast.crossing('FC', limits)['THRESHOLD'].notnull().sum(), 1)
+        relative = forecast.crossing('FH', 500, relative=True, keys=list(forecast.keys[:2]))
+        np.testing.assert_allclose(relative['REMAINING'].values, 500)
+        self.assertRaises(LookupError, forecast.crossing, 'FH', 500, keys='NOT AN ESN')
+        self.assertRaises(ValueError, forecast.crossing, 'Date', 500)
+
+    def test_projected(self):
+        logger.info("Testing the projected totals and the answers to the range prompt.")
+        forecast = Airframe(start_date, end_date, session=Session(backend=backend)).get_forecast()
+        rates = forecast.get_rates()
+        df = forecast.projected(['2020-03-31', '2020-04-30'])
+        np.testing.assert_allclose(df['FLIGHT_HOURS'].values[0], rates['FLIGHT_HOURS'].values)
+        np.testing.assert_allclose(df['FLIGHT_HOURS'].values[1],
+                                   rates['FLIGHT_HOURS'].values + 30 * rates['FH_PER_DAY'].values)
+
+        answer = forecast.answer('Date', '30, 60')
+        self.assertListEqual(list(answer.columns), ['RANGE', 'AC', 'DATE', 'FLIGHT_HOURS', 'FLIGHT_CYCLES'])
+        self.assertEqual(len(answer), 2 * len(forecast.keys))
+        np.testing.assert_allclose(answer['FLIGHT_HOURS'].values[:len(forecast.keys)], df['FLIGHT_HOURS'].values[1])
+        answer = forecast.answer('FH', [10, 100])
+        self.assertListEqual(list(answer['RANGE'].unique()), [10, 100])
+        self.assertTrue((answer['DATE'] > pd.Timestamp('2020-03-31')).all())
+
+    def test_main(self):
+        logger.info("Testing the forecast from the command line.")
+        database = os.path.join(tempfile.mkdtemp(), 'trax.db')
+        SQLiteBackend(database).load(fleet).close()
+        args = parse_args(['--forecast', 'FC', '100', '--asof', '2020-03-31', '--window', '6', '--backend', 'sqlite',
+                           '--database', database, '--no-cache'])
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            tails, esns = print_forecast(args)
+        self.assertEqual(len(tails), 4)
+        self.assertTrue(esns['ESN'].is_unique)
+        with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+            self.assertRaises(SystemExit, parse_args, ['--forecast', 'FH'])
+            self.assertRaises(SystemExit, parse_args, ['--forecast', 'Miles', '10'])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,92 @@
+import sys
+import tempfile
+import unittest
+import logging
+from unittest import mock
+import numpy as np
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.cache import FlightCache
+from reports.engine import Engine
+from reports.installindex import InstallIndex
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+fleet = generate_fleet(n_tails=5, start_date='2014-01-01', end_date='2020-04-15', archive_date='2016-01-01',
+                       mean_time_on_wing=300)
+backend = SQLiteBackend().load(fleet)
+E = Engine(start_date, end_date, session=Session(backend=backend))
+logger = logging.getLogger("Install index unit tests starting...")
+
+
+def brute_force(pairs, ac, position, timestamp):
+    on = pairs.loc[(pairs['AC'] == ac) & (pairs['POSITION'] == position) & (pairs['INSTALL_DATE'] <= timestamp) &
+                   (pairs['REMOVAL_DATE'].isnull() | (pairs['REMOVAL_DATE'] >= timestamp))]
+    return on.sort_values('INSTALL_DATE')['ESN'].iloc[-1] if len(on) else None
+
+
+class TestInstallIndex(unittest.TestCase):
+    def test_lookups(self):
+        logger.info("Testing installed ESN and ESN location lookups against the pairs.")
+        index = E.get_install_index()
+        pairs = index.pairs
+        times = pd.date_range('2013-06-01', '2020-04-15', freq='17D') + pd.Timedelta(hours=7)
+
+        for ac in pairs['AC'].unique()[:2]:
+            for position in ('1', '2'):
+                esns = index.batch_installed(ac, position, times)
+                self.assertListEqual(list(esns), [brute_force(pairs, ac, position, t) for t in times])
+                self.assertEqual(index.installed(ac, int(position), times[-1]), esns[-1])
+
+        esn = pairs['ESN'].iloc[0]
+        located = index.batch_locate(esn, times)
+        for row in located.itertuples():
+            if row.AC is not None:
+                self.assertEqual(index.installed(row.AC, row.POSITION, row.TIMESTAMP), esn)
+        first = pairs.loc[pairs['ESN'] == esn].iloc[0]
+        self.assertEqual(index.locate(esn, first['INSTALL_DATE']), (first['AC'], first['POSITION']))
+        self.assertEqual(index.locate(esn, '2000-01-01'), (None, None))
+        self.assertIsNone(index.installed('N999XX', '1', '2020-01-01'))
+
+    def test_update(self):
+        logger.info("Testing incremental updates against a full build.")
+        installs, removals = E._get_installs(), E._get_transactions('REMOVE')
+        full = InstallIndex(installs, removals)
+
+        cutoff = pd.Timestamp('2018-06-01')
+        index = InstallIndex(installs.loc[installs['TRANSACTION_DATE'] < cutoff],
+                             removals.loc[removals['TRANSACTION_DATE'] < cutoff])
+        before = index.batch_installed(full.pairs['AC'], full.pairs['POSITION'], '2018-09-01')
+        added = index.update(installs.loc[installs['TRANSACTION_DATE'] >= cutoff - pd.Timedelta(days=1)],
+                             removals.loc[removals['TRANSACTION_DATE'] >= cutoff - pd.Timedelta(days=1)])
+
+        self.assertEqual(added, (installs['TRANSACTION_DATE'] >= cutoff).sum() +
+                         (removals['TRANSACTION_DATE'] >= cutoff).sum())
+        pd.testing.assert_frame_equal(index.pairs, full.pairs)
+        self.assertFalse(np.array_equal(before, full.batch_installed(full.pairs['AC'], full.pairs['POSITION'],
+                                                                     '2018-09-01')))
+        self.assertEqual(index.update(installs, removals), 0)
+
+    def test_persistence(self):
+        logger.info("Testing the index kept between runs.")
+        directory = tempfile.mkdtemp()
+        cache = FlightCache(directory)
+        first = Engine(start_date, end_date, session=Session(backend=backend, cache=cache)).get_install_index(directory)
+        # The saved pairs are read back, not paired again
+        with mock.patch('reports.installindex.pair_transactions') as pair:
+            loaded = InstallIndex.load(directory)
+        self.assertFalse(pair.called)
+        self.assertEqual(loaded.meta['pairs'], len(first.pairs))
+        pd.testing.assert_frame_equal(loaded.pairs, first.pairs)
+
+        engine = Engine(start_date, end_date, session=Session(backend=backend, cache=FlightCache(directory)))
+        pd.testing.assert_frame_equal(engine.get_install_index().pairs, E.get_install_index().pairs)
+        pd.testing.assert_frame_equal(engine._get_install_removal_pairs(), E._get_install_removal_pairs())
+        self.assertIsNone(InstallIndex.load(tempfile.mkdtemp()))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+import logging
+from contextlib import redirect_stdout, redirect_stderr
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.main import main, parse_args, output_path
+from reports.synthetic import generate_fleet
+
+directory = tempfile.mkdtemp()
+database = os.path.join(directory, 'trax.db')
+SQLiteBackend(database).load(generate_fleet(n_tails=6, start_date='2018-01-01', end_date='2020-03-31')).close()
+logger = logging.getLogger("Command line unit tests starting...")
+
+
+def run(*argv):
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        return main(list(argv))
+
+
+class TestMain(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(directory)
+
+    def test_lazy_imports(self):
+        logger.info("Testing that parsing the arguments does not import the heavy modules.")
+        code = "import sys, reports.main; reports.main.parse_args(['--month', '2020-03']); " \
+               "print(sorted({'pandas', 'pyodbc', 'tkinter', 'tqdm'} & set(sys.modules)))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run([sys.executable, '-c', code], cwd=root, stdout=subprocess.PIPE, check=True)
+        self.assertEqual(out.stdout.decode().strip(), '[]')
+
+    def test_arguments(self):
+        logger.info("Testing argument checks and output names.")
+        with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+            for argv in (['--start', '2020-03-01'], ['--backend', 'sqlite'], ['--offline', '--no-cache'],
+                         ['--month', '2020-01', '2020-02', '2020-03'], ['--month', '2020-03', '--gui']):
+                with self.assertRaises(SystemExit):
+                    parse_args(argv)
+
+        self.assertEqual(output_path(None, None, 'utilization_2020-03'), ('utilization_2020-03.xlsx', 'xlsx'))
+        self.assertEqual(output_path('out.csv', None, 'utilization_2020-03'), ('out.csv', 'csv'))
+        self.assertEqual(output_path(directory, 'parquet', 'utilization_2020-03'),
+                         (os.path.join(directory, 'utilization_2020-03.parquet'), 'parquet'))
+
+    def test_month(self):
+        logger.info("Testing a headless monthly run with the cache.")
+        file = os.path.join(directory, 'march.xlsx')
+        cache = os.path.join(directory, 'cache')
+        run('--month', '2020-03', '--backend', 'sqlite', '--database', database, '--cache-dir', cache, '--output', file)
+        self.assertListEqual(pd.ExcelFile(file).sheet_names, ['airframe', 'engines', 'removals'])
+        self.assertTrue(os.path.exists(os.path.join(cache, 'watermarks.json')))
+
+    def test_backfill(self):
+        logger.info("Testing a headless backfill to CSV.")
+        out = os.path.join(directory, 'backfill')
+        run('--month', '2020-02', '2020-03', '--backend', 'sqlite', '--database', database, '--no-cache',
+            '--format', 'csv', '--output', out)
+        self.assertListEqual(sorted(os.listdir(out)),
+                             ['utilization_{}_{}.csv'.format(p, s) for p in ('2020-02', '2020-03')
+                              for s in ('airframe', 'engines', 'removals')])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import logging
+from contextlib import redirect_stdout, redirect_stderr
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.batch import BatchReport
+from reports.main import main
+from reports.monthclose import MonthClose, SnapshotStore, totals_of
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+directory = tempfile.mkdtemp()
+database = os.path.join(directory, 'trax.db')
+SQLiteBackend(database).load(generate_fleet(n_tails=6, start_date='2014-01-01', end_date='2020-04-15',
+                                            archive_date='2016-01-01', mean_time_on_wing=300)).close()
+session = Session(backend=SQLiteBackend(database))
+logger = logging.getLogger("Month close unit tests starting...")
+
+
+def sheet_values(df):
+    df = df.drop(columns='INSTALLED_AC', errors='ignore')
+    return df.loc[~df.index.duplicated()].sort_index()
+
+
+class TestMonthClose(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        session.close()
+        shutil.rmtree(directory)
+
+    def test_incremental(self):
+        logger.info("Testing month closes chained from snapshots against the full history.")
+        store = SnapshotStore(os.path.join(directory, 'snapshots'))
+        for period in ('2020-01', '2020-02'):
+            MonthClose(period, session=session, store=store).run()
+        close = MonthClose('2020-03', session=session, store=store)
+        sheets = close.run()
+        full = BatchReport(['2020-03'], session=session).run()['2020-03']
+
+        self.assertEqual(store.meta['airframe']['2020-01']['source'], 'full')
+        self.assertEqual(dict(close.sources), {'airframe': 'incremental', 'engines': 'incremental'})
+        self.assertListEqual(store.periods('engines'), ['2020-01', '2020-02', '2020-03'])
+        for name in ('airframe', 'engines', 'removals'):
+            self.assertListEqual(list(sheets[name].columns), list(full[name].columns))
+            self.assertListEqual(list(sheets[name].dtypes), list(full[name].dtypes))
+        for name in ('airframe', 'engines'):
+            pd.testing.assert_frame_equal(sheet_values(sheets[name]), sheet_values(full[name]), check_exact=False)
+        self.assertListEqual(list(sheets['engines']['INSTALLED_AC'].fillna('')),
+                             list(full['engines']['INSTALLED_AC'].fillna('')))
+        self.assertTrue(close.verify().empty)
+
+        # A closed month that no longer matches the history is reported, and repaired on request
+        snapshot = store.load('engines', '2020-03')
+        snapshot.iloc[0] += 1
+        store.save('engines', '2020-03', snapshot, 'incremental')
+        drift = close.verify(repair=True)
+        self.assertListEqual(list(drift['KEY'].unique()), [snapshot.index[0]])
+        self.assertListEqual(list(drift['DRIFT']), [-1, -1])
+        self.assertTrue(close.verify().empty)
+        pd.testing.assert_frame_equal(store.load('engines', '2020-03'), totals_of(full['engines']),
+                                      check_dtype=False)
+
+    def test_command_line(self):
+        logger.info("Testing the month close from the command line.")
+        snapshots = os.path.join(directory, 'cli')
+        out = os.path.join(directory, 'out')
+        argv = ['--month', '2020-02', '2020-03', '--backend', 'sqlite', '--database', database, '--no-cache',
+                '--format', 'csv', '--output', out, '--snapshot-dir', snapshots, '--verify']
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+            self.assertEqual(main(argv), 0)
+        self.assertEqual(SnapshotStore(snapshots).meta['engines']['2020-03']['source'], 'incremental')
+        self.assertEqual(len(os.listdir(out)), 6)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
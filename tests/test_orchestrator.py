@@ -0,0 +1,164 @@
+import sys
+import time
+import unittest
+import logging
+import threading
+import pandas as pd
+from reports.airframe import Airframe
+from reports.engine import Engine
+from reports.backend import SQLiteBackend
+from reports.orchestrator import ReportOrchestrator
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+backend = SQLiteBackend().load(generate_fleet(n_tails=8, start_date='2016-01-01', end_date='2020-04-15'))
+logger = logging.getLogger("Orchestrator unit tests starting...")
+
+
+class SlowCursor(object):
+    """
+    Cursor like pyodbc's: the statement runs until cancel() is called from another thread.
+    """
+    def __init__(self, started):
+        self.started = started
+        self.cancelled = threading.Event()
+
+    def execute(self, query, params=None):
+        self.started.set()
+        if not self.cancelled.wait(30):
+            raise AssertionError("Statement not cancelled.")
+        raise RuntimeError("Operation canceled")
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def close(self):
+        pass
+
+
+class SlowConnection(object):
+    def __init__(self, started):
+        self.started = started
+
+    def cursor(self):
+        return SlowCursor(self.started)
+
+    def close(self):
+        pass
+
+
+class TestReportOrchestrator(unittest.TestCase):
+    def test_concurrent_matches_sequential(self):
+        logger.info("Testing concurrent report stages against sequential runs.")
+        sheets = ReportOrchestrator(start_date, end_date, session=Session(backend=backend)).run()
+        session = Session(backend=backend)
+
+        self.assertListEqual(list(sheets), ['airframe', 'engines', 'removals'])
+        pd.testing.assert_frame_equal(sheets['airframe'], Airframe(start_date, end_date, session=session).run())
+        pd.testing.assert_frame_equal(sheets['engines'], Engine(start_date, end_date, session=session).run())
+        pd.testing.assert_frame_equal(sheets['removals'], Engine(start_date, end_date, session=session).get_removals())
+
+    def test_connection_pool(self):
+        logger.info("Testing the stages borrow their connections from the session's pool.")
+        session = Session(backend=backend, pool_size=2)
+        orchestrator = ReportOrchestrator(start_date, end_date, session=session, workers=1)
+        orchestrator.run()
+        # One stage at a time, the first stage's connection is reused by the next ones
+        self.assertEqual(session._pool.qsize(), 1)
+        pooled = session._pool.queue[0]
+
+        fork = session.fork()
+        self.assertIs(fork.connection, pooled)
+        self.assertEqual(session._pool.qsize(), 0)
+        fork.close()
+        self.assertEqual(session._pool.qsize(), 1)
+        session.close()
+        self.assertEqual(session._pool.qsize(), 0)
+
+    def test_stage_failure(self):
+        logger.info("Testing that a failing stage cancels the run.")
+        orchestrator = ReportOrchestrator(start_date, end_date, session=Session(backend=backend), workers=1)
+        stages = orchestrator.stages()
+        stages['airframe'] = lambda session: session.read_sql("SELECT * FROM odb.NO_SUCH_TABLE")
+        orchestrator.stages = lambda: stages
+
+        with self.assertRaises(RuntimeError):
+            orchestrator.run()
+        self.assertNotIn('removals', orchestrator.timings)
+
+    def test_cancel_running(self):
+        logger.info("Testing that a failing stage cancels the statement of a running stage.")
+        started = threading.Event()
+        orchestrator = ReportOrchestrator(start_date, end_date, session=Session(backend=backend), workers=2)
+        stages = orchestrator.stages()
+
+        def slow(session):
+            return session.read_sql("SELECT * FROM AC_ACTUAL_FLIGHTS", SlowConnection(started))
+
+        def failing(session):
+            started.wait(30)
+            raise ValueError("Stage failed.")
+
+        stages['airframe'], stages['engines'] = slow, failing
+        orchestrator.stages = lambda: stages
+
+        began = time.time()
+        with self.assertRaises(RuntimeError):
+            orchestrator.run()
+        self.assertLess(time.time() - began, 10)
+        self.assertNotIn('airframe', orchestrator.timings)
+
+    def test_memo(self):
+        logger.info("Testing concurrent forks compute a memoized value once.")
+        session = Session(backend=backend)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return len(calls)
+
+        forks = [session.fork() for _ in range(4)]
+        values = []
+        threads = [threading.Thread(target=lambda fork=fork: values.append(fork.memo('value', compute)))
+                   for fork in forks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(values, [1] * 4)
+        self.assertEqual(len(calls), 1)
+
+        # A failure is raised to the caller and computed again next time
+        with self.assertRaises(ZeroDivisionError):
+            session.memo('failing', lambda: 1 / 0)
+        self.assertEqual(session.memo('failing', lambda: 2), 2)
+
+    def test_slow_connect(self):
+        logger.info("Testing a session opening its connection does not block its forks.")
+        opened = threading.Event()
+
+        class SlowBackend(SQLiteBackend):
+            def connect(self):
+                opened.wait(30)
+                return super().connect()
+
+        opened.set()
+        slow = SlowBackend()
+        opened.clear()
+        session = Session(backend=slow)
+        thread = threading.Thread(target=lambda: session.connection)
+        thread.start()
+        began = time.time()
+        self.assertEqual(session.fork().memo('value', lambda: 1), 1)
+        self.assertLess(time.time() - began, 10)
+        opened.set()
+        thread.join()
+        session.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import logging
+from reports.airframe import Airframe
+from reports.backend import SQLiteBackend
+from reports.engine import Engine
+from reports.export import export
+from reports.profiler import Profiler, compare
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+backend = SQLiteBackend().load(generate_fleet(n_tails=4, start_date='2015-01-01', end_date='2020-03-31',
+                                              archive_date='2017-01-01'))
+logger = logging.getLogger("Profiler unit tests starting...")
+
+
+class TestProfiler(unittest.TestCase):
+    def test_stages(self):
+        logger.info("Testing query and stage timings of a run.")
+        profiler = Profiler()
+        session = Session(backend=backend, profiler=profiler)
+        airframe = Airframe(start_date, end_date, session=session).run()
+        engines = Engine(start_date, end_date, session=session).run()
+        export({'airframe': airframe, 'engines': engines}, os.path.join(tempfile.mkdtemp(), 'out.csv'),
+               profiler=profiler)
+        profiler.close()
+
+        summary = profiler.summary()
+        for name in ('airframe.run', 'airframe.totals', 'flights.routes', 'engine.run', 'engine.pairs',
+                     'engine.flights', 'engine.attribute', 'engine.totals', 'query AC_ACTUAL_FLIGHTS',
+                     'query AC_ACTUAL_FLIGHTS_HD', 'query AC_PN_TRANSACTION_HISTORY', 'export csv'):
+            self.assertIn(name, summary.index)
+        self.assertEqual(summary.loc['engine.run', 'rows'], len(engines))
+        self.assertEqual(summary.loc['export csv', 'calls'], 2)
+        self.assertGreater(summary.loc['engine.flights', 'MB'], 0)
+        self.assertGreater(summary.loc['engine.attribute', 'peak_MB'], 0)
+        self.assertGreaterEqual(summary.loc['engine.run', 'wall_s'], summary.loc['engine.attribute', 'wall_s'])
+
+        spans = {span.name: span for span in profiler.spans}
+        self.assertEqual(spans['engine.attribute'].parent, 'engine.run')
+        self.assertEqual(spans['query AC_ACTUAL_FLIGHTS_HD'].parent, 'engine.flights')
+        self.assertEqual(summary.loc['flights.routes', 'calls'], 1)
+
+        file = profiler.write_trace(os.path.join(tempfile.mkdtemp(), 'trace.json'))
+        with open(file) as f:
+            trace = json.load(f)
+        self.assertEqual(len(trace['spans']), len(profiler.spans))
+        ratio = compare(file, profiler.trace())['ratio']
+        self.assertAlmostEqual(ratio['engine.run'], 1.0)
+
+    def test_chunks(self):
+        logger.info("Testing timings of streamed reads and of an unprofiled session.")
+        profiler = Profiler(memory=False)
+        session = Session(backend=backend, profiler=profiler)
+        chunks = list(session.read_sql_chunks("SELECT * FROM odb.AC_ACTUAL_FLIGHTS", chunksize=1000))
+        summary = profiler.summary()
+        self.assertEqual(summary.loc['query AC_ACTUAL_FLIGHTS', 'calls'], len(chunks) + 1)
+        self.assertEqual(summary.loc['query AC_ACTUAL_FLIGHTS', 'rows'], sum(len(c) for c in chunks))
+
+        with Session(backend=backend).profile('unprofiled') as span:
+            self.assertIs(span.record(chunks[0]), chunks[0])
+            # Shared by every unprofiled stage, nothing is kept
+            span.rows = len(chunks[0])
+            self.assertIsNone(span.rows)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
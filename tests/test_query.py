@@ -0,0 +1,79 @@
+import sys
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+from reports.backend import SQLiteBackend
+from reports.query import Query, FLIGHT_DATETIME, IN_LIMIT, TO_DATE
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+session = Session(backend=SQLiteBackend().load(generate_fleet(n_tails=4, start_date='2019-01-01',
+                                                              end_date='2020-03-31')))
+flights = session.read_sql("SELECT AC, {} AS FLIGHT_DATETIME FROM odb.AC_ACTUAL_FLIGHTS".format(FLIGHT_DATETIME))
+logger = logging.getLogger("Query builder unit tests starting...")
+
+
+def legacy(start, end, upper='<='):
+    # The predicate the reports used before the query builder
+    query = "SELECT COUNT(*) AS N FROM odb.AC_ACTUAL_FLIGHTS WHERE AC = 'N101VA' " \
+            "AND ( {0} >= to_date('{1}', 'YYYY-MM-DD HH24:MI:SS') ) " \
+            "AND ( {0} {3} to_date('{2}', 'YYYY-MM-DD HH24:MI:SS') )".format(FLIGHT_DATETIME, start, end, upper)
+    return int(session.read_sql(query)['N'][0])
+
+
+def boundaries():
+    # Interval ends on exact takeoff times, one second either side of them and on midnight
+    rng = np.random.RandomState(0)
+    times = pd.to_datetime(flights.loc[flights['AC'] == 'N101VA', 'FLIGHT_DATETIME']).sample(20, random_state=0)
+    for t in times:
+        for start in (t, t - pd.Timedelta(seconds=1), t.normalize()):
+            end = start + pd.Timedelta(days=int(rng.randint(0, 40)), minutes=int(rng.randint(0, 1440)))
+            for end in (end, t + pd.Timedelta(days=2), t.normalize() + pd.Timedelta(days=1)):
+                yield str(start), str(end)
+
+
+class TestQuery(unittest.TestCase):
+    def test_flights_between(self):
+        logger.info("Testing the sargable range predicate against the takeoff time filter.")
+        for include_end, upper in ((True, '<='), (False, '<')):
+            for start, end in boundaries():
+                query = Query('AC_ACTUAL_FLIGHTS', ['COUNT(*) AS N']).flights_between(start, end, include_end) \
+                    .where('AC = ?', 'N101VA')
+                self.assertEqual(int(session.read_sql(query.sql, params=query.params)['N'][0]),
+                                 legacy(start, end, upper), (start, end, include_end))
+
+    def test_flights_until(self):
+        logger.info("Testing the sargable upper bound against the takeoff time filter.")
+        for start, end in boundaries():
+            query = Query('AC_ACTUAL_FLIGHTS', ['COUNT(*) AS N']).flights_until(end).where('AC = ?', 'N101VA')
+            self.assertEqual(int(session.read_sql(query.sql, params=query.params)['N'][0]),
+                             legacy('1970-01-01 00:00:00', end))
+
+    def test_statement_text(self):
+        logger.info("Testing that the statement text does not depend on the parameters.")
+        one = Query('AC_ACTUAL_FLIGHTS', ['AC']).flights_between('2020-01-01 00:00:00', '2020-01-31 23:59:59')
+        two = Query('AC_ACTUAL_FLIGHTS', ['AC']).flights_between(pd.Timestamp('2019-05-02 06:30'), '2019-06-01')
+        self.assertEqual(one.sql, two.sql)
+        self.assertEqual(one.sql.count('?'), len(one.params))
+        self.assertListEqual(two.params[:2], ['2019-05-02 06:30:00', '2019-06-01'])
+
+        plan = session.read_sql("EXPLAIN QUERY PLAN " + one.sql, params=one.params)
+        self.assertTrue(plan['detail'].str.contains('INDEX').any())
+        self.assertIn("FLIGHT_DATE <= " + TO_DATE, one.sql)
+
+    def test_where_in(self):
+        logger.info("Testing that long IN lists are split under the Oracle limit.")
+        tails = ['N{}XX'.format(n) for n in range(2 * IN_LIMIT + 1)] + ['N101VA']
+        query = Query('AC_ACTUAL_FLIGHTS', ['COUNT(*) AS N']).where_in('AC', tails)
+
+        self.assertEqual(query.sql.count(' IN ('), 3)
+        self.assertEqual(query.sql.count('?'), len(tails))
+        self.assertEqual(int(session.read_sql(query.sql, params=query.params)['N'][0]),
+                         int((flights['AC'] == 'N101VA').sum()))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
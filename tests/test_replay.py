@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+import logging
+import pandas as pd
+from reports.airframe import Airframe
+from reports.backend import SQLiteBackend
+from reports.engine import Engine
+from reports.replay import ReplayBackend, ReplayConnection, RECORD
+from reports.session import Session
+from reports.synthetic import generate_fleet
+from replay_fixtures import fixture_backend
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+backend = SQLiteBackend().load(generate_fleet(n_tails=4, start_date='2016-01-01', end_date='2020-04-15',
+                                              archive_date='2017-01-01'))
+logger = logging.getLogger("Record/replay unit tests starting...")
+
+
+class TestReplay(unittest.TestCase):
+    def test_replay(self):
+        logger.info("Testing reports replayed from recorded fixtures.")
+        directory = tempfile.mkdtemp()
+        recorded = Session(backend=ReplayBackend(directory, record=backend))
+        airframe = Airframe(start_date, end_date, session=recorded).run()
+        engines = Engine(start_date, end_date, session=recorded).run(mode='pushdown')
+        query = "SELECT odb.AC_MASTER.AC FROM odb.AC_MASTER"
+        tails = recorded.read_sql(query, index_col='AC')
+
+        replay = ReplayBackend(directory)
+        session = Session(backend=replay)
+        self.assertIsInstance(session.connection, ReplayConnection)
+        pd.testing.assert_frame_equal(Airframe(start_date, end_date, session=session).run(), airframe)
+        pd.testing.assert_frame_equal(Engine(start_date, end_date, session=session).run(mode='pushdown'), engines)
+        self.assertEqual(len(replay.index), len(os.listdir(directory)) - 1)
+
+        # Matched whitespace aside, but not without its index_col
+        self.assertRaises(LookupError, session.read_sql, query)
+        pd.testing.assert_frame_equal(session.read_sql(query.replace(' FROM', '\n  FROM'), index_col='AC'), tails)
+
+    def test_chunks(self):
+        logger.info("Testing chunked reads of a recording.")
+        directory = tempfile.mkdtemp()
+        query = "SELECT AC, FLIGHT_DATE FROM odb.AC_ACTUAL_FLIGHTS WHERE AC = ?"
+        recorded = Session(backend=ReplayBackend(directory, record=backend))
+        df = pd.concat(recorded.read_sql_chunks(query, chunksize=100, params=['N101VA']))
+
+        chunks = list(Session(backend=ReplayBackend(directory)).read_sql_chunks(query, chunksize=100,
+                                                                               params=['N101VA']))
+        self.assertEqual(len(chunks), -(-len(df) // 100))
+        pd.testing.assert_frame_equal(pd.concat(chunks).reset_index(drop=True), df.reset_index(drop=True))
+
+    def test_fixture_backend(self):
+        logger.info("Testing the fixture backend of the tests.")
+        os.environ.pop(RECORD, None)
+        self.assertIsNone(fixture_backend(tempfile.mkdtemp()).record)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
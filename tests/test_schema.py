@@ -0,0 +1,71 @@
+import sys
+import tempfile
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+from reports import schema
+from reports.airframe import Airframe
+from reports.backend import SQLiteBackend
+from reports.cache import FlightCache
+from reports.engine import Engine
+from reports.session import Session
+from reports.synthetic import generate_fleet
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+backend = SQLiteBackend().load(generate_fleet(n_tails=6, start_date='2015-01-01', end_date='2020-04-15',
+                                              archive_date='2017-01-01'))
+session = Session(backend=backend, cache=FlightCache(tempfile.mkdtemp()))
+logger = logging.getLogger("Typed schema unit tests starting...")
+
+
+class TestSchema(unittest.TestCase):
+    def test_compact(self):
+        logger.info("Testing compact flight records.")
+        flights = Airframe(start_date, end_date, session=session).get_flights()
+        plain = schema.to_display(flights)
+
+        self.assertTrue(pd.api.types.is_categorical_dtype(flights['AC']))
+        self.assertTrue(pd.api.types.is_categorical_dtype(flights['YYYY-MM']))
+        self.assertEqual(flights['FLIGHT_CYCLES'].dtype, np.int8)
+        self.assertEqual(plain['AC'].dtype, object)
+        self.assertEqual(plain['FLIGHT_CYCLES'].dtype, np.int64)
+        self.assertLess(flights.memory_usage(deep=True).sum(), plain.memory_usage(deep=True).sum() / 3)
+
+        # Same records as the database, and same months as formatting every date
+        db = Airframe(start_date, end_date, session=Session(backend=backend)).get_flights()
+        pd.testing.assert_frame_equal(schema.to_display(db), plain, check_dtype=False)
+        self.assertListEqual(list(schema.month_category(flights['FLIGHT_DATETIME']).astype(str)),
+                             list(flights['FLIGHT_DATETIME'].dt.strftime('%Y-%m')))
+
+    def test_concat(self):
+        logger.info("Testing concatenation of frames with different categories.")
+        a = schema.compact(pd.DataFrame({'AC': ['N101VA', 'N102VA'], 'FLIGHT_CYCLES': [1, 1]}))
+        b = schema.compact(pd.DataFrame({'AC': ['N103VA'], 'FLIGHT_CYCLES': [2]}))
+        empty = pd.DataFrame({'AC': [], 'FLIGHT_CYCLES': []})
+
+        df = schema.concat([a, b, empty], ignore_index=True)
+        self.assertTrue(pd.api.types.is_categorical_dtype(df['AC']))
+        self.assertListEqual(list(df['AC']), ['N101VA', 'N102VA', 'N103VA'])
+        self.assertTrue(pd.api.types.is_integer_dtype(df['FLIGHT_CYCLES']))
+
+    def test_reports(self):
+        logger.info("Testing reports built on typed records against the database.")
+        cached = Session(backend=backend, cache=session.cache)
+        db = Session(backend=backend)
+        pd.testing.assert_frame_equal(Airframe(start_date, end_date, session=cached).run(),
+                                      Airframe(start_date, end_date, session=db).run())
+
+        typed = Engine(start_date, end_date, session=cached).run()
+        legacy = Engine(start_date, end_date, session=db).run(mode='loop')
+        self.assertListEqual(list(typed.columns), list(legacy.columns))
+        self.assertEqual(typed[('FLIGHT_CYCLES', 'All')].dtype, np.int64)
+        self.assertEqual(typed['INSTALLED_AC'].dtype, object)
+        pd.testing.assert_frame_equal(typed.drop(columns='INSTALLED_AC').astype(float).sort_index(),
+                                      legacy.drop(columns='INSTALLED_AC').astype(float).sort_index())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()
@@ -0,0 +1,85 @@
+import sys
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+from reports.airframe import Airframe
+from reports.backend import SQLiteBackend
+from reports.engine import Engine
+from reports.session import Session
+from reports.synthetic import generate_fleet
+from reports.timeseries import UtilizationSeries
+
+start_date, end_date = '2020-03-01 00:00:00', '2020-03-31 23:59:59'
+session = Session(backend=SQLiteBackend().load(generate_fleet(n_tails=5, start_date='2015-01-01',
+                                                              end_date='2020-04-15', archive_date='2017-01-01',
+                                                              mean_time_on_wing=400)))
+A = Airframe(start_date, end_date, session=session)
+E = Engine(start_date, end_date, session=session)
+logger = logging.getLogger("Utilization time-series unit tests starting...")
+
+
+class TestUtilizationSeries(unittest.TestCase):
+    def test_daily(self):
+        logger.info("Testing daily cumulative series of the tails.")
+        series = A.get_series()
+        tails = list(series.keys)
+
+        self.assertIs(A.get_series(), series)
+        self.assertEqual(series.daily.index[-1], pd.Timestamp('2020-03-31'))
+        self.assertEqual(len(series.daily), (series.dates[-1] - series.dates[0]).days + 1)
+        for asof in ('2017-06-30', '2020-03-31'):
+            totals = A.get_fh_fc(tails, asof=asof)
+            day = series.cumulative().loc[asof]
+            self.assertListEqual(list(day['FLIGHT_CYCLES']), list(totals['FLIGHT_CYCLES']))
+            self.assertAlmostEqual(abs(day['FLIGHT_HOURS'] - totals['FLIGHT_HOURS']).max(), 0, places=6)
+        self.assertTrue((series.daily.diff().dropna() >= 0).all().all())
+
+    def test_rollups(self):
+        logger.info("Testing weekly, quarterly and yearly rollups of the daily series.")
+        series = A.get_series()
+        ac = series.keys[0]
+        daily = series.cumulative(keys=[ac])
+
+        quarterly = series.cumulative('quarterly', ac)
+        self.assertListEqual(list(quarterly.index[-2:]), [pd.Timestamp('2019-12-31'), pd.Timestamp('2020-03-31')])
+        np.testing.assert_array_equal(quarterly.iloc[:-1].values, daily.loc[quarterly.index[:-1]].values)
+        for freq in ('weekly', 'yearly', 'M'):
+            flown = series.utilization(freq, ac)
+            self.assertEqual(flown[('FLIGHT_CYCLES', ac)].sum(), daily[('FLIGHT_CYCLES', ac)].iloc[-1])
+            self.assertAlmostEqual(flown[('FLIGHT_HOURS', ac)].sum(), daily[('FLIGHT_HOURS', ac)].iloc[-1], places=6)
+
+        month = A.get_fh_fc_by_month()
+        month = month.loc[(month['AC'] == ac) & (month['YYYY-MM'] == '2020-02')]
+        self.assertEqual(series.utilization('monthly', ac).loc['2020-02-29', ('FLIGHT_CYCLES', ac)],
+                         month['FLIGHT_CYCLES'].iloc[0])
+
+        long = series.to_long('yearly', ac)
+        self.assertListEqual(list(long.columns), ['DATE', 'AC', 'FLIGHT_HOURS', 'FLIGHT_CYCLES'])
+        self.assertRaises(LookupError, series.cumulative, 'daily', ['N999XX'])
+
+    def test_esn(self):
+        logger.info("Testing daily cumulative series of the ESNs.")
+        series = E.get_esn_series()
+        flights = E.get_esn_flights()
+        flights = flights.loc[flights['FLIGHT_DATETIME'] <= pd.Timestamp(end_date)]
+        totals = flights.groupby('ESN', observed=True)[['FLIGHT_HOURS', 'FLIGHT_CYCLES']].sum()
+
+        last = series.daily.iloc[-1]
+        self.assertListEqual(list(last['FLIGHT_CYCLES'].reindex(totals.index.astype(str))),
+                             list(totals['FLIGHT_CYCLES']))
+        self.assertAlmostEqual(np.abs(last['FLIGHT_HOURS'].reindex(totals.index.astype(str)).values -
+                                      totals['FLIGHT_HOURS'].values).max(), 0, places=6)
+
+    def test_empty(self):
+        logger.info("Testing a series without flights.")
+        series = UtilizationSeries(pd.DataFrame({'AC': [], 'FLIGHT_DATETIME': [], 'FLIGHT_HOURS': [],
+                                                 'FLIGHT_CYCLES': []}))
+        self.assertEqual(series.daily.shape, (0, 0))
+        self.assertTrue(series.cumulative('yearly').empty)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stderr)
+    logging.getLogger().setLevel(logging.INFO)
+    unittest.main()